@@ -1,10 +1,12 @@
 import streamlit as st
 import pandas as pd
 import datetime
+import time
+import zlib
 from pathlib import Path
 from typing import List
 
-from utils import TEMPLATES, get_template, validate_notas, nota_final, niveles_texto, ejemplo_por_nota
+from utils import TEMPLATES, get_template, validate_notas, nota_final, nota_final_batch, niveles_texto, ejemplo_por_nota
 
 
 # Map de títulos completos para cada criterio (mostrar al usuario)
@@ -18,28 +20,101 @@ CRITERIA_TITLES = {
 }
 
 from db import (
-    init_db,
+    ensure_db,
     insert_evaluacion,
+    insert_evaluaciones_bulk,
     list_resumen,
+    list_resumen_page,
     list_detalle,
+    list_detalle_page,
     export_csv,
     backup_csv_timestamp,
     seed_demo,
+    stats_por_grupo,
+    data_version,
     DBError,
 )
+from backup import backup_sqlite
+from roster import get_roster_provider
+from csv_buffer import CsvBuffer
+from journal import JournalError, get_journal
+import perfil
+import metricas
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 
 # Configuración de la página
 st.set_page_config(page_title="Gestor de Evaluaciones", page_icon=":memo:", layout="wide")
 
 
-# Inicializar DB
-init_db()
+# Perfilado opcional (casilla en "Depuración" de la barra lateral o CALIFICA_PROFILE=1):
+# cada `crono.seccion(...)` cierra la sección anterior y abre la siguiente
+def _perfil_activo() -> bool:
+    return bool(st.session_state.get("perfilado", False)) or perfil.forzado()
+
+
+inicio_rerun = time.perf_counter()
+crono = perfil.Cronometro(_perfil_activo())
+crono.seccion("init_db")
+
+
+# Inicializar DB: migraciones, pool y PRAGMA optimize sólo la primera vez en el
+# proceso; en los reruns es un `stat` del fichero
+arranque_db = ensure_db()
+if arranque_db["duplicadas_archivadas"]:
+    st.warning(
+        f"Se archivaron {arranque_db['duplicadas_archivadas']} evaluaciones repetidas (misma clave natural) "
+        "en la tabla `evaluaciones_duplicadas`; se conservó la más reciente de cada una."
+    )
+
+
+# Métricas locales en formato Prometheus (CALIFICA_METRICS_PORT / CALIFICA_METRICS_FILE):
+# los exportadores arrancan una vez por proceso; sin ellos, `metricas.activas()` es False
+metricas.iniciar_desde_entorno()
+M_RERUN = metricas.histograma(
+    "califica_app_rerun_seconds", "Duración de los reruns completos de app.py",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+M_GUARDADAS = metricas.contador(
+    "califica_evaluaciones_guardadas", "Evaluaciones guardadas desde la app", ["modo", "destino"]
+)
+metricas.medidor(
+    "califica_app_sessions_active", "Sesiones con algún rerun en los últimos 5 minutos",
+    funcion=metricas.sesiones_activas,
+)
+if metricas.activas():
+    _ctx = get_script_run_ctx()
+    if _ctx is not None:
+        metricas.sesion_vista(_ctx.session_id)
+
+
+def _contar_guardadas(n: int, modo: str) -> None:
+    if n and metricas.activas():
+        M_GUARDADAS.inc(n, modo=modo, destino="sqlite" if modo_almacenamiento == "SQLite" else "csv")
+
+
+# Lecturas cacheadas: la clave incluye `data_version()`, que cambia con cada
+# escritura (de esta app o de otro proceso), así que los reruns provocados por
+# widgets que no escriben no vuelven a consultar SQLite.
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_resumen_page(version, page_size: int, after):
+    return list_resumen_page(page_size=page_size, after=after)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_detalle_page(version, filtros: dict, page_size: int, after):
+    return list_detalle_page(**filtros, page_size=page_size, after=after)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _cached_stats_por_grupo(version, columnas: tuple):
+    return stats_por_grupo(columnas=list(columnas))
 
 # Nota: no usamos `st.secrets` en esta versión. La app es pública por defecto.
 
 
 # Sidebar — parámetros y controles
+crono.seccion("sidebar")
 st.sidebar.title("Controles")
 
 # Nota: no hay control de acceso por clave en la interfaz — la app es pública.
@@ -141,20 +216,18 @@ if st.sidebar.button("Cargar datos demo"):
                 "plantilla": plantilla_sel,
             },
         ]
-        data_dir = Path(__file__).resolve().parent / "data"
-        data_dir.mkdir(exist_ok=True)
-        out = data_dir / "evaluaciones_only_csv.csv"
-        df = pd.DataFrame(demo_items)
-        # Si el archivo existe, anexar sin duplicar encabezado
-        # Guardar con BOM UTF-8 para mejorar compatibilidad con Excel/Windows
-        if out.exists():
-            df.to_csv(out, mode="a", header=False, index=False, encoding="utf-8-sig")
+        # Un único lote en el diario CSV (cabecera con BOM sólo al crearlo)
+        journal = get_journal()
+        try:
+            journal.append(demo_items)
+        except JournalError as e:
+            st.sidebar.error(f"No se pudieron guardar los datos demo en CSV: {e}")
         else:
-            df.to_csv(out, index=False, encoding="utf-8-sig")
-        st.sidebar.success(f"Insertadas {len(demo_items)} evaluaciones demo (CSV): {out}")
+            st.sidebar.success(f"Insertadas {len(demo_items)} evaluaciones demo (CSV): {journal.path}")
 
 
 # Estilos CSS para cabecera y cards
+crono.seccion("cabecera")
 css = f"""
 <style>
 .header {{display:flex; align-items:center; gap:16px; margin-bottom:16px}}
@@ -182,6 +255,7 @@ Pasos rápidos para usar en clase:
 3. Selecciona el `Modo de almacenamiento`: "SQLite" para persistir en la base de datos local, o "Sólo CSV" para trabajar con un buffer descargable.
 4. Para crear varias evaluaciones a la vez usa `Guardar evaluaciones` (crea una fila por cada línea del roster).
 5. Para evaluar un único alumno/grupo, usa el panel principal: selecciona el grupo, ajusta los sliders y pulsa `Guardar evaluación`.
+   Para calificar toda la sección a la vez elige `Cuadrícula` en `Modo de calificación`: edita las notas en la tabla (la nota final se recalcula al momento) y pulsa `Guardar cuadrícula` para guardarlas todas de una vez.
 6. Usa `Cargar datos demo` para poblar ejemplos (útil para demostraciones rápidas).
 7. En el panel derecho puedes descargar el resumen o el detalle filtrado en CSV.
 
@@ -191,6 +265,7 @@ Consejo: en entornos compartidos, considera proteger el acceso mediante autentic
 
 
 # Botón para guardar evaluaciones — se guardará una fila por cada línea en 'grupos_text'
+crono.seccion("guardar_roster")
 if st.sidebar.button("Guardar evaluaciones"):
     grupos = [g.strip() for g in grupos_text.splitlines() if g.strip()]
     if not grupos:
@@ -198,10 +273,8 @@ if st.sidebar.button("Guardar evaluaciones"):
 
     fecha_iso = fecha_sb.isoformat() if isinstance(fecha_sb, datetime.date) else str(fecha_sb)
 
-    inserted = 0
-    errors: List[str] = []
-    for g in grupos:
-        item = {
+    items = [
+        {
             "plantilla": plantilla_sel,
             "curso": curso_sb.strip(),
             "evaluacion": evaluacion_sb.strip(),
@@ -210,30 +283,40 @@ if st.sidebar.button("Guardar evaluaciones"):
             "nota_final": 0.0,
             "observaciones": "",
         }
+        for g in grupos
+    ]
+
+    inserted = 0
+    skipped = 0
+    errors: List[str] = []
+    if modo_almacenamiento == "SQLite":
+        # Una sola transacción para todo el roster
         try:
-            if modo_almacenamiento == "SQLite":
-                insert_evaluacion(item)
-            else:
-                # Append to CSV
-                data_dir = Path(__file__).resolve().parent / "data"
-                data_dir.mkdir(exist_ok=True)
-                out = data_dir / "evaluaciones_only_csv.csv"
-                df = pd.DataFrame([item])
-                if out.exists():
-                    df.to_csv(out, mode="a", header=False, index=False)
-                else:
-                    df.to_csv(out, index=False)
-            inserted += 1
+            # Las evaluaciones ya existentes (misma clave) se conservan
+            result = insert_evaluaciones_bulk(items, on_conflict="skip")
+            inserted = result["insertadas"]
+            skipped = result["omitidas"]
+            errors.extend(f"{grupos[e['indice']]}: {e['error']}" for e in result["errores"])
         except DBError as e:
             errors.append(str(e))
+    else:
+        # Todo el roster en un único lote del diario CSV
+        try:
+            inserted = get_journal().append(items)
+        except JournalError as e:
+            errors.append(str(e))
 
+    _contar_guardadas(inserted, "roster")
     if inserted:
         st.sidebar.success(f"Guardadas {inserted} evaluaciones ({modo_almacenamiento})")
+    if skipped:
+        st.sidebar.info(f"{skipped} ya existían y se conservaron")
     if errors:
         st.sidebar.error("Errores: " + "; ".join(errors))
 
 
 # --- Panel principal: evaluación individual (selectbox, sliders, cálculo en vivo) ---
+crono.seccion("rubrica")
 st.markdown("---")
 # Mostrar rúbrica al inicio
 st.header("Rúbrica de evaluación (escala 1–5)")
@@ -300,33 +383,19 @@ with st.expander("Mostrar rúbrica de evaluación", expanded=False):
 
 st.markdown("---")
 st.header("Evaluación individual")
+# Individual: un grupo con sliders. Cuadrícula: toda la sección a la vez y un único guardado
+modo_calificacion = st.radio("Modo de calificación", ["Individual", "Cuadrícula"], horizontal=True, key="modo_calificacion")
+crono.seccion("roster")
 # roster desde sidebar (prioridad: texto pegado en la barra lateral > CSV de `data/roster_groups_*.csv` > fallback Grupo 1..5)
 roster = [g.strip() for g in grupos_text.splitlines() if g.strip()]
 if not roster:
-    # Intentar cargar roster desde CSV más reciente en data/
-    data_dir = Path(__file__).resolve().parent / "data"
-    roster = []
-    try:
-        files = sorted(data_dir.glob("roster_groups_*.csv"), reverse=True)
-        for f in files:
-            try:
-                df_r = pd.read_csv(f)
-                if "group" in df_r.columns:
-                    # Mantener orden y eliminar duplicados
-                    roster = list(dict.fromkeys([str(x).strip() for x in df_r["group"].tolist() if str(x).strip()]))
-                    if roster:
-                        break
-            except Exception:
-                continue
-    except Exception:
-        roster = []
+    # Roster del CSV más reciente en data/ (cacheado: sólo se relee si cambia)
+    roster = get_roster_provider(str(Path(__file__).resolve().parent / "data")).roster()
 
     if not roster:
         # Fallback rápido útil en demos o si no hay datos
         roster = [f"Grupo {i}" for i in range(1, 6)]
 
-# Mostrar selectbox con el roster, seleccionar el primero por defecto
-selected = st.selectbox("Seleccionar grupo/estudiante", roster, index=0)
 
 def _open_expander(criterio: str):
     """Callback para abrir el expander de un criterio cuando el slider cambia."""
@@ -338,51 +407,6 @@ def _close_all_expanders():
         st.session_state[f"show_{c}"] = False
 
 
-st.subheader("Puntuaciones por criterio")
-notas: dict = {}
-# Obtener pesos/descripciones desde la plantilla seleccionada
-pesos, descripciones = get_template(plantilla_sel)
-for criterio in ["estructura", "programacion", "teoria", "ia", "reflexion", "presentacion"]:
-    # Usar título completo si está disponible
-    titulo = CRITERIA_TITLES.get(criterio, criterio.capitalize())
-    short_label = f"{titulo} — {pesos.get(criterio,0)}%"
-
-    show_key = f"show_{criterio}"
-    slider_key = f"slider_{criterio}"
-    if show_key not in st.session_state:
-        st.session_state[show_key] = False
-
-    c1, c2 = st.columns([2, 3])
-    with c1:
-        notas[criterio] = st.slider(short_label, min_value=1.0, max_value=5.0, step=0.5, value=3.0, key=slider_key, on_change=_open_expander, args=(criterio,))
-    with c2:
-        with st.expander(f"Descripción — {titulo}", expanded=st.session_state.get(show_key, False)):
-            desc = descripciones.get(criterio, "")
-            st.write(desc)
-            st.markdown(f"**Peso:** {pesos.get(criterio,0)}%")
-            st.markdown(f"**Niveles:** {niveles_texto()}")
-
-            # Mostrar ejemplo dinámico según el valor actual del slider
-            try:
-                current_val = st.session_state.get(slider_key, 3.0)
-                iv = int(round(float(current_val)))
-            except Exception:
-                iv = 3
-            iv = max(1, min(5, iv))
-            ejemplo = ejemplo_por_nota(criterio, iv)
-            st.markdown(f"**Ejemplo para nota {iv}:**")
-            st.info(ejemplo)
-
-    # cálculo en vivo
-    try:
-        validate_notas(notas)
-        final = nota_final(notas, pesos=pesos)
-    except Exception as ex:
-        final = 0.0
-        st.error(f"Error al calcular la nota final: {ex}. Revisa que todas las puntuaciones estén entre 1 y 5.")
-
-st.metric("Nota final (ponderada)", f"{final}")
-
 # Generar observaciones automáticas a partir de las notas seleccionadas
 def _build_observaciones():
     lines = []
@@ -400,26 +424,256 @@ def _build_observaciones():
         lines.append(f"{titulo} — {iv}. {ejemplo}")
     return "\n".join(lines)
 
-# Checkbox para permitir bloquear la actualización automática si el docente quiere editar a mano
-if "observaciones_lock" not in st.session_state:
-    st.session_state["observaciones_lock"] = False
-
-generated_obs = _build_observaciones()
-lock = st.checkbox("Bloquear observaciones (no actualizar automáticamente)", value=st.session_state.get("observaciones_lock", False), key="observaciones_lock")
-if lock:
-    # mantener texto previo si existe
-    if "observaciones_text" not in st.session_state:
-        st.session_state["observaciones_text"] = ""
-    obs_main = st.text_area("Observaciones", value=st.session_state.get("observaciones_text", ""), key="observaciones_text")
+
+def build_detailed_df_from_rows(rows: list):
+    # rows: list of dicts from DB or constructed current item
+    items = []
+
+    def _sanitize_text(s: object) -> str:
+        """Eliminar saltos de línea y normalizar texto para CSV (una línea por celda)."""
+        if s is None:
+            return ""
+        txt = str(s)
+        parts = [p.strip() for p in txt.splitlines() if p.strip()]
+        return " | ".join(parts)
+
+    for r in rows:
+        item = r.copy()
+        # Añadir textos cualitativos por criterio y sanitizarlos
+        for crit in ["estructura", "programacion", "teoria", "ia", "reflexion", "presentacion"]:
+            try:
+                val = int(round(float(item.get(crit, 3))))
+            except Exception:
+                val = 3
+            item[f"{crit}_text"] = _sanitize_text(ejemplo_por_nota(crit, val))
+        # Conservar versión raw de observaciones y sanitizar la que irá al CSV
+        if "observaciones" in item:
+            item["observaciones_raw"] = str(item.get("observaciones", ""))
+            item["observaciones"] = _sanitize_text(item.get("observaciones"))
+        items.append(item)
+
+    df = pd.DataFrame(items)
+    # Ordenar columnas para legibilidad
+    cols = ["id","plantilla","curso","evaluacion","fecha","grupo_o_estudiante"] if "id" in df.columns else ["plantilla","curso","evaluacion","fecha","grupo_o_estudiante"]
+    for crit in ["estructura","programacion","teoria","ia","reflexion","presentacion"]:
+        cols.extend([crit, f"{crit}_text"])
+    cols.extend(["nota_final","observaciones","created_at"]) if "created_at" in df.columns else cols.extend(["nota_final","observaciones"])
+    # keep only existing columns in that order
+    cols = [c for c in cols if c in df.columns]
+    return df[cols]
+
+
+# El panel es un fragmento: mover un slider, cambiar el grupo o editar las
+# observaciones sólo vuelve a ejecutar esta función, no la página entera
+# (tablas, exportes, roster). Los valores de la barra lateral son los de la
+# última ejecución completa, que es la que provoca cualquier cambio en ella.
+@st.fragment
+@perfil.medir("fragmento: panel individual", _perfil_activo)
+def _panel_evaluacion(roster: List[str]):
+    # Mostrar selectbox con el roster, seleccionar el primero por defecto
+    selected = st.selectbox("Seleccionar grupo/estudiante", roster, index=0)
+
+    st.subheader("Puntuaciones por criterio")
+    notas: dict = {}
+    # Obtener pesos/descripciones desde la plantilla seleccionada
+    pesos, descripciones = get_template(plantilla_sel)
+    for criterio in ["estructura", "programacion", "teoria", "ia", "reflexion", "presentacion"]:
+        # Usar título completo si está disponible
+        titulo = CRITERIA_TITLES.get(criterio, criterio.capitalize())
+        short_label = f"{titulo} — {pesos.get(criterio,0)}%"
+
+        show_key = f"show_{criterio}"
+        slider_key = f"slider_{criterio}"
+        if show_key not in st.session_state:
+            st.session_state[show_key] = False
+
+        c1, c2 = st.columns([2, 3])
+        with c1:
+            notas[criterio] = st.slider(short_label, min_value=1.0, max_value=5.0, step=0.5, value=3.0, key=slider_key, on_change=_open_expander, args=(criterio,))
+        with c2:
+            with st.expander(f"Descripción — {titulo}", expanded=st.session_state.get(show_key, False)):
+                desc = descripciones.get(criterio, "")
+                st.write(desc)
+                st.markdown(f"**Peso:** {pesos.get(criterio,0)}%")
+                st.markdown(f"**Niveles:** {niveles_texto()}")
+
+                # Mostrar ejemplo dinámico según el valor actual del slider
+                try:
+                    current_val = st.session_state.get(slider_key, 3.0)
+                    iv = int(round(float(current_val)))
+                except Exception:
+                    iv = 3
+                iv = max(1, min(5, iv))
+                ejemplo = ejemplo_por_nota(criterio, iv)
+                st.markdown(f"**Ejemplo para nota {iv}:**")
+                st.info(ejemplo)
+
+        # cálculo en vivo
+        try:
+            validate_notas(notas)
+            final = nota_final(notas, pesos=pesos)
+        except Exception as ex:
+            final = 0.0
+            st.error(f"Error al calcular la nota final: {ex}. Revisa que todas las puntuaciones estén entre 1 y 5.")
+
+    st.metric("Nota final (ponderada)", f"{final}")
+
+    # Checkbox para permitir bloquear la actualización automática si el docente quiere editar a mano
+    if "observaciones_lock" not in st.session_state:
+        st.session_state["observaciones_lock"] = False
+
+    generated_obs = _build_observaciones()
+    lock = st.checkbox("Bloquear observaciones (no actualizar automáticamente)", value=st.session_state.get("observaciones_lock", False), key="observaciones_lock")
+    if lock:
+        # mantener texto previo si existe
+        if "observaciones_text" not in st.session_state:
+            st.session_state["observaciones_text"] = ""
+        obs_main = st.text_area("Observaciones", value=st.session_state.get("observaciones_text", ""), key="observaciones_text")
+    else:
+        # Forzar actualización del contenido en session_state para que el widget muestre el texto generado
+        st.session_state["observaciones_text"] = generated_obs
+        obs_main = st.text_area("Observaciones", value=st.session_state.get("observaciones_text", ""), key="observaciones_text")
+
+    # Exportar evaluación actual (detallada); el CSV se genera sólo al pulsar el botón
+    current = {
+        "plantilla": plantilla_sel,
+        "curso": curso_sb.strip(),
+        "evaluacion": evaluacion_sb.strip(),
+        "fecha": fecha_sb.isoformat() if isinstance(fecha_sb, datetime.date) else str(fecha_sb),
+        "grupo_o_estudiante": selected or "current",
+    }
+    for crit in ["estructura","programacion","teoria","ia","reflexion","presentacion"]:
+        current[crit] = float(notas.get(crit, 3.0))
+    current["nota_final"] = float(final)
+    current["observaciones"] = obs_main.strip()
+
+    def _csv_actual() -> bytes:
+        # Descargar con BOM UTF-8 para compatibilidad con Excel
+        df_det = build_detailed_df_from_rows([current])
+        return df_det.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
+
+    safe_name = str(current.get("grupo_o_estudiante", "current")).replace(" ", "_")
+    st.download_button("Descargar evaluación actual (CSV)", data=_csv_actual, file_name=f"evaluacion_{safe_name}.csv", mime="text/csv")
+
+    return selected, notas, final, obs_main
+
+
+def _cuadricula_base(roster: List[str], criterios: List[str]) -> pd.DataFrame:
+    df = pd.DataFrame({"grupo_o_estudiante": roster})
+    for criterio in criterios:
+        df[criterio] = 3.0
+    df["observaciones"] = ""
+    return df
+
+
+# Cuadrícula: una fila por entrada del roster y una columna por criterio de la
+# plantilla. Editar una celda sólo vuelve a ejecutar el fragmento y la nota
+# final de todas las filas se calcula de una vez con `nota_final_batch`.
+@st.fragment
+@perfil.medir("fragmento: cuadrícula", _perfil_activo)
+def _panel_cuadricula(roster: List[str]) -> pd.DataFrame:
+    pesos, _ = get_template(plantilla_sel)
+    criterios = list(pesos)
+    st.subheader("Puntuaciones por criterio (una fila por grupo/estudiante)")
+
+    config = {"grupo_o_estudiante": st.column_config.TextColumn("Grupo/Estudiante", disabled=True)}
+    for criterio in criterios:
+        titulo = CRITERIA_TITLES.get(criterio, criterio.capitalize())
+        config[criterio] = st.column_config.NumberColumn(
+            f"{titulo} — {pesos[criterio]}%", min_value=1.0, max_value=5.0, step=0.5, required=True
+        )
+    config["observaciones"] = st.column_config.TextColumn("Observaciones")
+    # La clave depende de la plantilla y del roster: otro roster empieza una cuadrícula nueva
+    firma_roster = zlib.crc32("\n".join(roster).encode("utf-8"))
+    clave = f"cuadricula_{plantilla_sel}_{firma_roster}"
+    editada = st.data_editor(
+        _cuadricula_base(roster, criterios), column_config=config, hide_index=True, num_rows="fixed", key=clave
+    )
+
+    notas_cuadricula, errores = nota_final_batch(editada[criterios], pesos)
+    # Una celda vaciada no es "no puntuado": la fila queda incompleta y no se califica,
+    # como en el formulario individual (que exige todas las notas)
+    incompletas = editada[criterios].isna().any(axis=1).to_numpy()
+    notas_cuadricula[incompletas] = float("nan")
+    editada = editada.assign(nota_final=notas_cuadricula)
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        st.dataframe(editada[["grupo_o_estudiante", "nota_final"]], hide_index=True)
+    with c2:
+        media = editada["nota_final"].mean()
+        st.metric("Media de la sección", "-" if pd.isna(media) else f"{media:.2f}")
+    if errores.any():
+        malos = editada.loc[errores, "grupo_o_estudiante"].tolist()
+        st.error(f"Notas fuera de 1–5 en: {', '.join(malos)}. Esas filas no se guardarán.")
+    if (incompletas & ~errores).any():
+        faltan = editada.loc[incompletas & ~errores, "grupo_o_estudiante"].tolist()
+        st.error(f"Faltan notas de algún criterio en: {', '.join(faltan)}. Esas filas no se guardarán.")
+    return editada
+
+
+def _guardar_cuadricula(tabla: pd.DataFrame) -> None:
+    """Guarda todas las filas válidas de la cuadrícula en un único lote."""
+    criterios = list(get_template(plantilla_sel)[0])
+    # Filas con error o con algún criterio vacío: no se guardan (no deben pisar una evaluación completa)
+    validas = tabla[tabla["nota_final"].notna() & tabla[criterios].notna().all(axis=1)]
+    excluidas = len(tabla) - len(validas)
+    fecha_iso = fecha_sb.isoformat() if isinstance(fecha_sb, datetime.date) else str(fecha_sb)
+    items = [
+        {
+            "plantilla": plantilla_sel,
+            "curso": curso_sb.strip(),
+            "evaluacion": evaluacion_sb.strip(),
+            "fecha": fecha_iso,
+            "grupo_o_estudiante": r["grupo_o_estudiante"],
+            **{c: float(r[c]) for c in criterios},
+            "nota_final": float(r["nota_final"]),
+            # Una celda vaciada en el editor vuelve como NaN (que es "truthy"): no guardar "nan"
+            "observaciones": str(r["observaciones"]).strip() if pd.notna(r["observaciones"]) else "",
+        }
+        for r in validas.to_dict("records")
+    ]
+    if not items:
+        st.error("No hay filas válidas que guardar")
+        return
+    if excluidas:
+        st.warning(f"{excluidas} filas incompletas o con errores no se guardaron")
+
+    if modo_almacenamiento == "SQLite":
+        try:
+            # Una transacción y un upsert: re-guardar la sección corrige las notas existentes
+            result = insert_evaluaciones_bulk(items, on_conflict="update")
+        except DBError as e:
+            st.error(f"Error al guardar en SQLite: {e}")
+            return
+        _contar_guardadas(result.get("insertadas", 0) + result.get("actualizadas", 0), "cuadricula")
+        st.success(
+            f"Cuadrícula guardada en SQLite: {result.get('insertadas', 0)} nuevas, "
+            f"{result.get('actualizadas', 0)} actualizadas"
+        )
+        if result["errores"]:
+            st.error("Errores: " + "; ".join(f"{items[e['indice']]['grupo_o_estudiante']}: {e['error']}" for e in result["errores"]))
+    else:
+        created_at = datetime.datetime.now().isoformat()
+        for item in items:
+            st.session_state.csv_buffer.append(dict(item, created_at=created_at))
+        _contar_guardadas(len(items), "cuadricula")
+        st.success(f"{len(items)} evaluaciones añadidas al buffer CSV en sesión")
+
+
+crono.seccion("evaluacion")
+if modo_calificacion == "Individual":
+    selected, notas, final, obs_main = _panel_evaluacion(roster)
 else:
-    # Forzar actualización del contenido en session_state para que el widget muestre el texto generado
-    st.session_state["observaciones_text"] = generated_obs
-    obs_main = st.text_area("Observaciones", value=st.session_state.get("observaciones_text", ""), key="observaciones_text")
+    tabla_cuadricula = _panel_cuadricula(roster)
+
+# Buffer del modo "Sólo CSV": añadir una fila no copia ni recodifica las anteriores
+if not isinstance(st.session_state.get("csv_buffer"), CsvBuffer):
+    st.session_state.csv_buffer = CsvBuffer(["plantilla","curso","evaluacion","fecha","grupo_o_estudiante","estructura","programacion","teoria","ia","reflexion","presentacion","nota_final","observaciones","created_at"])
 
-if "csv_buffer" not in st.session_state:
-    st.session_state.csv_buffer = pd.DataFrame(columns=["plantilla","curso","evaluacion","fecha","grupo_o_estudiante","estructura","programacion","teoria","ia","reflexion","presentacion","nota_final","observaciones","created_at"])
+if modo_calificacion == "Cuadrícula" and st.button("Guardar cuadrícula"):
+    _guardar_cuadricula(tabla_cuadricula)
 
-if st.button("Guardar evaluación"):
+if modo_calificacion == "Individual" and st.button("Guardar evaluación"):
     # validar notas
     try:
         validate_notas(notas)
@@ -444,53 +698,117 @@ if st.button("Guardar evaluación"):
 
         if modo_almacenamiento == "SQLite":
             try:
-                new_id = insert_evaluacion(item)
+                # Re-guardar la misma clave (curso, evaluación, fecha, grupo) corrige la nota
+                new_id = insert_evaluacion(item, on_conflict="update")
+                _contar_guardadas(1, "individual")
                 st.success(f"Evaluación guardada en SQLite (id={new_id})")
             except DBError as e:
                 st.error(f"Error al guardar en SQLite: {e}")
         else:
             # acumular en buffer y ofrecer descarga inmediata
-            df = st.session_state.csv_buffer
             item_row = item.copy()
             item_row["created_at"] = datetime.datetime.now().isoformat()
-            st.session_state.csv_buffer = pd.concat([df, pd.DataFrame([item_row])], ignore_index=True)
+            st.session_state.csv_buffer.append(item_row)
+            _contar_guardadas(1, "individual")
             st.success("Evaluación añadida al buffer CSV en sesión")
             # Descargar el buffer en UTF-8 con BOM para evitar problemas en Excel
-            csv_bytes = st.session_state.csv_buffer.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
-            st.download_button("Descargar CSV (buffer)", data=csv_bytes, file_name="evaluaciones_buffer.csv", mime="text/csv")
+            st.download_button("Descargar CSV (buffer)", data=st.session_state.csv_buffer.csv_bytes, file_name="evaluaciones_buffer.csv", mime="text/csv")
+
+
+# Tablas paginadas: cada rerun lee y dibuja sólo la página visible
+RESUMEN_COLUMNS = ["id", "fecha", "grupo_o_estudiante", "nota_final"]
+PAGE_SIZES = [25, 50, 100, 200]
+
+
+def _reset_pages(key: str):
+    st.session_state[f"{key}_tokens"] = [None]
+
+
+def _prev_page(key: str):
+    tokens = st.session_state[f"{key}_tokens"]
+    if len(tokens) > 1:
+        tokens.pop()
+
+
+def _next_page(key: str, token):
+    st.session_state[f"{key}_tokens"].append(token)
+
+
+def paginated_table(key: str, fetch_page, columns=None, empty_msg: str = "No hay datos") -> pd.DataFrame:
+    """Dibuja una tabla paginada y devuelve el DataFrame de la página visible.
+
+    `fetch_page(after, page_size)` debe devolver `(filas, siguiente_token)`; el token
+    es opaco para el componente (keyset `(fecha, id)` en SQLite, desplazamiento en CSV)
+    y se guarda en `st.session_state` para poder volver a páginas anteriores.
+    """
+    tokens = st.session_state.setdefault(f"{key}_tokens", [None])
+    page_size = st.selectbox("Filas por página", PAGE_SIZES, index=0, key=f"{key}_page_size", on_change=_reset_pages, args=(key,))
+    rows, next_token = fetch_page(tokens[-1], page_size)
+    if not rows and len(tokens) > 1:
+        # La página guardada ya no existe (p.ej. cambió el modo); volver al inicio
+        _reset_pages(key)
+        tokens = st.session_state[f"{key}_tokens"]
+        rows, next_token = fetch_page(None, page_size)
+    df_page = pd.DataFrame(rows, columns=columns)
+    if df_page.empty:
+        st.info(empty_msg)
+        return df_page
+    st.dataframe(df_page, hide_index=True)
+    c_prev, c_info, c_next = st.columns([1, 2, 1])
+    with c_prev:
+        st.button("◀ Anterior", key=f"{key}_prev", disabled=len(tokens) == 1, on_click=_prev_page, args=(key,))
+    with c_info:
+        st.caption(f"Página {len(tokens)}")
+    with c_next:
+        st.button("Siguiente ▶", key=f"{key}_next", disabled=next_token is None, on_click=_next_page, args=(key, next_token))
+    return df_page
+
+
+def _dataframe_page(df: pd.DataFrame, after, page_size: int):
+    """Paginación por desplazamiento para DataFrames en memoria (modo CSV)."""
+    start = after or 0
+    page = df.iloc[start:start + page_size]
+    next_token = start + page_size if start + page_size < len(df) else None
+    return page.to_dict("records"), next_token
+
+
+def _buffer_resumen_df() -> pd.DataFrame:
+    """Resumen (id, fecha, grupo, nota) construido desde el buffer CSV en sesión."""
+    buffer = st.session_state.csv_buffer
+    if buffer.empty:
+        return pd.DataFrame(columns=RESUMEN_COLUMNS)
+    df_res = buffer.to_dataframe().copy()
+    df_res.insert(0, "id", df_res.index + 1)
+    # Asegurar columnas
+    for c in ["fecha", "grupo_o_estudiante", "nota_final"]:
+        if c not in df_res.columns:
+            df_res[c] = ""
+    return df_res[RESUMEN_COLUMNS]
+
+
+def _fetch_resumen(after, page_size: int):
+    if modo_almacenamiento == "SQLite":
+        try:
+            return _cached_resumen_page(data_version(), page_size, after)
+        except DBError as e:
+            st.error(f"Error obteniendo resumen desde la BD: {e}")
+            return [], None
+    return _dataframe_page(_buffer_resumen_df(), after, page_size)
 
 
 # Área principal: resumen y export
+crono.seccion("resumen")
 # Layout: contenido principal + panel derecho para reporte
 left_col, right_col = st.columns([2, 1])
 
 with left_col:
     st.header("Resumen de evaluaciones")
-    # Obtener resumen según modo
-    if modo_almacenamiento == "SQLite":
-        try:
-            rows = list_resumen()
-            df_resumen = pd.DataFrame(rows)
-        except DBError as e:
-            st.error(f"Error obteniendo resumen desde la BD: {e}")
-            df_resumen = pd.DataFrame(columns=["id", "fecha", "grupo_o_estudiante", "nota_final"])
-    else:
-        # Desde buffer CSV en sesión
-        df = st.session_state.get("csv_buffer", pd.DataFrame())
-        if df.empty:
-            df_resumen = pd.DataFrame(columns=["id", "fecha", "grupo_o_estudiante", "nota_final"])
-        else:
-            df_resumen = df.reset_index(drop=True).copy()
-            df_resumen.insert(0, "id", df_resumen.index + 1)
-            # Asegurar columnas
-            for c in ["fecha", "grupo_o_estudiante", "nota_final"]:
-                if c not in df_resumen.columns:
-                    df_resumen[c] = ""
-
-    if not df_resumen.empty:
-        st.dataframe(df_resumen[["id", "fecha", "grupo_o_estudiante", "nota_final"]])
-    else:
-        st.info("No hay evaluaciones todavía. Usa el formulario en la barra lateral o carga datos demo.")
+    paginated_table(
+        "resumen",
+        _fetch_resumen,
+        RESUMEN_COLUMNS,
+        "No hay evaluaciones todavía. Usa el formulario en la barra lateral o carga datos demo.",
+    )
 
     # Exportar todo (usa export_csv() para SQLite, o buffer para CSV)
     if modo_almacenamiento == "SQLite":
@@ -502,79 +820,54 @@ with left_col:
                 st.error(f"Error exportando CSV: {e}")
     else:
         if not st.session_state.csv_buffer.empty:
-            csv_bytes = st.session_state.csv_buffer.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
-            st.download_button("Descargar CSV (buffer completo)", data=csv_bytes, file_name="evaluaciones_buffer_full.csv", mime="text/csv")
+            st.download_button("Descargar CSV (buffer completo)", data=st.session_state.csv_buffer.csv_bytes, file_name="evaluaciones_buffer_full.csv", mime="text/csv")
 
+crono.seccion("reporte")
 with right_col:
     st.header("Reporte")
     st.write("Tabla resumen rápida")
-    if not df_resumen.empty:
-        st.table(df_resumen[["id", "fecha", "grupo_o_estudiante", "nota_final"]].head(10))
-        # Descarga rápida del resumen
-        csv_res = df_resumen[["id", "fecha", "grupo_o_estudiante", "nota_final"]].to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
-        st.download_button("Descargar resumen CSV", data=csv_res, file_name="resumen_evaluaciones.csv", mime="text/csv")
+    # Las 10 últimas siempre, con independencia de la página que se esté viendo a la izquierda
+    ultimas, _ = _fetch_resumen(None, 10)
+    if ultimas:
+        st.table(pd.DataFrame(ultimas, columns=RESUMEN_COLUMNS))
+        # Descarga del resumen completo: sólo se lee la tabla entera cuando se pide
+        if st.button("Preparar resumen CSV"):
+            try:
+                if modo_almacenamiento == "SQLite":
+                    df_res_full = pd.DataFrame(list_resumen(), columns=RESUMEN_COLUMNS)
+                else:
+                    df_res_full = _buffer_resumen_df()
+                csv_res = df_res_full.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
+                st.download_button("Descargar resumen CSV", data=csv_res, file_name="resumen_evaluaciones.csv", mime="text/csv")
+            except DBError as e:
+                st.error(f"Error obteniendo resumen desde la BD: {e}")
     else:
         st.info("No hay datos para el reporte")
 
-    # --- Exportes detallados: por evaluación actual y para todas las evaluaciones ---
+    # Agregados por grupo (tabla `resumen_stats`): O(grupos), no recorre las evaluaciones
+    if modo_almacenamiento == "SQLite":
+        st.write("Promedios por curso / evaluación")
+        try:
+            grupos_stats = _cached_stats_por_grupo(data_version(), ("nota_final",))
+        except DBError as e:
+            st.error(f"Error obteniendo estadísticas: {e}")
+            grupos_stats = []
+        if grupos_stats:
+            df_stats = pd.DataFrame(grupos_stats).rename(columns={
+                "n": "evaluaciones",
+                "nota_final_mean": "media",
+                "nota_final_min": "mín",
+                "nota_final_max": "máx",
+                "nota_final_std": "desv.",
+            })
+            df_stats = df_stats[["curso", "evaluacion", "plantilla", "fecha", "evaluaciones", "media", "mín", "máx", "desv."]]
+            st.dataframe(df_stats.round(2), hide_index=True)
+
+    crono.seccion("exportes")
+    # --- Exportes detallados: todas las evaluaciones (la actual se descarga desde el panel) ---
     st.markdown("---")
     st.subheader("Exportes detallados")
 
-    def build_detailed_df_from_rows(rows: list):
-        # rows: list of dicts from DB or constructed current item
-        items = []
-
-        def _sanitize_text(s: object) -> str:
-            """Eliminar saltos de línea y normalizar texto para CSV (una línea por celda)."""
-            if s is None:
-                return ""
-            txt = str(s)
-            parts = [p.strip() for p in txt.splitlines() if p.strip()]
-            return " | ".join(parts)
-
-        for r in rows:
-            item = r.copy()
-            # Añadir textos cualitativos por criterio y sanitizarlos
-            for crit in ["estructura", "programacion", "teoria", "ia", "reflexion", "presentacion"]:
-                try:
-                    val = int(round(float(item.get(crit, 3))))
-                except Exception:
-                    val = 3
-                item[f"{crit}_text"] = _sanitize_text(ejemplo_por_nota(crit, val))
-            # Conservar versión raw de observaciones y sanitizar la que irá al CSV
-            if "observaciones" in item:
-                item["observaciones_raw"] = str(item.get("observaciones", ""))
-                item["observaciones"] = _sanitize_text(item.get("observaciones"))
-            items.append(item)
-
-        df = pd.DataFrame(items)
-        # Ordenar columnas para legibilidad
-        cols = ["id","plantilla","curso","evaluacion","fecha","grupo_o_estudiante"] if "id" in df.columns else ["plantilla","curso","evaluacion","fecha","grupo_o_estudiante"]
-        for crit in ["estructura","programacion","teoria","ia","reflexion","presentacion"]:
-            cols.extend([crit, f"{crit}_text"])
-        cols.extend(["nota_final","observaciones","created_at"]) if "created_at" in df.columns else cols.extend(["nota_final","observaciones"])
-        # keep only existing columns in that order
-        cols = [c for c in cols if c in df.columns]
-        return df[cols]
-
-    # Exportar evaluación actual (detallada) — siempre mostrar botón de descarga que toma el estado actual
-    current = {
-        "plantilla": plantilla_sel,
-        "curso": curso_sb.strip(),
-        "evaluacion": evaluacion_sb.strip(),
-        "fecha": fecha_sb.isoformat() if isinstance(fecha_sb, datetime.date) else str(fecha_sb),
-        "grupo_o_estudiante": selected or "current",
-    }
-    for crit in ["estructura","programacion","teoria","ia","reflexion","presentacion"]:
-        current[crit] = float(notas.get(crit, 3.0))
-    current["nota_final"] = float(final)
-    current["observaciones"] = obs_main.strip()
-    df_det = build_detailed_df_from_rows([current])
-    # Descargar con BOM UTF-8 para compatibilidad con Excel
-    csv_bytes = df_det.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
-    safe_name = str(current.get("grupo_o_estudiante", "current")).replace(" ", "_")
-    st.download_button("Descargar evaluación actual (CSV)", data=csv_bytes, file_name=f"evaluacion_{safe_name}.csv", mime="text/csv")
-
     # Exportar todas las evaluaciones detalladas desde la BD
     if st.button("Exportar todas las evaluaciones (detalladas)"):
         try:
@@ -592,49 +885,72 @@ with right_col:
             st.error(f"Error exportando detalle: {e}")
 
 # Sección: Detalle y filtros
+crono.seccion("detalle")
 st.markdown("---")
 st.header("Detalle y filtros")
 filtro_texto = st.text_input("Filtro de texto (buscar en curso/evaluacion/grupo/observaciones)")
+busqueda_fts = st.checkbox("Buscar por palabras (rápido, ordena por relevancia)", value=True, help="Busca palabras o inicios de palabra sin distinguir tildes. Desmárcalo para buscar el texto exacto en cualquier parte.")
 fecha_filtro = st.date_input("Filtrar por fecha (dejar vacío para omitir)", value=None)
 order = st.selectbox("Orden por fecha", ["DESC", "ASC"], index=0)
 
+def _filtrar_buffer(df: pd.DataFrame, filtros: dict) -> pd.DataFrame:
+    """Aplica los filtros del detalle al buffer CSV en sesión."""
+    if df.empty:
+        return pd.DataFrame()
+    df_detalle = df.copy()
+    filtro = filtros["filtro_texto"]
+    if filtro:
+        mask = (
+            df_detalle["curso"].astype(str).str.contains(filtro, case=False, na=False)
+            | df_detalle["evaluacion"].astype(str).str.contains(filtro, case=False, na=False)
+            | df_detalle["grupo_o_estudiante"].astype(str).str.contains(filtro, case=False, na=False)
+            | df_detalle["observaciones"].astype(str).str.contains(filtro, case=False, na=False)
+        )
+        df_detalle = df_detalle[mask]
+    if filtros["fecha"]:
+        df_detalle = df_detalle[df_detalle["fecha"].astype(str) == filtros["fecha"]]
+    return df_detalle.sort_values(by="fecha", ascending=(filtros["order"] == "ASC"))
+
+
 if st.button("Aplicar filtros"):
+    # Guardar los filtros en sesión para que la paginación los conserve entre reruns
+    st.session_state["detalle_filtros"] = {
+        "filtro_texto": filtro_texto or None,
+        "fecha": fecha_filtro.isoformat() if fecha_filtro else None,
+        "order": order,
+        "busqueda": "fts" if busqueda_fts else "like",
+    }
+    _reset_pages("detalle")
+
+filtros_detalle = st.session_state.get("detalle_filtros")
+if filtros_detalle is not None:
     # Obtener detalle según modo
     if modo_almacenamiento == "SQLite":
+        def _fetch_detalle(after, page_size: int):
+            try:
+                return _cached_detalle_page(data_version(), filtros_detalle, page_size, after)
+            except DBError as e:
+                st.error(f"Error obteniendo detalle desde la BD: {e}")
+                return [], None
+    else:
+        df_buffer_filtrado = _filtrar_buffer(st.session_state.csv_buffer.to_dataframe(), filtros_detalle)
+
+        def _fetch_detalle(after, page_size: int):
+            return _dataframe_page(df_buffer_filtrado, after, page_size)
+
+    paginated_table("detalle", _fetch_detalle, None, "No hay registros que cumplan los filtros")
+
+    # El CSV con todos los resultados filtrados se genera sólo bajo demanda
+    if st.button("Preparar detalle CSV"):
         try:
-            fecha_param = fecha_filtro.isoformat() if fecha_filtro else None
-            detalle = list_detalle(filtro_texto=filtro_texto or None, fecha=fecha_param, order=order)
-            df_detalle = pd.DataFrame(detalle)
+            if modo_almacenamiento == "SQLite":
+                df_detalle = pd.DataFrame(list_detalle(**filtros_detalle))
+            else:
+                df_detalle = df_buffer_filtrado
+            csv_det = df_detalle.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
+            st.download_button("Descargar detalle CSV", data=csv_det, file_name="detalle_evaluaciones.csv", mime="text/csv")
         except DBError as e:
             st.error(f"Error obteniendo detalle desde la BD: {e}")
-            df_detalle = pd.DataFrame()
-    else:
-        df = st.session_state.get("csv_buffer", pd.DataFrame())
-        if df.empty:
-            df_detalle = pd.DataFrame()
-        else:
-            df_detalle = df.copy()
-            if filtro_texto:
-                mask = (
-                    df_detalle["curso"].astype(str).str.contains(filtro_texto, case=False, na=False)
-                    | df_detalle["evaluacion"].astype(str).str.contains(filtro_texto, case=False, na=False)
-                    | df_detalle["grupo_o_estudiante"].astype(str).str.contains(filtro_texto, case=False, na=False)
-                    | df_detalle["observaciones"].astype(str).str.contains(filtro_texto, case=False, na=False)
-                )
-                df_detalle = df_detalle[mask]
-            if fecha_filtro:
-                df_detalle = df_detalle[df_detalle["fecha"].astype(str) == fecha_filtro.isoformat()]
-            if order == "DESC":
-                df_detalle = df_detalle.sort_values(by="fecha", ascending=False)
-            else:
-                df_detalle = df_detalle.sort_values(by="fecha", ascending=True)
-
-    if df_detalle.empty:
-        st.info("No hay registros que cumplan los filtros")
-    else:
-        st.dataframe(df_detalle)
-    csv_det = df_detalle.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
-    st.download_button("Descargar detalle CSV", data=csv_det, file_name="detalle_evaluaciones.csv", mime="text/csv")
 
     # Backup completo de la tabla a CSV con timestamp (solo cuando usamos SQLite)
     if modo_almacenamiento == "SQLite":
@@ -644,3 +960,36 @@ if st.button("Aplicar filtros"):
                 st.success(f"Backup creado: {backup_path}")
             except DBError as e:
                 st.error(f"No se pudo crear el backup: {e}")
+        # Copia binaria consistente (conserva tipos e índices); se puede restaurar con `python backup.py restore`
+        if st.button("Backup SQLite (comprimido)"):
+            try:
+                backup_path = backup_sqlite()
+                st.success(f"Backup creado: {backup_path}")
+            except DBError as e:
+                st.error(f"No se pudo crear el backup: {e}")
+
+
+# Panel de depuración: tiempos del rerun actual y ventana de todas las sesiones
+tiempos_rerun = crono.fin()
+if metricas.activas():
+    M_RERUN.observe(time.perf_counter() - inicio_rerun)
+with st.sidebar.expander("Depuración", expanded=bool(tiempos_rerun)):
+    st.checkbox("Perfilar secciones", key="perfilado", help="Mide el tiempo de cada sección del script en cada rerun")
+    if tiempos_rerun:
+        st.caption("Este rerun (ms)")
+        st.dataframe(
+            pd.DataFrame({"sección": list(tiempos_rerun), "ms": [round(v * 1000, 2) for v in tiempos_rerun.values()]}),
+            hide_index=True,
+        )
+        resumen_perfil = perfil.resumen()
+        st.caption(f"Últimos {perfil.VENTANA} reruns por sección (todas las sesiones)")
+        st.dataframe(pd.DataFrame(resumen_perfil).drop(columns="histograma"), hide_index=True)
+        seccion_hist = st.selectbox("Histograma de", [r["seccion"] for r in resumen_perfil], key="perfil_seccion")
+        hist = next(r["histograma"] for r in resumen_perfil if r["seccion"] == seccion_hist)
+        st.bar_chart(pd.DataFrame({"reruns": list(hist.values())}, index=list(hist)), sort=False)
+        st.download_button(
+            "Descargar perfil (JSON)",
+            data=lambda: perfil.volcar_json(tiempos_rerun),
+            file_name="perfil_secciones.json",
+            mime="application/json",
+        )
@@ -0,0 +1,269 @@
+"""Copias de seguridad binarias de `rubrica.db` con la API de backup de SQLite.
+
+A diferencia de `db.backup_csv_timestamp()`, la copia conserva tipos, índices
+y triggers, y es consistente aunque haya escrituras en curso: se copia por
+bloques de páginas (`pages`) y entre bloques se libera el bloqueo, de modo que
+la app sigue atendiendo mientras tanto. Cada copia se escribe como `*.tmp` y
+sólo toma su nombre final al completarse; los temporales de copias
+interrumpidas se borran al crear la siguiente.
+
+Uso desde la línea de comandos (desde `califica_rubrica/`):
+
+    python backup.py backup [--db rubrica.db] [--out-dir data/backups] [--compress gzip|zstd|none] [--keep 10]
+    python backup.py restore data/backups/rubrica_YYYYMMDD_HHMMSS.db.gz [--db rubrica.db]
+"""
+
+from pathlib import Path
+from datetime import datetime
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from db import DB_DEFAULT, DBError, bump_data_version, get_conn, init_db
+
+try:  # compresión zstd opcional: pip install zstandard
+    import zstandard
+except ImportError:  # pragma: no cover - depende del entorno
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR_DEFAULT = Path(__file__).resolve().parent / "data" / "backups"
+BACKUP_PREFIX = "rubrica_"
+COMPRESSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+# Un `*.tmp` sin tocar desde hace más de esto es de una copia interrumpida
+TMP_MAX_AGE = 3600
+
+
+def _compress(raw: Path, out: Path, compress: Optional[str]) -> None:
+    """Escribe en `out` la copia `raw` comprimida según `compress` y borra `raw`.
+
+    La compresión se escribe en un temporal `*.tmp` junto a `out` y se renombra
+    al terminar: si falla a medias no queda un `.gz`/`.zst` truncado que
+    `rotate_backups` contaría como copia válida.
+    """
+    if compress is None:
+        os.replace(raw, out)
+        return
+    tmp = tempfile.NamedTemporaryFile(dir=out.parent, prefix=out.name, suffix=".tmp", delete=False)
+    try:
+        with tmp, open(raw, "rb") as fin:
+            if compress == "gzip":
+                with gzip.GzipFile(filename=out.name, mode="wb", fileobj=tmp) as fout:
+                    shutil.copyfileobj(fin, fout, 1024 * 1024)
+            else:
+                zstandard.ZstdCompressor().copy_stream(fin, tmp)
+        os.replace(tmp.name, out)
+    except BaseException:
+        Path(tmp.name).unlink(missing_ok=True)
+        raise
+    raw.unlink()
+
+
+def _decompress(src: Path, dst: Path) -> None:
+    """Escribe en `dst` el contenido descomprimido de `src` (según su extensión)."""
+    with open(dst, "wb") as fout:
+        if src.suffix == ".gz":
+            with gzip.open(src, "rb") as fin:
+                shutil.copyfileobj(fin, fout, 1024 * 1024)
+        elif src.suffix == ".zst":
+            if zstandard is None:
+                raise DBError("Para restaurar copias .zst instala el paquete `zstandard`")
+            with open(src, "rb") as fin:
+                zstandard.ZstdDecompressor().copy_stream(fin, fout)
+        else:
+            with open(src, "rb") as fin:
+                shutil.copyfileobj(fin, fout, 1024 * 1024)
+
+
+def list_backups(out_dir: Optional[str] = None) -> List[Path]:
+    """Devuelve las copias binarias de `out_dir`, de la más reciente a la más antigua."""
+    base = Path(out_dir) if out_dir else BACKUP_DIR_DEFAULT
+    if not base.exists():
+        return []
+    # Los `*.tmp` son copias en curso (o interrumpidas), no copias válidas
+    files = [p for p in base.glob(f"{BACKUP_PREFIX}*.db*") if p.is_file() and p.suffix != ".tmp"]
+    # Por fecha de modificación: el nombre puede repetirse si se crean varias por segundo
+    return sorted(files, key=lambda p: (p.stat().st_mtime, p.name), reverse=True)
+
+
+def clean_stale_tmp(out_dir: Optional[str] = None, max_age: float = TMP_MAX_AGE) -> List[str]:
+    """Borra los `*.tmp` de copias interrumpidas (sin modificar en `max_age` segundos).
+
+    Los más recientes pueden ser de una copia en curso en otro proceso y se conservan.
+
+    Returns:
+        Rutas de los ficheros eliminados.
+    """
+    base = Path(out_dir) if out_dir else BACKUP_DIR_DEFAULT
+    if not base.exists():
+        return []
+    limite = time.time() - max_age
+    removed: List[str] = []
+    for tmp in base.glob(f"{BACKUP_PREFIX}*.tmp"):
+        try:
+            if tmp.is_file() and tmp.stat().st_mtime < limite:
+                tmp.unlink()
+                removed.append(str(tmp))
+        except FileNotFoundError:  # otro proceso lo terminó o lo borró
+            continue
+    return removed
+
+
+def rotate_backups(out_dir: Optional[str] = None, keep: int = 10) -> List[str]:
+    """Borra las copias más antiguas dejando sólo las `keep` más recientes.
+
+    Returns:
+        Rutas de los ficheros eliminados.
+    """
+    removed: List[str] = []
+    for old in list_backups(out_dir)[max(keep, 0):]:
+        old.unlink()
+        removed.append(str(old))
+    return removed
+
+
+def backup_sqlite(
+    path: Optional[str] = None,
+    out_dir: Optional[str] = None,
+    compress: Optional[str] = "gzip",
+    keep: Optional[int] = 10,
+    pages: int = 256,
+    sleep: float = 0.005,
+) -> str:
+    """Crea una copia binaria consistente de la BD en `out_dir/rubrica_YYYYMMDD_HHMMSS.db[.gz|.zst]`.
+
+    Args:
+        path: ruta opcional a la BD.
+        out_dir: directorio de salida; por defecto `data/backups/` dentro del paquete.
+        compress: None, 'gzip' o 'zstd' (requiere el paquete `zstandard`).
+        keep: número de copias a conservar tras crear la nueva (None = no rotar).
+        pages: páginas copiadas por paso; entre pasos se libera la BD.
+        sleep: pausa en segundos entre pasos.
+
+    Returns:
+        Ruta del fichero de copia creado.
+
+    Raises:
+        DBError en caso de fallo.
+    """
+    if compress not in COMPRESSIONS:
+        raise DBError(f"Compresión no soportada: {compress}")
+    if compress == "zstd" and zstandard is None:
+        raise DBError("La compresión zstd requiere el paquete `zstandard`")
+
+    base = Path(out_dir) if out_dir else BACKUP_DIR_DEFAULT
+    raw: Optional[Path] = None
+    try:
+        base.mkdir(parents=True, exist_ok=True)
+        clean_stale_tmp(str(base))
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        ext = COMPRESSIONS[compress]
+        out = base / f"{BACKUP_PREFIX}{ts}.db{ext}"
+        n = 1
+        while out.exists():
+            out = base / f"{BACKUP_PREFIX}{ts}_{n}.db{ext}"
+            n += 1
+        # La copia sin comprimir también es un temporal hasta que `_compress` la deja en `out`
+        with tempfile.NamedTemporaryFile(dir=base, prefix=out.name, suffix=".db.tmp", delete=False) as tmp:
+            raw = Path(tmp.name)
+        with get_conn(path) as src:
+            dst = sqlite3.connect(str(raw))
+            try:
+                src.backup(dst, pages=pages, sleep=sleep)
+            finally:
+                dst.close()
+        _compress(raw, out, compress)
+        if keep is not None:
+            # La copia ya está creada: un fallo al rotar no la invalida
+            try:
+                rotate_backups(str(base), keep)
+            except OSError as ex:
+                logger.warning("Backup creado en %s, pero no se pudieron rotar las copias antiguas: %s", out, ex)
+        return str(out)
+    except DBError:
+        raise
+    except Exception as ex:
+        if raw is not None and raw.exists():
+            raw.unlink()
+        raise DBError(f"Error creando backup SQLite: {ex}") from ex
+
+
+def restore_sqlite(backup_file: str, path: Optional[str] = None) -> None:
+    """Restaura `backup_file` (.db, .db.gz o .db.zst) sobre la BD `path`.
+
+    La copia se verifica con `PRAGMA integrity_check` antes de tocar la BD de
+    destino y se vuelca con la API de backup, por lo que las conexiones del pool
+    siguen siendo válidas. Después se aplican las migraciones pendientes por si
+    la copia es de una versión de esquema anterior.
+
+    Raises:
+        DBError si la copia no existe, está corrupta o falla la restauración.
+    """
+    src_path = Path(backup_file)
+    if not src_path.exists():
+        raise DBError(f"No existe la copia: {backup_file}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            plain = Path(tmp) / "restore.db"
+            _decompress(src_path, plain)
+            src = sqlite3.connect(str(plain))
+            try:
+                check = src.execute("PRAGMA integrity_check").fetchone()[0]
+                if check != "ok":
+                    raise DBError(f"La copia {backup_file} no es válida: {check}")
+                with get_conn(path) as dst:
+                    src.backup(dst)
+            finally:
+                src.close()
+        init_db(path)
+        # La API de backup no cuenta como filas modificadas: invalidar a mano
+        bump_data_version(path)
+    except DBError:
+        raise
+    except Exception as ex:
+        raise DBError(f"Error restaurando backup SQLite: {ex}") from ex
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Copias de seguridad binarias de rubrica.db")
+    parser.add_argument("--db", default=str(DB_DEFAULT), help="Ruta a la BD")
+    # `--db` también se acepta tras el subcomando (la forma documentada arriba);
+    # SUPPRESS evita que el valor por defecto del subcomando pise al de antes
+    comun = argparse.ArgumentParser(add_help=False)
+    comun.add_argument("--db", default=argparse.SUPPRESS, help="Ruta a la BD")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_backup = sub.add_parser("backup", parents=[comun], help="Crear una copia")
+    p_backup.add_argument("--out-dir", default=str(BACKUP_DIR_DEFAULT), help="Directorio de copias")
+    p_backup.add_argument("--compress", choices=["gzip", "zstd", "none"], default="gzip")
+    p_backup.add_argument("--keep", type=int, default=10, help="Copias a conservar (0 = no rotar)")
+
+    p_restore = sub.add_parser("restore", parents=[comun], help="Restaurar una copia sobre la BD")
+    p_restore.add_argument("file", help="Fichero .db, .db.gz o .db.zst")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.cmd == "backup":
+            compress = None if args.compress == "none" else args.compress
+            out = backup_sqlite(args.db, args.out_dir, compress=compress, keep=args.keep or None)
+            print(f"Backup creado: {out}")
+        else:
+            restore_sqlite(args.file, args.db)
+            print(f"Restaurado {args.file} -> {args.db}")
+    except DBError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
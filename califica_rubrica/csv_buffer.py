@@ -0,0 +1,71 @@
+"""Buffer de evaluaciones en sesión para el modo "Sólo CSV".
+
+Antes cada guardado hacía `pd.concat` con el buffer completo y volvía a
+codificar todo a CSV para el botón de descarga: trabajo cuadrático a lo largo
+de una sesión. `CsvBuffer` guarda las filas en una lista y, al añadir una,
+codifica sólo esa fila y la agrega a los bytes ya generados. El `DataFrame` se
+construye bajo demanda y se reutiliza hasta el siguiente `append`.
+
+El CSV producido es el mismo, byte a byte, que `df.to_csv(index=False,
+lineterminator=...)` con BOM UTF-8 (para Excel), como el que descargaba la app;
+con el fin de línea por defecto (`"\n"`) coincide con `df.to_csv(index=False)`.
+"""
+
+import csv
+import io
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+
+BOM = "\ufeff".encode("utf-8")
+
+
+def _encode_row(values: Sequence[Any], lineterminator: str = "\n") -> bytes:
+    out = io.StringIO()
+    csv.writer(out, lineterminator=lineterminator).writerow(["" if v is None else v for v in values])
+    return out.getvalue().encode("utf-8")
+
+
+class CsvBuffer:
+    """Filas acumuladas en la sesión con CSV incremental.
+
+    Args:
+        columns: columnas del buffer, en el orden del CSV. Las claves de cada
+            fila que no estén en `columns` se ignoran y las que falten quedan vacías.
+        lineterminator: fin de línea del CSV (el de `DataFrame.to_csv` por defecto).
+    """
+
+    def __init__(self, columns: Sequence[str], lineterminator: str = "\n") -> None:
+        self.columns: List[str] = list(columns)
+        self.lineterminator = lineterminator
+        self._rows: List[Tuple[Any, ...]] = []
+        self._csv = bytearray(BOM + _encode_row(self.columns, lineterminator))
+        self._df: Optional[pd.DataFrame] = None
+
+    def append(self, row: Dict[str, Any]) -> None:
+        """Añade una fila codificando sólo esa fila a CSV (O(tamaño de la fila))."""
+        values = tuple(row.get(c) for c in self.columns)
+        self._rows.append(values)
+        self._csv += _encode_row(values, self.lineterminator)
+        self._df = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def empty(self) -> bool:
+        return not self._rows
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """`DataFrame` con todas las filas; se cachea hasta el siguiente `append`.
+
+        No modificar el resultado: se comparte entre llamadas.
+        """
+        if self._df is None:
+            self._df = pd.DataFrame(self._rows, columns=self.columns)
+        return self._df
+
+    def csv_bytes(self) -> bytes:
+        """CSV completo (con BOM UTF-8) sin volver a codificar las filas ya añadidas."""
+        return bytes(self._csv)
@@ -2,29 +2,93 @@
 
 Provee una interfaz segura y con PRAGMAs adecuados para SQLite
 (WAL, synchronous=NORMAL, foreign_keys=ON) y operaciones CRUD
-específicas para la tabla `evaluaciones`.
+específicas para la tabla `evaluaciones`. Las conexiones se obtienen de un
+pool (`pool.py`) y se reutilizan entre llamadas y reruns de Streamlit.
 """
 
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 import sqlite3
-from typing import Any, Dict, List, Optional
-import pandas as pd
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import csv
+import functools
+import inspect
 import json
+import numpy as np
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+
+from migrations import (
+    CLAVE_NATURAL,
+    DUPLICADAS_TABLE,
+    FTS_TABLE,
+    STATS_GROUP,
+    STATS_METRICS,
+    STATS_TABLE,
+    current_version,
+    has_fts,
+    migrate,
+    stats_rebuild_sql,
+    stats_minmax_sql,
+    stats_refresh_sql,
+)
+from pool import get_pool, close_pool, close_all
+import metricas
+import querylog
+from utils import TEMPLATES, nota_final_batch
 
 
 DB_DEFAULT = Path(__file__).resolve().parent / "rubrica.db"
 
+logger = logging.getLogger(__name__)
+
+
+# Columnas que aceptan las funciones de inserción (en orden de la tabla)
+EVAL_COLUMNS: List[str] = [
+    "plantilla",
+    "curso",
+    "evaluacion",
+    "fecha",
+    "grupo_o_estudiante",
+    "estructura",
+    "programacion",
+    "teoria",
+    "ia",
+    "reflexion",
+    "presentacion",
+    "nota_final",
+    "observaciones",
+]
+
+# Columnas numéricas (criterios + nota final)
+NUMERIC_COLUMNS: List[str] = [
+    "estructura",
+    "programacion",
+    "teoria",
+    "ia",
+    "reflexion",
+    "presentacion",
+    "nota_final",
+]
+
 
 class DBError(Exception):
     """Excepción genérica para errores de base de datos."""
 
 
-def open_conn(path: Optional[str] = None) -> sqlite3.Connection:
+def open_conn(path: Optional[str] = None, check_same_thread: bool = True) -> sqlite3.Connection:
     """Abrir conexión a SQLite y aplicar PRAGMAs recomendadas.
 
     Args:
         path: ruta al fichero de base de datos. Si es None se usa `rubrica.db` en el paquete.
+        check_same_thread: se pasa a `sqlite3.connect`; el pool lo desactiva porque
+            presta la misma conexión a hilos distintos (nunca a la vez).
 
     Returns:
         sqlite3.Connection con row_factory configurado.
@@ -35,7 +99,12 @@ def open_conn(path: Optional[str] = None) -> sqlite3.Connection:
     try:
         db_path = Path(path) if path else DB_DEFAULT
         db_path.parent.mkdir(parents=True, exist_ok=True)
-        conn = sqlite3.connect(str(db_path), timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+        conn = sqlite3.connect(
+            str(db_path),
+            timeout=30,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=check_same_thread,
+        )
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
         # Aplicar PRAGMAs aconsejadas
@@ -49,77 +118,359 @@ def open_conn(path: Optional[str] = None) -> sqlite3.Connection:
         raise DBError(f"No se pudo abrir la conexión a la BD: {ex}") from ex
 
 
-def init_db(path: Optional[str] = None) -> None:
-    """Inicializa la base de datos creando la tabla `evaluaciones` si no existe."""
-    create_sql = """
-    CREATE TABLE IF NOT EXISTS evaluaciones (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        plantilla TEXT,
-        curso TEXT,
-        evaluacion TEXT,
-        fecha TEXT,
-        grupo_o_estudiante TEXT,
-        estructura REAL,
-        programacion REAL,
-        teoria REAL,
-        ia REAL,
-        reflexion REAL,
-        presentacion REAL,
-        nota_final REAL,
-        observaciones TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
+def _pooled_factory(path: str) -> sqlite3.Connection:
+    return open_conn(path, check_same_thread=False)
+
+
+def _db_path(path: Optional[str] = None) -> Path:
+    db_path = Path(path) if path else DB_DEFAULT
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    return db_path
+
+
+# Contador de versión de datos por BD (ruta resuelta). Lo incrementa cada
+# escritura hecha desde este proceso y lo usan las cachés de lectura de la app.
+_DATA_VERSIONS: Dict[str, int] = {}
+_DATA_VERSIONS_LOCK = threading.Lock()
+
+
+def bump_data_version(path: Optional[str] = None) -> int:
+    """Marca que los datos de la BD `path` han cambiado y devuelve la nueva versión."""
+    key = str(_db_path(path).resolve())
+    with _DATA_VERSIONS_LOCK:
+        _DATA_VERSIONS[key] = _DATA_VERSIONS.get(key, 0) + 1
+        return _DATA_VERSIONS[key]
+
+
+def data_version(path: Optional[str] = None) -> Tuple[str, int, Tuple[Tuple[int, int], ...]]:
+    """Clave de versión de los datos de la BD `path`, para usar en cachés.
+
+    Combina el contador de escrituras de este proceso con `(mtime_ns, tamaño)`
+    del fichero y de su `-wal`, de modo que también cambia si escribe otro
+    proceso (p.ej. `tools/load_csv_to_sqlite.py`). Leerla no abre la BD.
+    """
+    db_path = _db_path(path).resolve()
+    key = str(db_path)
+    firma = []
+    for f in (db_path, db_path.with_name(db_path.name + "-wal")):
+        try:
+            st = os.stat(f)
+            firma.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            firma.append((0, 0))
+    with _DATA_VERSIONS_LOCK:
+        version = _DATA_VERSIONS.get(key, 0)
+    return key, version, tuple(firma)
+
+
+@contextmanager
+def get_conn(path: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """Presta una conexión del pool para `path` y la devuelve al salir.
+
+    Las conexiones se reutilizan entre reruns de Streamlit, así que las PRAGMAs
+    se aplican una vez por conexión y no en cada llamada. Si el bloque lanza
+    una excepción, la transacción abierta se descarta al devolver la conexión.
+
+    Si durante el préstamo se modificaron filas (`total_changes`), se incrementa
+    la versión de datos (`data_version`) para invalidar las cachés de lectura.
+
+    Raises:
+        DBError si no se puede abrir una conexión nueva.
     """
+    pool = get_pool(str(_db_path(path)), _pooled_factory)
+    with pool.connection() as conn:
+        cambios = conn.total_changes
+        # Con la instrumentación activa, el SQL ejecutado se atribuye a la llamada en curso
+        captura = querylog.captura_en_curso() if querylog.activa() else None
+        if captura is not None:
+            conn.set_trace_callback(captura.anadir)
+        try:
+            yield conn
+        finally:
+            if captura is not None:
+                conn.set_trace_callback(None)
+            if conn.total_changes != cambios:
+                bump_data_version(path)
+
+
+# Métricas (ver `metricas.py`); sólo se alimentan con las métricas activas
+_M_LLAMADAS = metricas.histograma("califica_db_call_seconds", "Duración de las llamadas a db.py", ["funcion"])
+_M_ERRORES = metricas.contador("califica_db_call_errors", "Llamadas a db.py que lanzaron una excepción", ["funcion"])
+_M_FILAS = metricas.contador(
+    "califica_db_rows", "Filas devueltas, insertadas o exportadas por las llamadas a db.py", ["funcion"]
+)
+_M_ESPERA_BLOQUEO = metricas.histograma(
+    "califica_db_lock_wait_seconds",
+    "Espera hasta obtener el bloqueo de escritura (BEGIN IMMEDIATE)",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+_M_BLOQUEOS_FALLIDOS = metricas.contador(
+    "califica_db_lock_timeouts", "Transacciones que no obtuvieron el bloqueo de escritura (database is locked)"
+)
+
+
+def begin_immediate(conn: sqlite3.Connection) -> None:
+    """Abre una transacción de escritura (`BEGIN IMMEDIATE`) midiendo la espera por el bloqueo."""
+    t0 = time.perf_counter()
     try:
-        conn = open_conn(path)
-        cur = conn.cursor()
-        cur.execute(create_sql)
-        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+    except sqlite3.OperationalError as ex:
+        if metricas.activas() and "locked" in str(ex):
+            _M_BLOQUEOS_FALLIDOS.inc()
+        raise
+    if metricas.activas():
+        _M_ESPERA_BLOQUEO.observe(time.perf_counter() - t0)
+
+
+_EXPLICABLE = re.compile(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+
+def _contar_filas(res: Any) -> Optional[int]:
+    """Filas devueltas o afectadas según la forma del resultado (None si no aplica)."""
+    if isinstance(res, list):
+        return len(res)
+    if isinstance(res, tuple) and res and isinstance(res[0], list):
+        return len(res[0])
+    if isinstance(res, dict):
+        for k in ("filas", "rows", "ids"):
+            v = res.get(k)
+            if isinstance(v, list):
+                return len(v)
+            if isinstance(v, int):
+                return v
+    return None
+
+
+def _planes(path: Optional[str], sentencias: List[str]) -> Dict[str, List[str]]:
+    """`EXPLAIN QUERY PLAN` de cada forma de SQL distinta de `sentencias`."""
+    planes: Dict[str, List[str]] = {}
+    with get_conn(path) as conn:
+        for sql in dict.fromkeys(sentencias):
+            forma = querylog.forma_sql(sql)
+            if forma in planes or not _EXPLICABLE.match(sql):
+                continue
+            try:
+                planes[forma] = [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            except sqlite3.Error as ex:
+                # p.ej. tablas temporales de otra conexión
+                planes[forma] = [f"(sin plan: {ex})"]
+    return planes
+
+
+def _instrumentado(func):
+    """Mide la llamada con `querylog` y `metricas` si alguno está activo.
+
+    Desactivados, sólo añade la comprobación de dos booleanos. Con `querylog`
+    activo registra tiempo, filas y formas de SQL; si la llamada supera el
+    umbral, añade el plan de sus consultas y la escribe en el log de consultas
+    lentas. Con las métricas activas alimenta la latencia, los errores y las
+    filas por función. Un fallo al registrar nunca afecta a la llamada.
+    """
+    firma = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        con_sql = querylog.activa()
+        if not (con_sql or metricas.activas()):
+            return func(*args, **kwargs)
+        # Una llamada anidada no abre otra captura: su SQL cuenta en la externa
+        captura = querylog.iniciar_captura() if con_sql else None
+        inicio = datetime.now().isoformat(timespec="milliseconds")
+        t0 = time.perf_counter()
+        res, error = None, None
+        try:
+            res = func(*args, **kwargs)
+            return res
+        except Exception as ex:
+            error = f"{type(ex).__name__}: {ex}"
+            raise
+        finally:
+            segundos = time.perf_counter() - t0
+            if captura is not None:
+                querylog.terminar_captura()
+            try:
+                filas = _contar_filas(res)
+                if metricas.activas():
+                    _M_LLAMADAS.observe(segundos, funcion=func.__name__)
+                    if error is not None:
+                        _M_ERRORES.inc(funcion=func.__name__)
+                    if filas:
+                        _M_FILAS.inc(filas, funcion=func.__name__)
+                if captura is not None:
+                    registro = {
+                        "funcion": func.__name__,
+                        "inicio": inicio,
+                        "segundos": round(segundos, 6),
+                        "filas": filas,
+                        "sentencias": captura.total,
+                        "sql": list(dict.fromkeys(querylog.forma_sql(q) for q in captura.sentencias)),
+                        "error": error,
+                        "lenta": segundos >= querylog.umbral(),
+                    }
+                    if registro["lenta"]:
+                        path = firma.bind_partial(*args, **kwargs).arguments.get("path")
+                        registro["planes"] = _planes(path, captura.sentencias)
+                    querylog.registrar(registro)
+            except Exception:
+                logger.exception("No se pudo registrar la llamada a %s", func.__name__)
+
+    return wrapper
+
+
+def close_db(path: Optional[str] = None) -> None:
+    """Cierra las conexiones del pool de `path` (por defecto `rubrica.db`)."""
+    close_pool(str(_db_path(path)))
+
+
+def close_all_dbs() -> None:
+    """Cierra todas las conexiones abiertas por el pool (todas las rutas)."""
+    close_all()
+
+
+def init_db(path: Optional[str] = None) -> List[int]:
+    """Crea o actualiza el esquema aplicando las migraciones pendientes.
+
+    Las BDs existentes se actualizan en el sitio; la versión del esquema se
+    guarda en `PRAGMA user_version` (ver `migrations.py`).
+
+    Returns:
+        Lista de versiones de migración aplicadas (vacía si ya estaba al día).
+    """
+    try:
+        with get_conn(path) as conn:
+            aplicadas = migrate(conn)
+        if aplicadas:
+            bump_data_version(path)
+        return aplicadas
     except DBError:
         raise
     except Exception as ex:
         raise DBError(f"Error inicializando la BD: {ex}") from ex
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 
-def insert_evaluacion(item: Dict[str, Any], path: Optional[str] = None) -> int:
+# Inicializaciones ya hechas en este proceso: ruta resuelta -> resumen de `ensure_db`
+_INIT_DONE: Dict[str, Dict[str, Any]] = {}
+_INIT_LOCK = threading.Lock()
+
+
+def _file_id(db_path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+def _contar_duplicadas(conn: sqlite3.Connection) -> int:
+    """Filas en `evaluaciones_duplicadas` (0 si la migración aún no la creó)."""
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (DUPLICADAS_TABLE,)
+    ).fetchone()
+    return int(conn.execute(f"SELECT COUNT(*) FROM {DUPLICADAS_TABLE}").fetchone()[0]) if existe else 0
+
+
+def ensure_db(path: Optional[str] = None, warm: int = 2) -> Dict[str, Any]:
+    """Inicialización única por proceso y BD: pensada para el inicio de la app.
+
+    La primera llamada para `path` aplica las migraciones pendientes (`init_db`),
+    abre `warm` conexiones del pool (con sus PRAGMAs) para que los primeros
+    reruns no paguen esa apertura y ejecuta `PRAGMA optimize`; los tiempos se
+    registran con `logging`. Las llamadas siguientes sólo hacen un `stat` del
+    fichero: si la BD se borra o se reemplaza, se vuelve a inicializar.
+
+    Returns:
+        dict con `path`, `migraciones` aplicadas, `tiempos` por fase, `segundos`
+        totales y `duplicadas_archivadas` (filas con la clave natural repetida que
+        esas migraciones movieron a `evaluaciones_duplicadas`, ver
+        `migrations.asegurar_clave_unica`).
+
+    Raises:
+        DBError en caso de fallo.
+    """
+    db_path = _db_path(path).resolve()
+    key = str(db_path)
+    info = _INIT_DONE.get(key)
+    if info is not None and info["file_id"] == _file_id(db_path):
+        return info
+    try:
+        with _INIT_LOCK:
+            info = _INIT_DONE.get(key)
+            if info is not None and info["file_id"] == _file_id(db_path):
+                return info
+            tiempos: Dict[str, float] = {}
+            t0 = time.perf_counter()
+            with get_conn(key) as conn:
+                archivadas_antes = _contar_duplicadas(conn)
+            aplicadas = init_db(key)
+            tiempos["migraciones"] = time.perf_counter() - t0
+
+            t1 = time.perf_counter()
+            pool = get_pool(key, _pooled_factory)
+            conns = [pool.acquire() for _ in range(max(warm, 0))]
+            for conn in conns:
+                pool.release(conn)
+            tiempos["pool"] = time.perf_counter() - t1
+
+            t2 = time.perf_counter()
+            with get_conn(key) as conn:
+                conn.execute("PRAGMA optimize")
+                archivadas = _contar_duplicadas(conn) - archivadas_antes
+            tiempos["optimize"] = time.perf_counter() - t2
+
+            info = {
+                "path": key,
+                "file_id": _file_id(db_path),
+                "migraciones": aplicadas,
+                "tiempos": tiempos,
+                "duplicadas_archivadas": archivadas,
+                "segundos": time.perf_counter() - t0,
+            }
+            _INIT_DONE[key] = info
+        logger.info(
+            "BD %s inicializada en %.3fs (migraciones %s: %.3fs, pool: %.3fs, optimize: %.3fs)",
+            key, info["segundos"], aplicadas or "ninguna",
+            tiempos["migraciones"], tiempos["pool"], tiempos["optimize"],
+        )
+        return info
+    except DBError:
+        raise
+    except Exception as ex:
+        raise DBError(f"Error inicializando la BD: {ex}") from ex
+
+
+def schema_version(path: Optional[str] = None) -> int:
+    """Devuelve la versión de esquema (`PRAGMA user_version`) de la BD."""
+    try:
+        with get_conn(path) as conn:
+            return current_version(conn)
+    except DBError:
+        raise
+    except Exception as ex:
+        raise DBError(f"Error leyendo la versión del esquema: {ex}") from ex
+
+
+@_instrumentado
+def insert_evaluacion(item: Dict[str, Any], path: Optional[str] = None, on_conflict: Optional[str] = None) -> int:
     """Inserta una evaluación en la tabla `evaluaciones`.
 
     Args:
         item: dict con campos compatibles (curso, evaluacion, fecha, grupo_o_estudiante,
               estructura, programacion, teoria, ia, reflexion, presentacion, nota_final, observaciones)
         path: ruta opcional a la BD.
+        on_conflict: qué hacer si ya existe una evaluación con la misma clave natural
+            (curso, evaluacion, fecha, grupo_o_estudiante): None = error,
+            'skip' = conservar la existente, 'update' = sobrescribirla.
 
     Returns:
-        id insertado (int)
+        id insertado (int), o el de la fila existente si hubo conflicto
 
     Raises:
         DBError en caso de fallo.
     """
-    allowed = [
-        "plantilla",
-        "curso",
-        "evaluacion",
-        "fecha",
-        "grupo_o_estudiante",
-        "estructura",
-        "programacion",
-        "teoria",
-        "ia",
-        "reflexion",
-        "presentacion",
-        "nota_final",
-        "observaciones",
-    ]
-
     # Construir columnas y parámetros de forma segura
     cols = []
     vals: List[Any] = []
-    for k in allowed:
+    for k in EVAL_COLUMNS:
         if k in item:
             cols.append(k)
             vals.append(item[k])
@@ -129,24 +480,229 @@ def insert_evaluacion(item: Dict[str, Any], path: Optional[str] = None) -> int:
 
     placeholders = ",".join(["?" for _ in cols])
     sql = f"INSERT INTO evaluaciones ({', '.join(cols)}) VALUES ({placeholders})"
+    if on_conflict is not None:
+        sql += " " + _on_conflict_sql(cols, on_conflict) + " RETURNING id"
 
     try:
-        conn = open_conn(path)
-        cur = conn.cursor()
-        cur.execute(sql, tuple(vals))
-        conn.commit()
-        return cur.lastrowid
+        with get_conn(path) as conn:
+            begin_immediate(conn)
+            cur = conn.cursor()
+            cur.execute(sql, tuple(vals))
+            if on_conflict is None:
+                conn.commit()
+                return cur.lastrowid
+            row = cur.fetchone()
+            if row is None:  # 'skip' con la clave ya presente
+                where = " AND ".join(f"{c} = ?" for c in CLAVE_NATURAL)
+                row = conn.execute(
+                    f"SELECT id FROM evaluaciones WHERE {where}", tuple(item.get(c) for c in CLAVE_NATURAL)
+                ).fetchone()
+            elif on_conflict == "update":
+                refrescar_stats(conn)
+            conn.commit()
+            return row[0]
     except DBError:
         raise
     except Exception as ex:
         raise DBError(f"Error insertando evaluación: {ex}") from ex
-    finally:
+
+
+ON_CONFLICT = ("skip", "update")
+
+
+def _on_conflict_sql(columns: List[str], on_conflict: str) -> str:
+    """Cláusula `ON CONFLICT` sobre la clave natural para la política dada."""
+    if on_conflict not in ON_CONFLICT:
+        raise DBError(f"Política de conflicto no soportada: {on_conflict}")
+    target = f"ON CONFLICT({', '.join(CLAVE_NATURAL)})"
+    updates = [f"{c} = excluded.{c}" for c in columns if c not in CLAVE_NATURAL]
+    if on_conflict == "skip" or not updates:
+        return f"{target} DO NOTHING"
+    return f"{target} DO UPDATE SET {', '.join(updates)}"
+
+
+def refrescar_stats(conn: sqlite3.Connection) -> None:
+    """Recalcula el mínimo/máximo de los grupos de `resumen_stats` marcados con `stale = 1`.
+
+    Se llama dentro de las transacciones de escritura que cambian notas, para
+    que las lecturas (`stats_por_grupo`) no tengan que escribir.
+    """
+    if conn.execute(f"SELECT 1 FROM {STATS_TABLE} WHERE stale = 1 LIMIT 1").fetchone():
+        conn.execute(stats_refresh_sql())
+
+
+def upsert_evaluaciones(
+    conn: sqlite3.Connection,
+    columns: List[str],
+    rows: List[Tuple[Any, ...]],
+    on_conflict: str = "skip",
+) -> Dict[str, Any]:
+    """Inserta filas resolviendo en SQLite los conflictos de clave natural.
+
+    Las filas se vuelcan en una tabla temporal y se clasifican con una sola
+    consulta (nuevas, ya existentes o repetidas dentro del lote) usando el
+    índice único de la clave; después un único `INSERT ... SELECT ... ON
+    CONFLICT` aplica la política. Con 'skip' gana la fila existente (o la
+    primera del lote); con 'update' gana la última, y los mínimos/máximos de
+    `resumen_stats` que queden pendientes se recalculan en la misma transacción.
+
+    No abre ni confirma la transacción: la gestiona quien llama.
+
+    Args:
+        conn: conexión abierta.
+        columns: columnas de `rows`; deben incluir las de `CLAVE_NATURAL`.
+        rows: tuplas de valores en el orden de `columns`.
+        on_conflict: 'skip' o 'update'.
+
+    Returns:
+        dict con `ids` (id final de cada fila, en orden), `nuevas` (si cada
+        fila se insertó), y los recuentos `insertadas`, `omitidas` y `actualizadas`.
+    """
+    if on_conflict not in ON_CONFLICT:
+        raise DBError(f"Política de conflicto no soportada: {on_conflict}")
+    missing = [c for c in CLAVE_NATURAL if c not in columns]
+    if missing:
+        raise DBError(f"Faltan columnas de la clave natural: {missing}")
+    if not rows:
+        return {"ids": [], "nuevas": [], "insertadas": 0, "omitidas": 0, "actualizadas": 0}
+
+    col_sql = ", ".join(columns)
+    key_match = " AND ".join(f"{{a}}.{c} = {{b}}.{c}" for c in CLAVE_NATURAL)
+    con_clave = " AND ".join(f"{c} IS NOT NULL" for c in CLAVE_NATURAL)
+    conn.execute("DROP TABLE IF EXISTS temp.carga_upsert")
+    conn.execute(f"CREATE TEMP TABLE carga_upsert (pos INTEGER PRIMARY KEY, {col_sql})")
+    conn.execute(f"CREATE INDEX temp.idx_carga_upsert_clave ON carga_upsert({', '.join(CLAVE_NATURAL)})")
+    conn.executemany(
+        f"INSERT INTO carga_upsert (pos, {col_sql}) VALUES (?, {', '.join('?' for _ in columns)})",
+        ((i, *r) for i, r in enumerate(rows)),
+    )
+
+    # Clasificación en bloque: id existente y si la clave ya apareció antes en el lote
+    existente: Dict[int, int] = {}
+    repetida: set = set()
+    for pos, ex_id, rep in conn.execute(
+        f"SELECT c.pos, (SELECT e.id FROM evaluaciones e WHERE {key_match.format(a='e', b='c')}), "
+        f"EXISTS (SELECT 1 FROM carga_upsert d WHERE {key_match.format(a='d', b='c')} AND d.pos < c.pos) "
+        "FROM carga_upsert c"
+    ):
+        if ex_id is not None:
+            existente[pos] = ex_id
+        elif rep:
+            repetida.add(pos)
+    conflictos = len(existente) + len(repetida)
+
+    # Sin clave completa nunca hay conflicto: ids consecutivos de un INSERT aparte
+    n_sin_clave = conn.execute(
+        f"INSERT INTO evaluaciones ({col_sql}) SELECT {col_sql} FROM carga_upsert WHERE NOT ({con_clave}) ORDER BY pos"
+    ).rowcount
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    sin_clave_ids = iter(range(last_id - n_sin_clave + 1, last_id + 1))
+    conn.execute(
+        f"INSERT INTO evaluaciones ({col_sql}) SELECT {col_sql} FROM carga_upsert WHERE {con_clave} ORDER BY pos "
+        + _on_conflict_sql(list(columns), on_conflict)
+    )
+    por_pos = dict(
+        conn.execute(
+            f"SELECT c.pos, e.id FROM carga_upsert c JOIN evaluaciones e ON {key_match.format(a='e', b='c')}"
+        ).fetchall()
+    )
+    conn.execute("DROP TABLE temp.carga_upsert")
+    if on_conflict == "update" and conflictos:
+        refrescar_stats(conn)
+
+    ids = [por_pos[i] if i in por_pos else next(sin_clave_ids) for i in range(len(rows))]
+    nuevas = [i not in existente and i not in repetida for i in range(len(rows))]
+    return {
+        "ids": ids,
+        "nuevas": nuevas,
+        "insertadas": len(rows) - conflictos,
+        "omitidas": conflictos if on_conflict == "skip" else 0,
+        "actualizadas": conflictos if on_conflict == "update" else 0,
+    }
+
+
+def _validate_bulk_item(item: Any) -> None:
+    """Valida una fila para `insert_evaluaciones_bulk`; lanza ValueError si no es válida."""
+    if not isinstance(item, dict):
+        raise ValueError(f"Se esperaba un dict, se recibió {type(item).__name__}")
+    if not any(k in item for k in EVAL_COLUMNS):
+        raise ValueError("No se proporcionaron columnas válidas para insertar")
+    for k in NUMERIC_COLUMNS:
+        v = item.get(k)
+        if v is None:
+            continue
         try:
-            conn.close()
-        except Exception:
-            pass
+            float(v)
+        except (TypeError, ValueError):
+            raise ValueError(f"La columna '{k}' no es numérica: {v}")
+
 
+@_instrumentado
+def insert_evaluaciones_bulk(
+    items: List[Dict[str, Any]], path: Optional[str] = None, on_conflict: Optional[str] = None
+) -> Dict[str, Any]:
+    """Inserta muchas evaluaciones con `executemany` en una única transacción.
 
+    Las filas que no pasan la validación se omiten y se informan, sin abortar
+    el resto del lote. Las columnas ausentes en una fila se guardan como NULL
+    (igual que al omitirlas en `insert_evaluacion`).
+
+    Args:
+        items: lista de dicts con las mismas claves que acepta `insert_evaluacion`.
+        path: ruta opcional a la BD.
+        on_conflict: None (una clave natural que ya existe o se repite en el lote
+            es un error de esa fila, que no se inserta), 'skip' o 'update'; ver
+            `upsert_evaluaciones`.
+
+    Returns:
+        dict con `ids` (ids insertados, en el orden de las filas válidas) y
+        `errores` (lista de dicts `{"indice": i, "error": mensaje}`). Con
+        `on_conflict` incluye además `insertadas`, `omitidas` y `actualizadas`.
+
+    Raises:
+        DBError si falla la transacción; en ese caso no se inserta ninguna fila.
+    """
+    params: List[tuple] = []
+    indices: List[int] = []
+    errores: List[Dict[str, Any]] = []
+    for i, item in enumerate(items):
+        try:
+            _validate_bulk_item(item)
+        except ValueError as ex:
+            errores.append({"indice": i, "error": str(ex)})
+            continue
+        params.append(tuple(item.get(k) for k in EVAL_COLUMNS))
+        indices.append(i)
+
+    if not params:
+        return {"ids": [], "errores": errores}
+
+    try:
+        with get_conn(path) as conn:
+            begin_immediate(conn)
+            res = upsert_evaluaciones(conn, EVAL_COLUMNS, params, on_conflict or "skip")
+            conn.commit()
+        nuevas = res.pop("nuevas")
+        ids = [i for i, nueva in zip(res.pop("ids"), nuevas) if nueva]
+        if on_conflict is not None:
+            return {"ids": ids, "errores": errores, **res}
+        # Sin política, los conflictos se resolvieron como 'skip' (no se insertaron) y son errores de su fila
+        if not all(nuevas):
+            clave = ", ".join(CLAVE_NATURAL)
+            errores.extend(
+                {"indice": i, "error": f"Clave natural duplicada ({clave}): ya existe o se repite en el lote"}
+                for i, nueva in zip(indices, nuevas)
+                if not nueva
+            )
+            errores.sort(key=lambda e: e["indice"])
+        return {"ids": ids, "errores": errores}
+    except DBError:
+        raise
+    except Exception as ex:
+        raise DBError(f"Error insertando evaluaciones en bloque: {ex}") from ex
+
+
+@_instrumentado
 def list_resumen(path: Optional[str] = None, order: str = "DESC") -> List[Dict[str, Any]]:
     """Devuelve un resumen de evaluaciones: id, fecha, grupo_o_estudiante, nota_final.
 
@@ -158,31 +714,76 @@ def list_resumen(path: Optional[str] = None, order: str = "DESC") -> List[Dict[s
         order = "DESC"
     sql = f"SELECT id, fecha, grupo_o_estudiante, nota_final FROM evaluaciones ORDER BY fecha {order}"
     try:
-        conn = open_conn(path)
-        cur = conn.cursor()
-        cur.execute(sql)
-        rows = cur.fetchall()
-        result: List[Dict[str, Any]] = []
-        for r in rows:
-            result.append({
-                "id": r["id"],
-                "fecha": r["fecha"],
-                "grupo_o_estudiante": r["grupo_o_estudiante"],
-                "nota_final": r["nota_final"],
-            })
-        return result
+        with get_conn(path) as conn:
+            cur = conn.cursor()
+            cur.execute(sql)
+            rows = cur.fetchall()
+            result: List[Dict[str, Any]] = []
+            for r in rows:
+                result.append({
+                    "id": r["id"],
+                    "fecha": r["fecha"],
+                    "grupo_o_estudiante": r["grupo_o_estudiante"],
+                    "nota_final": r["nota_final"],
+                })
+            return result
     except DBError:
         raise
     except Exception as ex:
         raise DBError(f"Error listando resumen: {ex}") from ex
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 
-def list_detalle(path: Optional[str] = None, filtro_texto: Optional[str] = None, fecha: Optional[str] = None, order: str = "DESC") -> List[Dict[str, Any]]:
+def fts_query(texto: str) -> Optional[str]:
+    """Convierte texto libre en una consulta FTS5 segura con coincidencia por prefijo.
+
+    Cada palabra se cita (para neutralizar la sintaxis de FTS5) y se marca como
+    prefijo: "proy impl" -> '"proy"* "impl"*' (todas las palabras deben aparecer).
+    Devuelve None si el texto no contiene palabras.
+    """
+    palabras = re.findall(r"\w+", texto)
+    if not palabras:
+        return None
+    return " ".join(f'"{p}"*' for p in palabras)
+
+
+def _detalle_filters(
+    conn: sqlite3.Connection,
+    filtro_texto: Optional[str],
+    fecha: Optional[str],
+    busqueda: str,
+) -> Tuple[str, List[str], List[Any], bool]:
+    """Construye (join, condiciones WHERE, parámetros, usa_fts) para los filtros del detalle."""
+    where_clauses: List[str] = []
+    params: List[Any] = []
+    join_sql = ""
+    uses_fts = False
+
+    match = fts_query(filtro_texto) if (filtro_texto and busqueda == "fts") else None
+    if match and has_fts(conn):
+        join_sql = f"JOIN {FTS_TABLE} ON {FTS_TABLE}.rowid = e.id"
+        where_clauses.append(f"{FTS_TABLE} MATCH ?")
+        params.append(match)
+        uses_fts = True
+    elif filtro_texto:
+        like = f"%{filtro_texto}%"
+        where_clauses.append("(e.curso LIKE ? OR e.evaluacion LIKE ? OR e.grupo_o_estudiante LIKE ? OR e.observaciones LIKE ?)")
+        params.extend([like, like, like, like])
+
+    if fecha:
+        where_clauses.append("e.fecha = ?")
+        params.append(fecha)
+
+    return join_sql, where_clauses, params, uses_fts
+
+
+@_instrumentado
+def list_detalle(
+    path: Optional[str] = None,
+    filtro_texto: Optional[str] = None,
+    fecha: Optional[str] = None,
+    order: str = "DESC",
+    busqueda: str = "like",
+) -> List[Dict[str, Any]]:
     """Devuelve detalles de evaluaciones con filtros opcionales.
 
     Args:
@@ -190,47 +791,477 @@ def list_detalle(path: Optional[str] = None, filtro_texto: Optional[str] = None,
         filtro_texto: texto para buscar en `curso`, `evaluacion`, `grupo_o_estudiante` o `observaciones`.
         fecha: filtrar por fecha exacta (string en el formato guardado en `fecha`).
         order: 'ASC' o 'DESC' para ordenar por `fecha`.
+        busqueda: 'like' busca `filtro_texto` como subcadena (LIKE, recorre toda la tabla);
+            'fts' usa el índice FTS5: busca palabras por prefijo, ignora tildes y ordena
+            por relevancia (y después por `fecha`). Si la BD no tiene índice FTS5 o el
+            texto no contiene palabras, se usa 'like'.
     """
     if order.upper() not in ("ASC", "DESC"):
         order = "DESC"
 
-    where_clauses: List[str] = []
-    params: List[Any] = []
+    try:
+        with get_conn(path) as conn:
+            join_sql, where_clauses, params, uses_fts = _detalle_filters(conn, filtro_texto, fecha, busqueda)
+            order_sql = f"e.fecha {order}"
+            if uses_fts:
+                order_sql = f"{FTS_TABLE}.rank, {order_sql}"
 
-    if filtro_texto:
-        like = f"%{filtro_texto}%"
-        where_clauses.append("(curso LIKE ? OR evaluacion LIKE ? OR grupo_o_estudiante LIKE ? OR observaciones LIKE ?)")
-        params.extend([like, like, like, like])
+            where_sql = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
 
-    if fecha:
-        where_clauses.append("fecha = ?")
-        params.append(fecha)
+            sql = f"SELECT e.* FROM evaluaciones e {join_sql} {where_sql} ORDER BY {order_sql}"
+
+            cur = conn.cursor()
+            cur.execute(sql, tuple(params))
+            rows = cur.fetchall()
+            result: List[Dict[str, Any]] = []
+            for r in rows:
+                # Con sqlite3.Row se puede acceder por nombre
+                result.append({k: r[k] for k in r.keys()})
+            return result
+    except DBError:
+        raise
+    except Exception as ex:
+        raise DBError(f"Error listando detalle: {ex}") from ex
+
+
+PageToken = Tuple[Optional[str], int]
+
+
+def _keyset_page(
+    conn: sqlite3.Connection,
+    select_sql: str,
+    where_clauses: List[str],
+    params: List[Any],
+    order: str,
+    page_size: int,
+    after: Optional[PageToken],
+) -> Tuple[List[Dict[str, Any]], Optional[PageToken]]:
+    """Lee una página ordenada por (fecha, id) empezando después de `after`.
+
+    SQLite ordena los NULL como el menor valor, así que las filas sin `fecha`
+    forman un tramo aparte (al final en DESC, al principio en ASC). Cada tramo
+    se consulta con su propia condición de rango para que el índice de `fecha`
+    pueda saltar directamente a la posición del token en lugar de usar OFFSET.
+    """
+    order = "ASC" if order.upper() == "ASC" else "DESC"
+    cmp = ">" if order == "ASC" else "<"
+    tramos = ["null", "valor"] if order == "ASC" else ["valor", "null"]
+
+    if after is None:
+        inicio, bound = 0, None
+    else:
+        inicio, bound = (tramos.index("null") if after[0] is None else tramos.index("valor")), after
+
+    rows: List[sqlite3.Row] = []
+    # Se pide una fila extra para saber si hay página siguiente
+    needed = page_size + 1
+    for tramo in tramos[inicio:]:
+        conds = list(where_clauses)
+        tramo_params = list(params)
+        if tramo == "null":
+            conds.append("e.fecha IS NULL")
+            if bound is not None:
+                conds.append(f"e.id {cmp} ?")
+                tramo_params.append(bound[1])
+        else:
+            conds.append("e.fecha IS NOT NULL")
+            if bound is not None:
+                conds.append(f"(e.fecha, e.id) {cmp} (?, ?)")
+                tramo_params.extend([bound[0], bound[1]])
+        where_sql = "WHERE " + " AND ".join(conds)
+        sql = f"{select_sql} {where_sql} ORDER BY e.fecha {order}, e.id {order} LIMIT ?"
+        tramo_params.append(needed - len(rows))
+        rows.extend(conn.execute(sql, tuple(tramo_params)).fetchall())
+        if len(rows) >= needed:
+            break
+        # El siguiente tramo se lee desde su inicio
+        bound = None
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    result = [{k: r[k] for k in r.keys()} for r in rows]
+    next_token: Optional[PageToken] = None
+    if has_more and result:
+        next_token = (result[-1]["fecha"], int(result[-1]["id"]))
+    return result, next_token
+
+
+@_instrumentado
+def list_resumen_page(
+    path: Optional[str] = None,
+    page_size: int = 50,
+    after: Optional[PageToken] = None,
+    order: str = "DESC",
+) -> Tuple[List[Dict[str, Any]], Optional[PageToken]]:
+    """Versión paginada (keyset) de `list_resumen`.
+
+    Args:
+        path: ruta opcional a la BD.
+        page_size: número máximo de filas por página.
+        after: token `(fecha, id)` de la última fila de la página anterior; None para la primera.
+        order: 'ASC' o 'DESC' para ordenar por `fecha` (desempate por `id`).
+
+    Returns:
+        (filas, siguiente_token); `siguiente_token` es None en la última página.
+    """
+    try:
+        with get_conn(path) as conn:
+            return _keyset_page(
+                conn,
+                "SELECT e.id, e.fecha, e.grupo_o_estudiante, e.nota_final FROM evaluaciones e",
+                [],
+                [],
+                order,
+                page_size,
+                after,
+            )
+    except DBError:
+        raise
+    except Exception as ex:
+        raise DBError(f"Error listando resumen paginado: {ex}") from ex
+
+
+@_instrumentado
+def list_detalle_page(
+    path: Optional[str] = None,
+    filtro_texto: Optional[str] = None,
+    fecha: Optional[str] = None,
+    order: str = "DESC",
+    busqueda: str = "like",
+    page_size: int = 50,
+    after: Optional[PageToken] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[PageToken]]:
+    """Versión paginada (keyset) de `list_detalle` con los mismos filtros.
+
+    A diferencia de `list_detalle`, con `busqueda='fts'` el índice FTS sólo se usa
+    para filtrar: las páginas se ordenan siempre por (fecha, id) para que el
+    token `after` sea estable.
 
+    Returns:
+        (filas, siguiente_token); `siguiente_token` es None en la última página.
+    """
+    try:
+        with get_conn(path) as conn:
+            join_sql, where_clauses, params, _uses_fts = _detalle_filters(conn, filtro_texto, fecha, busqueda)
+            return _keyset_page(
+                conn,
+                f"SELECT e.* FROM evaluaciones e {join_sql}",
+                where_clauses,
+                params,
+                order,
+                page_size,
+                after,
+            )
+    except DBError:
+        raise
+    except Exception as ex:
+        raise DBError(f"Error listando detalle paginado: {ex}") from ex
+
+
+def _metric_stats(n: int, total: float, sumsq: float, vmin: Any, vmax: Any) -> Dict[str, Any]:
+    """Calcula media y desviación típica muestral a partir de los acumulados."""
+    if n == 0:
+        return {"count": 0, "mean": None, "min": None, "max": None, "std": None}
+    mean = total / n
+    std = None
+    if n > 1:
+        var = max((sumsq - total * total / n) / (n - 1), 0.0)
+        std = math.sqrt(var)
+    return {"count": n, "mean": mean, "min": vmin, "max": vmax, "std": std}
+
+
+@_instrumentado
+def stats_por_grupo(
+    path: Optional[str] = None,
+    curso: Optional[str] = None,
+    evaluacion: Optional[str] = None,
+    plantilla: Optional[str] = None,
+    fecha: Optional[str] = None,
+    columnas: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Estadísticas por (curso, evaluacion, plantilla, fecha) leídas de `resumen_stats`.
+
+    La tabla se mantiene con triggers al insertar/actualizar/borrar, así que el
+    coste es proporcional al número de grupos y no al de evaluaciones. Es una
+    lectura pura: no toma el bloqueo de escritura. Si algún grupo tiene el
+    mínimo/máximo pendiente (`stale`, p.ej. tras cambios hechos por otra
+    herramienta), se calcula al vuelo con un SELECT sobre sus evaluaciones.
+
+    Args:
+        path: ruta opcional a la BD.
+        curso, evaluacion, plantilla, fecha: filtros opcionales por igualdad.
+        columnas: columnas a incluir (por defecto `nota_final` y los seis criterios).
+
+    Returns:
+        Una fila por grupo con las claves del grupo, `n` (evaluaciones) y, por
+        cada columna `m`, las columnas `m_count`, `m_mean`, `m_min`, `m_max` y
+        `m_std` (desviación típica muestral; None con menos de 2 valores).
+    """
+    columnas = [m for m in (columnas or STATS_METRICS) if m in STATS_METRICS]
+    filtros = {"curso": curso, "evaluacion": evaluacion, "plantilla": plantilla, "fecha": fecha}
+    where_clauses = [f"{k} = ?" for k, v in filtros.items() if v is not None]
+    params = [v for v in filtros.values() if v is not None]
     where_sql = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    cols = ", ".join(
+        STATS_GROUP + ["n", "stale"] + [f"{m}_{c}" for m in columnas for c in ("n", "sum", "sumsq", "min", "max")]
+    )
+    sql = f"SELECT {cols} FROM {STATS_TABLE} {where_sql} ORDER BY fecha DESC, curso, evaluacion"
+    try:
+        with get_conn(path) as conn:
+            filas = conn.execute(sql, tuple(params)).fetchall()
+            # Mínimos/máximos pendientes tras bajas o cambios (ver migración 4)
+            pendientes: Dict[Tuple[Any, ...], sqlite3.Row] = {}
+            if any(r["stale"] for r in filas):
+                pendientes = {tuple(r[c] for c in STATS_GROUP): r for r in conn.execute(stats_minmax_sql())}
+            result: List[Dict[str, Any]] = []
+            for r in filas:
+                item: Dict[str, Any] = {k: r[k] for k in STATS_GROUP}
+                item["n"] = r["n"]
+                extremos = pendientes.get(tuple(item[c] for c in STATS_GROUP), r) if r["stale"] else r
+                for m in columnas:
+                    st = _metric_stats(
+                        r[f"{m}_n"], r[f"{m}_sum"], r[f"{m}_sumsq"], extremos[f"{m}_min"], extremos[f"{m}_max"]
+                    )
+                    for k, v in st.items():
+                        item[f"{m}_{k}"] = v
+                result.append(item)
+            return result
+    except DBError:
+        raise
+    except Exception as ex:
+        raise DBError(f"Error leyendo estadísticas: {ex}") from ex
+
 
-    sql = f"SELECT * FROM evaluaciones {where_sql} ORDER BY fecha {order}"
+@_instrumentado
+def rebuild_stats(path: Optional[str] = None) -> int:
+    """Recalcula `resumen_stats` desde cero (p.ej. para eliminar deriva de redondeo).
 
+    Returns:
+        Número de grupos resultantes.
+    """
     try:
-        conn = open_conn(path)
-        cur = conn.cursor()
-        cur.execute(sql, tuple(params))
-        rows = cur.fetchall()
-        result: List[Dict[str, Any]] = []
-        for r in rows:
-            # Con sqlite3.Row se puede acceder por nombre
-            result.append({k: r[k] for k in r.keys()})
-        return result
+        with get_conn(path) as conn:
+            begin_immediate(conn)
+            conn.execute(f"DELETE FROM {STATS_TABLE}")
+            conn.execute(stats_rebuild_sql())
+            conn.commit()
+            return int(conn.execute(f"SELECT COUNT(*) FROM {STATS_TABLE}").fetchone()[0])
     except DBError:
         raise
     except Exception as ex:
-        raise DBError(f"Error listando detalle: {ex}") from ex
-    finally:
+        raise DBError(f"Error recalculando estadísticas: {ex}") from ex
+
+
+def _delta_stats(deltas: np.ndarray) -> Dict[str, Any]:
+    """Resumen de la distribución de cambios de nota (nuevo - anterior)."""
+    if deltas.size == 0:
+        return {"n": 0}
+    edges = [-np.inf, -1.0, -0.5, -0.1, -0.005, 0.005, 0.1, 0.5, 1.0, np.inf]
+    labels = ["<-1", "-1..-0.5", "-0.5..-0.1", "-0.1..0", "0", "0..0.1", "0.1..0.5", "0.5..1", ">1"]
+    counts, _ = np.histogram(deltas, bins=edges)
+    p5, p50, p95 = np.percentile(deltas, [5, 50, 95])
+    return {
+        "n": int(deltas.size),
+        "mean": round(float(deltas.mean()), 4),
+        "std": round(float(deltas.std()), 4),
+        "min": round(float(deltas.min()), 2),
+        "max": round(float(deltas.max()), 2),
+        "p5": round(float(p5), 2),
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "histograma": dict(zip(labels, counts.tolist())),
+    }
+
+
+@_instrumentado
+def recalcular_notas(
+    plantilla: str,
+    pesos: Optional[Dict[str, int]] = None,
+    path: Optional[str] = None,
+    dry_run: bool = False,
+    chunk_size: int = 5000,
+    forzar_pesos: bool = False,
+) -> Dict[str, Any]:
+    """Vuelve a calcular `nota_final` de todas las filas de una plantilla.
+
+    Lee por bloques de `chunk_size` filas (keyset por id), calcula las notas con
+    `utils.nota_final_batch` y, salvo en `dry_run`, actualiza sólo las filas que
+    cambian con una transacción por bloque. Las filas con alguna nota fuera de
+    1..5 (p.ej. 0 como "no aplica") se cuentan como errores y no se tocan.
+
+    Args:
+        plantilla: valor de la columna `plantilla` a recalcular.
+        pesos: pesos a aplicar; por defecto los actuales de `TEMPLATES[plantilla]`.
+            Con `dry_run=True` sirve para simular ("what-if") unos pesos propuestos.
+        path: ruta opcional a la BD.
+        dry_run: si es True no escribe nada y sólo devuelve la distribución de cambios.
+        chunk_size: filas por bloque/transacción.
+        forzar_pesos: permite escribir con `pesos` distintos de los de
+            `TEMPLATES[plantilla]`. Sin él se rechazan, porque la app calcula
+            las notas nuevas con los de `TEMPLATES` y las guardadas quedarían
+            inconsistentes.
+
+    Returns:
+        dict con `plantilla`, `filas`, `cambiadas`, `errores`, `dry_run` y `delta`
+        (distribución de nuevo - anterior sobre las filas que tenían nota).
+
+    Raises:
+        DBError si la plantilla o los pesos no son válidos o falla la BD. Al
+        escribir, también si los pesos no suman 100 o, sin `forzar_pesos`,
+        no son los de `TEMPLATES[plantilla]`.
+    """
+    canonicos = TEMPLATES.get(plantilla, {}).get("pesos")
+    if pesos is None:
+        if canonicos is None:
+            raise DBError(f"Plantilla desconocida: {plantilla}. Indica los pesos explícitamente.")
+        pesos = canonicos
+    if not dry_run:
+        if sum(pesos.values()) != 100:
+            raise DBError(f"Los pesos suman {sum(pesos.values())}, no 100; no se escribe nada")
+        if pesos != canonicos and not forzar_pesos:
+            raise DBError(
+                f"Los pesos indicados no son los de la plantilla {plantilla} en TEMPLATES; "
+                "simúlalos con dry_run o escríbelos explícitamente con forzar_pesos"
+            )
+    desconocidos = [k for k in pesos if k not in NUMERIC_COLUMNS or k == "nota_final"]
+    if desconocidos:
+        raise DBError(f"Criterios desconocidos en los pesos: {desconocidos}")
+
+    criterios = list(pesos)
+    select_sql = (
+        f"SELECT id, nota_final, {', '.join(criterios)} FROM evaluaciones "
+        "WHERE plantilla = ? AND id > ? ORDER BY id LIMIT ?"
+    )
+    filas = cambiadas = errores = 0
+    deltas: List[np.ndarray] = []
+    last_id = 0
+    try:
+        with get_conn(path) as conn:
+            while True:
+                chunk = conn.execute(select_sql, (plantilla, last_id, chunk_size)).fetchall()
+                if not chunk:
+                    break
+                last_id = chunk[-1][0]
+                data = np.array([tuple(r) for r in chunk], dtype=float)
+                ids, anteriores, scores = data[:, 0], data[:, 1], data[:, 2:]
+                nuevas, err = nota_final_batch(scores, pesos)
+                filas += len(chunk)
+                errores += int(err.sum())
+
+                ok = ~err
+                con_nota = ok & ~np.isnan(anteriores)
+                deltas.append(nuevas[con_nota] - anteriores[con_nota])
+                # Redondeo a 2 decimales en ambos lados: comparar con tolerancia
+                cambia = ok & (np.isnan(anteriores) | (np.abs(nuevas - anteriores) > 1e-9))
+                cambiadas += int(cambia.sum())
+
+                if not dry_run and cambia.any():
+                    begin_immediate(conn)
+                    conn.executemany(
+                        "UPDATE evaluaciones SET nota_final = ? WHERE id = ?",
+                        zip(nuevas[cambia].tolist(), ids[cambia].astype(int).tolist()),
+                    )
+                    conn.commit()
+            if not dry_run and cambiadas:
+                # Mínimos/máximos pendientes: una vez al final, no en cada bloque
+                begin_immediate(conn)
+                refrescar_stats(conn)
+                conn.commit()
+    except DBError:
+        raise
+    except Exception as ex:
+        raise DBError(f"Error recalculando notas: {ex}") from ex
+
+    todas = np.concatenate(deltas) if deltas else np.array([])
+    return {
+        "plantilla": plantilla,
+        "filas": filas,
+        "cambiadas": cambiadas,
+        "errores": errores,
+        "dry_run": dry_run,
+        "delta": _delta_stats(todas),
+    }
+
+
+# Caracteres que `str.splitlines()` trata como salto de línea
+_LINE_BREAKS = re.compile("[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+EXPORT_SQL = "SELECT * FROM evaluaciones ORDER BY fecha DESC"
+
+
+def _sanitize_obs(s: str) -> str:
+    """Une las líneas no vacías de `s` con ' | ' (una línea por celda para Excel)."""
+    if not _LINE_BREAKS.search(s):
+        return s.strip()
+    return " | ".join([p.strip() for p in s.splitlines() if p.strip()])
+
+
+@_instrumentado
+def stream_export_csv(
+    out: Path,
+    path: Optional[str] = None,
+    sql: str = EXPORT_SQL,
+    chunk_size: int = 5000,
+) -> Dict[str, Any]:
+    """Exporta el resultado de `sql` a CSV leyendo y escribiendo por bloques.
+
+    Lee con `fetchmany(chunk_size)` y escribe cada bloque en cuanto llega, así
+    que la memoria no depende del tamaño de la tabla. Si la consulta incluye
+    `observaciones`, esa columna se escribe sanitizada (una línea, bloque a
+    bloque) y se añade `observaciones_raw` al final con el texto original. El
+    fichero se escribe con BOM UTF-8 para mejorar la compatibilidad con
+    Excel/Windows, en un temporal del mismo directorio que sustituye a `out`
+    con `os.replace` al terminar: un error a mitad no deja un CSV truncado.
+
+    Returns:
+        dict con `path`, `rows`, `seconds` y `rows_per_sec`.
+    """
+    start = time.perf_counter()
+    rows_written = 0
+    with get_conn(path) as conn:
+        cur = conn.execute(sql)
+        columns = [d[0] for d in cur.description]
+        obs_idx = columns.index("observaciones") if "observaciones" in columns else None
+        header = columns + (["observaciones_raw"] if obs_idx is not None else [])
+        out = Path(out)
+        tmp = tempfile.NamedTemporaryFile(
+            "w", dir=str(out.parent), prefix=out.name, suffix=".tmp", delete=False, encoding="utf-8-sig", newline=""
+        )
         try:
-            conn.close()
-        except Exception:
-            pass
+            with tmp as fh:
+                # Mismo fin de línea que usaba `DataFrame.to_csv` (os.linesep)
+                writer = csv.writer(fh, lineterminator=os.linesep)
+                writer.writerow(header)
+                while True:
+                    chunk = cur.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    if obs_idx is None:
+                        writer.writerows(chunk)
+                    else:
+                        raws = ["" if r[obs_idx] is None else str(r[obs_idx]) for r in chunk]
+                        sanitized = [_sanitize_obs(r) for r in raws]
+                        writer.writerows(
+                            (*r[:obs_idx], clean, *r[obs_idx + 1:], raw)
+                            for r, clean, raw in zip(chunk, sanitized, raws)
+                        )
+                    rows_written += len(chunk)
+            os.replace(tmp.name, out)
+        except BaseException:
+            Path(tmp.name).unlink(missing_ok=True)
+            raise
+    seconds = time.perf_counter() - start
+    stats = {
+        "path": str(out),
+        "rows": rows_written,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows_written / seconds, 1) if seconds > 0 else float(rows_written),
+    }
+    logger.info("Exportadas %d filas a %s en %.3fs (%.0f filas/s)", rows_written, out, seconds, stats["rows_per_sec"])
+    return stats
 
 
+@_instrumentado
 def export_csv(path: Optional[str] = None, out_path: Optional[str] = None) -> str:
     """Exporta todas las filas de `evaluaciones` a CSV y devuelve la ruta escrita.
 
@@ -241,32 +1272,20 @@ def export_csv(path: Optional[str] = None, out_path: Optional[str] = None) -> st
         Ruta al fichero CSV creado.
     """
     try:
-        conn = open_conn(path)
-        df = pd.read_sql_query("SELECT * FROM evaluaciones ORDER BY fecha DESC", conn)
         data_dir = Path(__file__).resolve().parent / "data"
         data_dir.mkdir(exist_ok=True)
         if out_path:
             out = Path(out_path)
         else:
             out = data_dir / "evaluaciones_export.csv"
-        # Conservar versión RAW (con saltos) y crear versión sanitizada para Excel
-        if "observaciones" in df.columns:
-            df["observaciones_raw"] = df["observaciones"].fillna("").astype(str)
-            df["observaciones"] = df["observaciones_raw"].apply(lambda s: " | ".join([p.strip() for p in s.splitlines() if p.strip()]))
-        # Escribir con BOM UTF-8 para mejorar compatibilidad con Excel/Windows
-        df.to_csv(out, index=False, encoding="utf-8-sig")
-        return str(out)
+        return stream_export_csv(out, path=path)["path"]
     except DBError:
         raise
     except Exception as ex:
         raise DBError(f"Error exportando CSV: {ex}") from ex
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 
+@_instrumentado
 def backup_csv_timestamp(path: Optional[str] = None, out_dir: Optional[str] = None) -> str:
     """Exporta todas las filas de `evaluaciones` a un CSV con timestamp en data/backup_YYYYMMDD_HHMMSS.csv.
 
@@ -281,36 +1300,25 @@ def backup_csv_timestamp(path: Optional[str] = None, out_dir: Optional[str] = No
         DBError en caso de fallo.
     """
     try:
-        conn = open_conn(path)
-        df = pd.read_sql_query("SELECT * FROM evaluaciones ORDER BY fecha DESC", conn)
         base_dir = Path(__file__).resolve().parent / "data"
         if out_dir:
             base_dir = Path(out_dir)
         base_dir.mkdir(parents=True, exist_ok=True)
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         out = base_dir / f"backup_{ts}.csv"
-        # Conservar versión RAW (con saltos) y crear versión sanitizada para Excel
-        if "observaciones" in df.columns:
-            df["observaciones_raw"] = df["observaciones"].fillna("").astype(str)
-            df["observaciones"] = df["observaciones_raw"].apply(lambda s: " | ".join([p.strip() for p in s.splitlines() if p.strip()]))
-        # Escribir con BOM UTF-8 para mejorar compatibilidad con Excel/Windows
-        df.to_csv(out, index=False, encoding="utf-8-sig")
-        return str(out)
+        return stream_export_csv(out, path=path)["path"]
     except DBError:
         raise
     except Exception as ex:
         raise DBError(f"Error creando backup CSV: {ex}") from ex
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 
+@_instrumentado
 def seed_demo(path: Optional[str] = None) -> List[int]:
     """Inserta 5 registros de ejemplo para pruebas y devuelve la lista de ids.
 
     No se ejecuta automáticamente — debe llamarse explícitamente desde la UI.
+    Los registros que ya existan (misma clave natural) no se duplican.
     """
     demo_items: List[Dict[str, Any]] = [
         {
@@ -385,18 +1393,11 @@ def seed_demo(path: Optional[str] = None) -> List[int]:
         }
     ]
 
-    inserted_ids: List[int] = []
     try:
-        for itm in demo_items:
-            try:
-                new_id = insert_evaluacion(itm, path=path)
-                inserted_ids.append(new_id)
-            except Exception as ex:
-                # Continuar intentando insertar los demás, pero registrar el error
-                # Re-lanzamos al final si no se insertó ninguno
-                continue
+        result = insert_evaluaciones_bulk(demo_items, path=path, on_conflict="skip")
+        inserted_ids: List[int] = result["ids"]
 
-        if not inserted_ids:
+        if not inserted_ids and not result["omitidas"]:
             raise DBError("No se pudieron insertar registros demo")
 
         return inserted_ids
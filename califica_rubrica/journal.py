@@ -0,0 +1,363 @@
+"""Diario CSV de sólo anexado para el modo "Sólo CSV".
+
+`data/evaluaciones_only_csv.csv` recibe filas de varias sesiones de Streamlit
+(y potencialmente de varios procesos). Antes cada guardado reabría el fichero
+con `DataFrame.to_csv(mode="a")`, escribía un BOM en mitad del fichero en
+algunos casos y dos sesiones podían intercalar líneas a medias.
+
+`CsvJournal` mantiene un único descriptor abierto en modo `O_APPEND` por fichero
+y proceso (ver `get_journal`). Cada lote de filas se codifica en memoria y se
+escribe de una vez con el fichero bloqueado (`fcntl.flock`), de modo que un
+lote nunca queda mezclado con el de otra sesión. La cabecera (con BOM UTF-8
+para Excel) sólo se escribe si el fichero está vacío.
+
+`compact()` reescribe el diario como un CSV limpio (columnas del diario, sin BOMs
+intermedios ni registros truncados) en un temporal que sustituye al original
+con `os.replace`. Las filas anexadas por versiones anteriores de la app con
+otra disposición (`LEGACY_LAYOUTS`) se migran a las columnas del diario; las
+que no encajan en ninguna se guardan aparte en `<nombre>.descartadas.csv` en
+lugar de perderse.
+
+Uso desde la línea de comandos (desde `califica_rubrica/`):
+
+    python journal.py compact [data/evaluaciones_only_csv.csv] [--out limpio.csv]
+"""
+
+from pathlib import Path
+import argparse
+import atexit
+import csv
+import io
+import os
+import sys
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+try:  # bloqueo entre procesos; en Windows sólo se serializan los hilos del proceso
+    import fcntl
+except ImportError:  # pragma: no cover - depende de la plataforma
+    fcntl = None
+
+
+JOURNAL_DEFAULT = Path(__file__).resolve().parent / "data" / "evaluaciones_only_csv.csv"
+JOURNAL_COLUMNS = [
+    "plantilla", "curso", "evaluacion", "fecha", "grupo_o_estudiante",
+    "estructura", "programacion", "teoria", "ia", "reflexion", "presentacion",
+    "nota_final", "observaciones", "created_at",
+]
+# Filas que la app anexaba antes del diario con `to_csv(mode="a", header=False)`,
+# sin cabecera propia: se reconocen por su número de campos
+LEGACY_LAYOUTS = {
+    # guardar roster
+    7: ["plantilla", "curso", "evaluacion", "fecha", "grupo_o_estudiante", "nota_final", "observaciones"],
+    # evaluaciones demo
+    13: [
+        "curso", "evaluacion", "fecha", "grupo_o_estudiante", "estructura", "programacion", "teoria",
+        "ia", "reflexion", "presentacion", "nota_final", "observaciones", "plantilla",
+    ],
+}
+FSYNC_POLICIES = ("always", "close", "never")
+BOM = "\ufeff"
+
+
+class JournalError(Exception):
+    """Error de escritura o compactación del diario CSV."""
+
+
+def _encode(rows: Iterable[Sequence[Any]]) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for values in rows:
+        writer.writerow(["" if v is None else v for v in values])
+    return out.getvalue().encode("utf-8")
+
+
+def _ends_with_newline(fd: int, size: int) -> bool:
+    if not hasattr(os, "pread"):  # pragma: no cover - Windows
+        return True
+    return os.pread(fd, 1, size - 1) == b"\n"
+
+
+class CsvJournal:
+    """Escritor de sólo anexado sobre un CSV compartido.
+
+    Args:
+        path: fichero del diario (se crea con su cabecera si no existe).
+        columns: columnas del CSV; de cada fila se toman por nombre y las que
+            falten quedan vacías.
+        fsync: 'always' = `os.fsync` tras cada lote, 'close' = sólo al cerrar,
+            'never' = lo decide el sistema operativo.
+        max_pending: filas acumuladas con `append(..., flush=False)` a partir de
+            las cuales se escribe el lote igualmente.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        columns: Sequence[str] = JOURNAL_COLUMNS,
+        fsync: str = "always",
+        max_pending: int = 500,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise JournalError(f"Política de fsync no soportada: {fsync}")
+        self.path = Path(path)
+        self.columns: List[str] = list(columns)
+        self.fsync = fsync
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._pending: List[tuple] = []
+        self._header_ok = False
+        self._closed = False
+
+    # -- descriptor y bloqueo -------------------------------------------------
+
+    def _open(self) -> int:
+        if self._fd is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(str(self.path), os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _drop_fd(self) -> None:
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+        self._header_ok = False
+
+    def _header_matches(self) -> bool:
+        """True si el fichero está vacío o su cabecera son las columnas del diario."""
+        with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+            header = next(csv.reader(f), None)
+        return header is None or [h.lstrip(BOM) for h in header] == self.columns
+
+    def _lock_file(self) -> int:
+        """Abre (o reabre) el fichero y lo bloquea en exclusiva.
+
+        Si otro proceso lo compactó mientras esperábamos el bloqueo, el descriptor
+        apunta al fichero antiguo: se reabre sobre el nuevo. Un fichero heredado
+        con otras columnas se compacta antes de anexarle nada.
+        """
+        while True:
+            fd = self._open()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                actual = os.stat(self.path)
+                mismo = os.path.samestat(actual, os.fstat(fd))
+            except FileNotFoundError:
+                mismo = False
+            if mismo and (self._header_ok or self._header_matches()):
+                self._header_ok = True
+                return fd
+            if mismo:
+                self._compact_locked(self.path)
+            self._unlock_file(fd)
+            self._drop_fd()
+
+    @staticmethod
+    def _unlock_file(fd: int) -> None:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _write_all(self, fd: int, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            n = os.write(fd, view)
+            view = view[n:]
+
+    # -- escritura --------------------------------------------------------------
+
+    def append(self, rows: Iterable[Dict[str, Any]], flush: bool = True) -> int:
+        """Añade `rows` al diario.
+
+        Con `flush=True` (lo habitual) todas las filas pendientes se escriben ya
+        como un único lote; con `flush=False` se acumulan hasta `max_pending` o
+        hasta el siguiente `flush()`.
+
+        Returns:
+            Número de filas añadidas.
+        """
+        values = [tuple(r.get(c) for c in self.columns) for r in rows]
+        with self._lock:
+            if self._closed:
+                raise JournalError(f"El diario {self.path} está cerrado")
+            self._pending.extend(values)
+            if flush or len(self._pending) >= self.max_pending:
+                self._flush_locked()
+        return len(values)
+
+    def flush(self) -> None:
+        """Escribe las filas pendientes como un único lote."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._pending:
+            return
+        data = _encode(self._pending)
+        try:
+            fd = self._lock_file()
+            try:
+                size = os.fstat(fd).st_size
+                if size == 0:
+                    data = BOM.encode("utf-8") + _encode([self.columns]) + data
+                elif not _ends_with_newline(fd, size):
+                    # Registro truncado por una caída: no pegarle el lote nuevo
+                    data = b"\n" + data
+                self._write_all(fd, data)
+                if self.fsync == "always":
+                    os.fsync(fd)
+            finally:
+                self._unlock_file(fd)
+        except (OSError, csv.Error, UnicodeDecodeError) as ex:
+            raise JournalError(f"No se pudo escribir en el diario {self.path}: {ex}") from ex
+        self._pending = []
+
+    def close(self) -> None:
+        """Escribe lo pendiente, sincroniza según la política y cierra el descriptor."""
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._flush_locked()
+                if self._fd is not None and self.fsync != "never":
+                    os.fsync(self._fd)
+            finally:
+                self._drop_fd()
+                self._closed = True
+
+    # -- compactación -----------------------------------------------------------
+
+    def compact(self, out: Optional[str] = None) -> Dict[str, Any]:
+        """Reescribe el diario como un CSV limpio de forma atómica.
+
+        Las filas se leen por la cabecera del fichero (o, si su número de campos
+        no coincide, por la disposición antigua de `LEGACY_LAYOUTS` con ese
+        número de campos) y se escriben con las columnas del diario. Se quitan
+        BOMs intermedios y líneas vacías; las filas que no encajan en ninguna
+        disposición (p.ej. registros truncados) van a `<nombre>.descartadas.csv`.
+
+        Raises:
+            JournalError si el fichero no se puede leer, decodificar o reescribir.
+
+        Args:
+            out: fichero de salida; por defecto se reemplaza el propio diario.
+
+        Returns:
+            dict con `filas`, `descartadas`, `ruta` y `ruta_descartadas` (o None).
+        """
+        with self._lock:
+            self._flush_locked()
+            if not self.path.exists():
+                return {"filas": 0, "descartadas": 0, "ruta": str(self.path), "ruta_descartadas": None}
+            destino = Path(out) if out else self.path
+            try:
+                fd = self._lock_file()
+                try:
+                    return self._compact_locked(destino)
+                finally:
+                    self._unlock_file(fd)
+                    if destino == self.path:
+                        # El descriptor apunta al fichero reemplazado
+                        self._drop_fd()
+            except (OSError, csv.Error, UnicodeDecodeError) as ex:
+                raise JournalError(f"No se pudo compactar el diario {self.path}: {ex}") from ex
+
+    def _compact_locked(self, destino: Path) -> Dict[str, Any]:
+        with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.reader(f)
+            header = [h.lstrip(BOM) for h in next(reader, [])]
+            disposiciones = dict(LEGACY_LAYOUTS)
+            disposiciones[len(self.columns)] = self.columns
+            filas: List[tuple] = []
+            descartadas: List[List[str]] = []
+            for row in reader:
+                if row:
+                    row[0] = row[0].lstrip(BOM)
+                if not any(v.strip() for v in row):
+                    continue
+                columnas = header if len(row) == len(header) else disposiciones.get(len(row))
+                if columnas is None:
+                    descartadas.append(row)
+                    continue
+                registro = dict(zip(columnas, row))
+                filas.append(tuple(registro.get(c) for c in self.columns))
+
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile("wb", dir=str(destino.parent), prefix=destino.name, suffix=".tmp", delete=False)
+        try:
+            with tmp:
+                tmp.write(BOM.encode("utf-8") + _encode([self.columns]) + _encode(filas))
+                tmp.flush()
+                if self.fsync != "never":
+                    os.fsync(tmp.fileno())
+            os.replace(tmp.name, destino)
+        except BaseException:
+            Path(tmp.name).unlink(missing_ok=True)
+            raise
+
+        ruta_descartadas = None
+        if descartadas:
+            ruta_descartadas = destino.with_name(destino.stem + ".descartadas.csv")
+            with open(ruta_descartadas, "a", encoding="utf-8", newline="") as f:
+                csv.writer(f, lineterminator="\n").writerows(descartadas)
+        return {
+            "filas": len(filas),
+            "descartadas": len(descartadas),
+            "ruta": str(destino),
+            "ruta_descartadas": str(ruta_descartadas) if ruta_descartadas else None,
+        }
+
+
+_JOURNALS: Dict[str, CsvJournal] = {}
+_JOURNALS_LOCK = threading.Lock()
+
+
+def get_journal(path: Optional[str] = None, fsync: str = "always") -> CsvJournal:
+    """Devuelve el diario compartido de `path` (un único descriptor por proceso)."""
+    key = str(Path(path).resolve() if path else JOURNAL_DEFAULT)
+    with _JOURNALS_LOCK:
+        journal = _JOURNALS.get(key)
+        if journal is None or journal._closed:
+            journal = CsvJournal(key, fsync=fsync)
+            _JOURNALS[key] = journal
+        return journal
+
+
+def close_all() -> None:
+    """Cierra todos los diarios abiertos. Se registra con `atexit`."""
+    with _JOURNALS_LOCK:
+        journals = list(_JOURNALS.values())
+        _JOURNALS.clear()
+    for journal in journals:
+        journal.close()
+
+
+atexit.register(close_all)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Diario CSV del modo 'Sólo CSV'")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_compact = sub.add_parser("compact", help="Reescribir el diario como un CSV limpio")
+    p_compact.add_argument("file", nargs="?", default=str(JOURNAL_DEFAULT), help="Fichero del diario")
+    p_compact.add_argument("--out", default=None, help="Fichero de salida (por defecto, reemplaza el diario)")
+
+    args = parser.parse_args(argv)
+    try:
+        res = CsvJournal(args.file).compact(args.out)
+    except JournalError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Compactado {args.file} -> {res['ruta']}: {res['filas']} filas")
+    if res["descartadas"]:
+        print(f"{res['descartadas']} filas no encajaban y se guardaron en {res['ruta_descartadas']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""Métricas locales (contadores, medidores e histogramas) en formato Prometheus.
+
+`db.py`, `app.py` y `tools/load_csv_to_sqlite.py` informan aquí de lo que hacen
+(llamadas a la BD y su latencia, filas escritas y exportadas, esperas por el
+bloqueo de escritura, duración de los reruns, sesiones activas, evaluaciones
+guardadas...). El registro se expone sin servicios externos:
+
+- `servir(puerto)`: endpoint HTTP local con el formato de texto de Prometheus
+  en `/metrics` (hilo en segundo plano);
+- `escribir(path)` / `volcar_periodicamente(path, intervalo)`: el mismo texto en
+  un fichero, reemplazado de forma atómica (válido para el *textfile
+  collector* de node_exporter o para inspeccionarlo a mano).
+
+Mientras ningún exportador está en marcha (ni se llamó a `activar()`), las
+funciones instrumentadas sólo comprueban `activas()`. `iniciar_desde_entorno()`
+arranca los exportadores según `CALIFICA_METRICS_PORT`, `CALIFICA_METRICS_FILE`
+y `CALIFICA_METRICS_INTERVAL` (segundos, 15 por defecto).
+"""
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import abc
+import atexit
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_DEFAULT = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_ACTIVAS = False
+_REGISTRO: Dict[str, "_Metrica"] = {}
+_REGISTRO_LOCK = threading.Lock()
+
+Etiquetas = Tuple[str, ...]
+
+
+def activas() -> bool:
+    return _ACTIVAS
+
+
+def activar(valor: bool = True) -> None:
+    """Activa (o desactiva) la recogida de métricas sin arrancar ningún exportador."""
+    global _ACTIVAS
+    _ACTIVAS = valor
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formato(v: float) -> str:
+    v = float(v)
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return str(int(v)) if v.is_integer() and abs(v) < 1e15 else repr(v)
+
+
+class _Metrica(abc.ABC):
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> None:
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas: Etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _clave(self, valores: Dict[str, str]) -> Etiquetas:
+        if set(valores) != set(self.etiquetas):
+            raise ValueError(f"{self.nombre}: etiquetas esperadas {self.etiquetas}, recibidas {tuple(valores)}")
+        return tuple(str(valores[k]) for k in self.etiquetas)
+
+    def _etiquetas_txt(self, clave: Etiquetas, extra: Iterable[Tuple[str, str]] = ()) -> str:
+        pares = list(zip(self.etiquetas, clave)) + list(extra)
+        if not pares:
+            return ""
+        return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+    @abc.abstractmethod
+    def lineas(self) -> List[str]:
+        ...
+
+
+class Contador(_Metrica):
+    """Valor que sólo crece (p.ej. filas insertadas); se expone como `<nombre>_total`."""
+
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> None:
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Etiquetas, float] = {}
+
+    def inc(self, valor: float = 1.0, **etiquetas: str) -> None:
+        if valor < 0:
+            raise ValueError("Un contador no puede decrecer")
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0.0) + valor
+
+    def valor(self, **etiquetas: str) -> float:
+        with self._lock:
+            return self._valores.get(self._clave(etiquetas), 0.0)
+
+    def lineas(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._valores.items())
+        return [f"{self.nombre}_total{self._etiquetas_txt(k)} {_formato(v)}" for k, v in items]
+
+
+class Medidor(_Metrica):
+    """Valor que sube y baja; con `funcion` se calcula en el momento de exponerlo."""
+
+    tipo = "gauge"
+
+    def __init__(
+        self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), funcion: Optional[Callable[[], float]] = None
+    ) -> None:
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Etiquetas, float] = {}
+        self.funcion = funcion
+
+    def set(self, valor: float, **etiquetas: str) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = float(valor)
+
+    def lineas(self) -> List[str]:
+        if self.funcion is not None:
+            try:
+                return [f"{self.nombre} {_formato(self.funcion())}"]
+            except Exception:
+                logger.exception("No se pudo calcular la métrica %s", self.nombre)
+                return []
+        with self._lock:
+            items = sorted(self._valores.items())
+        return [f"{self.nombre}{self._etiquetas_txt(k)} {_formato(v)}" for k, v in items]
+
+
+class Histograma(_Metrica):
+    """Distribución de valores (p.ej. latencias en segundos) en cubetas acumuladas."""
+
+    tipo = "histogram"
+
+    def __init__(
+        self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_DEFAULT
+    ) -> None:
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        # clave -> [cuentas por cubeta (+Inf al final), suma, número]
+        self._datos: Dict[Etiquetas, list] = {}
+
+    def observe(self, valor: float, **etiquetas: str) -> None:
+        clave = self._clave(etiquetas)
+        i = bisect_left(self.buckets, valor)
+        with self._lock:
+            datos = self._datos.get(clave)
+            if datos is None:
+                datos = self._datos[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            datos[0][i] += 1
+            datos[1] += valor
+            datos[2] += 1
+
+    def cuenta(self, **etiquetas: str) -> int:
+        with self._lock:
+            datos = self._datos.get(self._clave(etiquetas))
+            return datos[2] if datos else 0
+
+    def lineas(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(d[0]), d[1], d[2])) for k, d in self._datos.items())
+        out = []
+        for clave, (cuentas, suma, n) in items:
+            acumulado = 0
+            for borde, c in zip(list(self.buckets) + [math.inf], cuentas):
+                acumulado += c
+                out.append(f"{self.nombre}_bucket{self._etiquetas_txt(clave, [('le', _formato(borde))])} {acumulado}")
+            out.append(f"{self.nombre}_sum{self._etiquetas_txt(clave)} {_formato(suma)}")
+            out.append(f"{self.nombre}_count{self._etiquetas_txt(clave)} {n}")
+        return out
+
+
+def _registrar(metrica: _Metrica) -> _Metrica:
+    with _REGISTRO_LOCK:
+        existente = _REGISTRO.get(metrica.nombre)
+        if existente is not None:
+            if type(existente) is not type(metrica) or existente.etiquetas != metrica.etiquetas:
+                raise ValueError(f"La métrica {metrica.nombre} ya existe con otro tipo o etiquetas")
+            return existente
+        _REGISTRO[metrica.nombre] = metrica
+        return metrica
+
+
+def contador(nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Contador:
+    """Devuelve el contador `nombre`, creándolo la primera vez."""
+    return _registrar(Contador(nombre, ayuda, etiquetas))
+
+
+def medidor(
+    nombre: str, ayuda: str, etiquetas: Sequence[str] = (), funcion: Optional[Callable[[], float]] = None
+) -> Medidor:
+    """Devuelve el medidor `nombre`, creándolo la primera vez."""
+    return _registrar(Medidor(nombre, ayuda, etiquetas, funcion))
+
+
+def histograma(
+    nombre: str, ayuda: str, etiquetas: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_DEFAULT
+) -> Histograma:
+    """Devuelve el histograma `nombre`, creándolo la primera vez."""
+    return _registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+
+def texto() -> str:
+    """Todas las métricas registradas en el formato de texto de Prometheus."""
+    with _REGISTRO_LOCK:
+        metricas = sorted(_REGISTRO.values(), key=lambda m: m.nombre)
+    out: List[str] = []
+    for m in metricas:
+        lineas = m.lineas()
+        if not lineas:
+            continue
+        nombre = f"{m.nombre}_total" if isinstance(m, Contador) else m.nombre
+        out.append(f"# HELP {nombre} {m.ayuda}")
+        out.append(f"# TYPE {nombre} {m.tipo}")
+        out.extend(lineas)
+    return "\n".join(out) + "\n"
+
+
+# -- exportadores -------------------------------------------------------------------
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802 - nombre fijado por BaseHTTPRequestHandler
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        cuerpo = texto().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def servir(puerto: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Expone `/metrics` en `host:puerto` desde un hilo en segundo plano y activa las métricas."""
+    servidor = ThreadingHTTPServer((host, puerto), _Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+    activar()
+    logger.info("Métricas en http://%s:%d/metrics", host, servidor.server_address[1])
+    return servidor
+
+
+def escribir(path: str) -> None:
+    """Escribe las métricas en `path` de forma atómica (temporal + `os.replace`)."""
+    destino = Path(path)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile("w", dir=str(destino.parent), prefix=destino.name, suffix=".tmp", delete=False, encoding="utf-8")
+    try:
+        with tmp:
+            tmp.write(texto())
+        os.replace(tmp.name, destino)
+    except BaseException:
+        Path(tmp.name).unlink(missing_ok=True)
+        raise
+
+
+def volcar_periodicamente(path: str, intervalo: float = 15.0) -> threading.Event:
+    """Escribe las métricas en `path` cada `intervalo` segundos y al salir del proceso.
+
+    Returns:
+        Evento que detiene el volcado al activarlo (`.set()`).
+    """
+    parar = threading.Event()
+
+    def bucle() -> None:
+        while not parar.wait(intervalo):
+            try:
+                escribir(path)
+            except OSError:
+                logger.exception("No se pudieron escribir las métricas en %s", path)
+
+    def final() -> None:
+        parar.set()
+        try:
+            escribir(path)
+        except OSError:
+            logger.exception("No se pudieron escribir las métricas en %s", path)
+
+    threading.Thread(target=bucle, name="metricas-fichero", daemon=True).start()
+    atexit.register(final)
+    activar()
+    return parar
+
+
+_INICIADO = False
+_INICIO_LOCK = threading.Lock()
+
+
+def iniciar_desde_entorno() -> bool:
+    """Arranca los exportadores configurados por variables de entorno (una vez por proceso).
+
+    Returns:
+        True si hay algún exportador en marcha.
+    """
+    global _INICIADO
+    with _INICIO_LOCK:
+        if _INICIADO:
+            return activas()
+        _INICIADO = True
+        puerto = os.environ.get("CALIFICA_METRICS_PORT")
+        fichero = os.environ.get("CALIFICA_METRICS_FILE")
+        if puerto:
+            try:
+                servir(int(puerto))
+            except (OSError, ValueError) as ex:
+                # p.ej. el puerto ya lo usa otro proceso de la app: seguir sin endpoint
+                logger.warning("No se pudo abrir el endpoint de métricas en el puerto %s: %s", puerto, ex)
+        if fichero:
+            intervalo = os.environ.get("CALIFICA_METRICS_INTERVAL", "")
+            try:
+                segundos = float(intervalo or 15)
+            except ValueError:
+                logger.warning("CALIFICA_METRICS_INTERVAL=%r no es un número; se usan 15 s", intervalo)
+                segundos = 15.0
+            volcar_periodicamente(fichero, segundos)
+        return activas()
+
+
+# -- sesiones activas -----------------------------------------------------------------
+
+VENTANA_SESION = 300.0
+_SESIONES: Dict[str, float] = {}
+_SESIONES_LOCK = threading.Lock()
+
+
+def sesion_vista(sesion_id: str) -> None:
+    """Marca actividad de una sesión de la app (se llama en cada rerun)."""
+    with _SESIONES_LOCK:
+        _SESIONES[sesion_id] = time.monotonic()
+
+
+def sesiones_activas(ventana: float = VENTANA_SESION) -> int:
+    """Sesiones con algún rerun en los últimos `ventana` segundos (olvida las antiguas)."""
+    limite = time.monotonic() - ventana
+    with _SESIONES_LOCK:
+        for sid in [s for s, t in _SESIONES.items() if t < limite]:
+            del _SESIONES[sid]
+        return len(_SESIONES)
@@ -0,0 +1,454 @@
+"""Migraciones versionadas del esquema de `rubrica.db`.
+
+La versión aplicada se guarda en `PRAGMA user_version`. Cada migración se
+ejecuta en su propia transacción junto con la actualización de la versión,
+de modo que un fallo deja la base en la última versión completa. Para
+añadir una migración basta con escribir la función y registrarla al final
+de `MIGRATIONS` con el siguiente número.
+"""
+
+import logging
+import sqlite3
+from typing import Callable, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _m001_esquema_base(conn: sqlite3.Connection) -> None:
+    """Tabla `evaluaciones` e índices para ordenar por fecha y buscar por clave natural."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS evaluaciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plantilla TEXT,
+            curso TEXT,
+            evaluacion TEXT,
+            fecha TEXT,
+            grupo_o_estudiante TEXT,
+            estructura REAL,
+            programacion REAL,
+            teoria REAL,
+            ia REAL,
+            reflexion REAL,
+            presentacion REAL,
+            nota_final REAL,
+            observaciones TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    # Las BDs creadas por tools/load_csv_to_sqlite.py no tienen `plantilla`
+    if "plantilla" not in _columns(conn, "evaluaciones"):
+        conn.execute("ALTER TABLE evaluaciones ADD COLUMN plantilla TEXT")
+    # ORDER BY fecha (y los desempates por id, incluido en el índice vía rowid)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_evaluaciones_fecha ON evaluaciones(fecha)")
+    # Clave natural; al empezar por `curso` también sirve para filtrar por curso
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_evaluaciones_clave "
+        "ON evaluaciones(curso, evaluacion, fecha, grupo_o_estudiante)"
+    )
+
+
+FTS_TABLE = "evaluaciones_fts"
+FTS_COLUMNS = ["curso", "evaluacion", "grupo_o_estudiante", "observaciones"]
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    """Indica si la compilación de SQLite en uso incluye el módulo FTS5."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _m002_busqueda_fts(conn: sqlite3.Connection) -> None:
+    """Índice FTS5 de texto sincronizado con `evaluaciones` mediante triggers.
+
+    Si SQLite no trae FTS5 la migración no crea nada y `list_detalle` sigue
+    buscando con LIKE.
+    """
+    if not fts5_available(conn):
+        return
+    cols = ", ".join(FTS_COLUMNS)
+    new_vals = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old_vals = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{cols}, content='evaluaciones', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS evaluaciones_fts_ai AFTER INSERT ON evaluaciones BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_vals});
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS evaluaciones_fts_ad AFTER DELETE ON evaluaciones BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS evaluaciones_fts_au AFTER UPDATE OF {cols} ON evaluaciones BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+            INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_vals});
+        END
+        """
+    )
+    # Indexar las filas que ya existían
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def has_fts(conn: sqlite3.Connection) -> bool:
+    """Indica si la BD tiene el índice FTS creado por la migración 2."""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone()
+    return row is not None
+
+
+STATS_TABLE = "resumen_stats"
+STATS_GROUP = ["curso", "evaluacion", "plantilla", "fecha"]
+STATS_METRICS = ["nota_final", "estructura", "programacion", "teoria", "ia", "reflexion", "presentacion"]
+
+
+def _grupo_is(alias: str) -> str:
+    """Condición `curso IS alias.curso AND ...` (IS iguala también los NULL y usa índices)."""
+    return " AND ".join(f"{c} IS {alias}.{c}" for c in STATS_GROUP)
+
+
+def stats_rebuild_sql(where: str = "") -> str:
+    """INSERT ... SELECT que recalcula desde `evaluaciones` los grupos que cumplan `where`."""
+    aggs = ", ".join(
+        f"COUNT({m}), IFNULL(SUM({m}), 0), IFNULL(SUM({m} * {m}), 0), MIN({m}), MAX({m})"
+        for m in STATS_METRICS
+    )
+    group = ", ".join(STATS_GROUP)
+    cols = ", ".join(
+        STATS_GROUP + ["n"] + [f"{m}_{c}" for m in STATS_METRICS for c in ("n", "sum", "sumsq", "min", "max")]
+    )
+    return (
+        f"INSERT INTO {STATS_TABLE} ({cols}) SELECT {group}, COUNT(*), {aggs} "
+        f"FROM evaluaciones {where} GROUP BY {group}"
+    )
+
+
+def _m003_resumen_stats(conn: sqlite3.Connection) -> None:
+    """Tabla de agregados por curso/evaluación/plantilla/fecha mantenida por triggers.
+
+    Por cada métrica guarda recuento, suma, suma de cuadrados, mínimo y máximo,
+    de modo que media y desviación se obtienen sin recorrer `evaluaciones`.
+    Las inserciones y las actualizaciones dentro del mismo grupo son O(1); sólo
+    se vuelve a leer el grupo desde `evaluaciones` al borrar filas, al cambiar
+    una fila de grupo o cuando el valor modificado era el mínimo/máximo (la
+    migración 4 sustituye esas relecturas por un recálculo perezoso).
+    """
+    metric_cols = ", ".join(
+        f"{m}_n INTEGER NOT NULL, {m}_sum REAL NOT NULL, {m}_sumsq REAL NOT NULL, {m}_min REAL, {m}_max REAL"
+        for m in STATS_METRICS
+    )
+    group = ", ".join(STATS_GROUP)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {STATS_TABLE} ({group}, n INTEGER NOT NULL, {metric_cols})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{STATS_TABLE}_grupo ON {STATS_TABLE}({group})")
+
+    def recompute(alias: str, extra: str = "") -> str:
+        cond = _grupo_is(alias) + extra
+        return f"DELETE FROM {STATS_TABLE} WHERE {cond}; {stats_rebuild_sql('WHERE ' + cond)};"
+
+    # Alta: sumar la fila nueva al grupo (o crear el grupo)
+    add_sets = ", ".join(
+        f"{m}_n = {m}_n + (new.{m} IS NOT NULL), "
+        f"{m}_sum = {m}_sum + IFNULL(new.{m}, 0), "
+        f"{m}_sumsq = {m}_sumsq + IFNULL(new.{m} * new.{m}, 0), "
+        f"{m}_min = COALESCE(MIN({m}_min, new.{m}), {m}_min, new.{m}), "
+        f"{m}_max = COALESCE(MAX({m}_max, new.{m}), {m}_max, new.{m})"
+        for m in STATS_METRICS
+    )
+    new_vals = ", ".join(
+        f"(new.{m} IS NOT NULL), IFNULL(new.{m}, 0), IFNULL(new.{m} * new.{m}, 0), new.{m}, new.{m}"
+        for m in STATS_METRICS
+    )
+    new_group = ", ".join(f"new.{c}" for c in STATS_GROUP)
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {STATS_TABLE}_ai AFTER INSERT ON evaluaciones BEGIN
+            UPDATE {STATS_TABLE} SET n = n + 1, {add_sets} WHERE {_grupo_is('new')};
+            INSERT INTO {STATS_TABLE}
+                SELECT {new_group}, 1, {new_vals}
+                WHERE NOT EXISTS (SELECT 1 FROM {STATS_TABLE} WHERE {_grupo_is('new')});
+        END
+        """
+    )
+
+    # Baja: recalcular el grupo afectado
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {STATS_TABLE}_ad AFTER DELETE ON evaluaciones BEGIN
+            {recompute('old')}
+        END
+        """
+    )
+
+    # Cambio dentro del mismo grupo: ajuste incremental; el mínimo/máximo sólo se
+    # relee del grupo si el valor antiguo era el extremo y el nuevo lo abandona.
+    def bound(m: str, fn: str, op: str) -> str:
+        return (
+            f"{m}_{fn} = CASE WHEN old.{m} IS NOT NULL AND old.{m} {op}= {m}_{fn} "
+            f"AND (new.{m} IS NULL OR new.{m} {'>' if op == '<' else '<'} old.{m}) "
+            f"THEN (SELECT {fn.upper()}({m}) FROM evaluaciones WHERE {_grupo_is('new')}) "
+            f"ELSE COALESCE({fn.upper()}({m}_{fn}, new.{m}), {m}_{fn}, new.{m}) END"
+        )
+
+    upd_sets = ", ".join(
+        f"{m}_n = {m}_n + (new.{m} IS NOT NULL) - (old.{m} IS NOT NULL), "
+        f"{m}_sum = {m}_sum + IFNULL(new.{m}, 0) - IFNULL(old.{m}, 0), "
+        f"{m}_sumsq = {m}_sumsq + IFNULL(new.{m} * new.{m}, 0) - IFNULL(old.{m} * old.{m}, 0), "
+        f"{bound(m, 'min', '<')}, {bound(m, 'max', '>')}"
+        for m in STATS_METRICS
+    )
+    same_group = " AND ".join(f"old.{c} IS new.{c}" for c in STATS_GROUP)
+    watched = ", ".join(STATS_GROUP + STATS_METRICS)
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {STATS_TABLE}_au_mismo AFTER UPDATE OF {watched} ON evaluaciones
+        WHEN {same_group} BEGIN
+            UPDATE {STATS_TABLE} SET {upd_sets} WHERE {_grupo_is('new')};
+        END
+        """
+    )
+    # Cambio de grupo: recalcular el grupo de origen y el de destino
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {STATS_TABLE}_au_grupo AFTER UPDATE OF {watched} ON evaluaciones
+        WHEN NOT ({same_group}) BEGIN
+            {recompute('old')}
+            {recompute('new')}
+        END
+        """
+    )
+
+    # Agregar las filas que ya existían
+    conn.execute(f"DELETE FROM {STATS_TABLE}")
+    conn.execute(stats_rebuild_sql())
+
+
+def _m004_stats_o1(conn: sqlite3.Connection) -> None:
+    """Triggers de `resumen_stats` en O(1) con mínimo/máximo perezosos.
+
+    Los triggers de la migración 3 releían el grupo entero cuando el valor que
+    se borraba o modificaba era el mínimo/máximo; en un recálculo masivo
+    (`db.recalcular_notas`) eso ocurre en casi todas las filas. Ahora bajas y
+    cambios sólo restan/suman y, si el valor saliente era un extremo, marcan el
+    grupo con `stale = 1`. Las escrituras que cambian notas recalculan el
+    mínimo/máximo de los grupos marcados antes de confirmar (`stats_refresh_sql`)
+    y `db.stats_por_grupo` calcula al leer, sin escribir, los que queden.
+    """
+    conn.execute(f"ALTER TABLE {STATS_TABLE} ADD COLUMN stale INTEGER NOT NULL DEFAULT 0")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{STATS_TABLE}_stale ON {STATS_TABLE}(stale) WHERE stale = 1")
+    for name in ("ai", "ad", "au_mismo", "au_grupo"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {STATS_TABLE}_{name}")
+
+    add_sets = ", ".join(
+        f"{m}_n = {m}_n + (new.{m} IS NOT NULL), "
+        f"{m}_sum = {m}_sum + IFNULL(new.{m}, 0), "
+        f"{m}_sumsq = {m}_sumsq + IFNULL(new.{m} * new.{m}, 0), "
+        f"{m}_min = COALESCE(MIN({m}_min, new.{m}), {m}_min, new.{m}), "
+        f"{m}_max = COALESCE(MAX({m}_max, new.{m}), {m}_max, new.{m})"
+        for m in STATS_METRICS
+    )
+    new_vals = ", ".join(
+        f"(new.{m} IS NOT NULL), IFNULL(new.{m}, 0), IFNULL(new.{m} * new.{m}, 0), new.{m}, new.{m}"
+        for m in STATS_METRICS
+    )
+    cols = ", ".join(
+        STATS_GROUP + ["n"] + [f"{m}_{c}" for m in STATS_METRICS for c in ("n", "sum", "sumsq", "min", "max")]
+    )
+    new_group = ", ".join(f"new.{c}" for c in STATS_GROUP)
+    add_body = f"""
+            UPDATE {STATS_TABLE} SET n = n + 1, {add_sets} WHERE {_grupo_is('new')};
+            INSERT INTO {STATS_TABLE} ({cols})
+                SELECT {new_group}, 1, {new_vals}
+                WHERE NOT EXISTS (SELECT 1 FROM {STATS_TABLE} WHERE {_grupo_is('new')});
+    """
+
+    sub_sets = ", ".join(
+        f"{m}_n = {m}_n - (old.{m} IS NOT NULL), "
+        f"{m}_sum = {m}_sum - IFNULL(old.{m}, 0), "
+        f"{m}_sumsq = {m}_sumsq - IFNULL(old.{m} * old.{m}, 0)"
+        for m in STATS_METRICS
+    )
+    extremo = " OR ".join(f"(old.{m} IS NOT NULL AND (old.{m} <= {m}_min OR old.{m} >= {m}_max))" for m in STATS_METRICS)
+    sub_body = f"""
+            UPDATE {STATS_TABLE} SET n = n - 1, {sub_sets}, stale = (stale OR {extremo}) WHERE {_grupo_is('old')};
+            DELETE FROM {STATS_TABLE} WHERE {_grupo_is('old')} AND n <= 0;
+    """
+
+    watched = ", ".join(STATS_GROUP + STATS_METRICS)
+    conn.execute(f"CREATE TRIGGER {STATS_TABLE}_ai AFTER INSERT ON evaluaciones BEGIN {add_body} END")
+    conn.execute(f"CREATE TRIGGER {STATS_TABLE}_ad AFTER DELETE ON evaluaciones BEGIN {sub_body} END")
+    conn.execute(
+        f"CREATE TRIGGER {STATS_TABLE}_au AFTER UPDATE OF {watched} ON evaluaciones "
+        f"BEGIN {sub_body} {add_body} END"
+    )
+
+
+def stats_refresh_sql() -> str:
+    """UPDATE que recalcula mínimo/máximo de los grupos marcados con `stale = 1`."""
+    targets = ", ".join(f"{m}_min, {m}_max" for m in STATS_METRICS)
+    aggs = ", ".join(f"MIN({m}), MAX({m})" for m in STATS_METRICS)
+    cond = " AND ".join(f"e.{c} IS {STATS_TABLE}.{c}" for c in STATS_GROUP)
+    return (
+        f"UPDATE {STATS_TABLE} SET ({targets}, stale) = "
+        f"(SELECT {aggs}, 0 FROM evaluaciones e WHERE {cond}) WHERE stale = 1"
+    )
+
+
+def stats_minmax_sql() -> str:
+    """SELECT (sólo lectura) del mínimo/máximo actual de los grupos marcados con `stale = 1`."""
+    grupo = ", ".join(f"s.{c} AS {c}" for c in STATS_GROUP)
+    aggs = ", ".join(f"MIN(e.{m}) AS {m}_min, MAX(e.{m}) AS {m}_max" for m in STATS_METRICS)
+    cond = " AND ".join(f"e.{c} IS s.{c}" for c in STATS_GROUP)
+    return f"SELECT {grupo}, {aggs} FROM {STATS_TABLE} s JOIN evaluaciones e ON {cond} WHERE s.stale = 1 GROUP BY s.rowid"
+
+
+CLAVE_NATURAL = ["curso", "evaluacion", "fecha", "grupo_o_estudiante"]
+CLAVE_INDEX = "idx_evaluaciones_clave_unica"
+DUPLICADAS_TABLE = "evaluaciones_duplicadas"
+
+
+def asegurar_clave_unica(conn: sqlite3.Connection) -> int:
+    """Crea el índice único sobre la clave natural de `evaluaciones`.
+
+    Si ya había filas repetidas se conserva la más reciente (mayor id) y las
+    demás se mueven a `evaluaciones_duplicadas` con la fecha de archivo. Como
+    en cualquier índice UNIQUE de SQLite, las filas con algún campo de la
+    clave a NULL no entran en conflicto. También la usa
+    `tools/load_csv_to_sqlite.py` sobre sus propias BDs.
+
+    A partir de aquí una evaluación cuya clave ya existe no se vuelve a
+    insertar: `insert_evaluacion` sin `on_conflict` lanza `DBError` (antes se
+    guardaba una fila más) y `seed_demo` sobre datos demo ya cargados no
+    inserta nada. Las filas archivadas siguen en `evaluaciones_duplicadas`.
+
+    Returns:
+        Número de filas archivadas.
+    """
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {DUPLICADAS_TABLE} AS "
+        "SELECT *, CURRENT_TIMESTAMP AS archivada_en FROM evaluaciones WHERE 0"
+    )
+    tabla = _columns(conn, "evaluaciones")
+    cols = [c for c in _columns(conn, DUPLICADAS_TABLE) if c in tabla]
+    match = " AND ".join(f"n.{c} = e.{c}" for c in CLAVE_NATURAL)
+    repetida = f"EXISTS (SELECT 1 FROM evaluaciones n WHERE {match} AND n.id > e.id)"
+    archivadas = conn.execute(
+        f"INSERT INTO {DUPLICADAS_TABLE} ({', '.join(cols)}, archivada_en) "
+        f"SELECT {', '.join('e.' + c for c in cols)}, CURRENT_TIMESTAMP FROM evaluaciones e WHERE {repetida}"
+    ).rowcount
+    if archivadas:
+        conn.execute(f"DELETE FROM evaluaciones WHERE id IN (SELECT e.id FROM evaluaciones e WHERE {repetida})")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {CLAVE_INDEX} ON evaluaciones({', '.join(CLAVE_NATURAL)})")
+    return archivadas
+
+
+def _m005_clave_unica(conn: sqlite3.Connection) -> None:
+    """Clave natural única (habilita INSERT ... ON CONFLICT); sustituye a `idx_evaluaciones_clave`."""
+    archivadas = asegurar_clave_unica(conn)
+    if archivadas:
+        logger.warning(
+            "Clave natural única: %d evaluaciones repetidas (se conserva la de mayor id) movidas a %s",
+            archivadas, DUPLICADAS_TABLE,
+        )
+    conn.execute("DROP INDEX IF EXISTS idx_evaluaciones_clave")
+
+
+CARGAS_TABLE = "cargas_csv"
+
+
+def asegurar_tabla_cargas(conn: sqlite3.Connection) -> None:
+    """Tabla de checkpoints de `tools/load_csv_to_sqlite.py`.
+
+    Una fila por contenido de CSV (sha256): filas de datos ya confirmadas y si
+    el fichero se completó, para reanudar una carga interrumpida u omitir un
+    fichero ya cargado.
+    """
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CARGAS_TABLE} (
+            sha256 TEXT PRIMARY KEY,
+            archivo TEXT,
+            filas INTEGER NOT NULL DEFAULT 0,
+            completo INTEGER NOT NULL DEFAULT 0,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def _m006_cargas_csv(conn: sqlite3.Connection) -> None:
+    """Checkpoints de cargas masivas en la propia BD (para reanudar cargas de la app)."""
+    asegurar_tabla_cargas(conn)
+
+
+Migration = Tuple[int, str, Callable[[sqlite3.Connection], None]]
+
+MIGRATIONS: List[Migration] = [
+    (1, "esquema base e índices de evaluaciones", _m001_esquema_base),
+    (2, "búsqueda de texto completo (FTS5)", _m002_busqueda_fts),
+    (3, "agregados por curso/evaluación (resumen_stats)", _m003_resumen_stats),
+    (4, "triggers de resumen_stats en O(1)", _m004_stats_o1),
+    (5, "clave natural única (duplicados archivados)", _m005_clave_unica),
+    (6, "checkpoints de cargas CSV", _m006_cargas_csv),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Devuelve la versión de esquema guardada en `PRAGMA user_version`."""
+    return int(conn.execute("PRAGMA user_version").fetchone()[0])
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> List[int]:
+    """Aplica en orden las migraciones pendientes hasta `target` (por defecto la última).
+
+    Es seguro llamarla con varios procesos a la vez: cada paso toma el bloqueo
+    de escritura (`BEGIN IMMEDIATE`) y vuelve a leer la versión antes de aplicar.
+
+    Returns:
+        Lista de versiones aplicadas en esta llamada (vacía si ya estaba al día).
+    """
+    target = LATEST_VERSION if target is None else target
+    if conn.in_transaction:
+        conn.commit()
+    applied: List[int] = []
+    for version, _desc, func in MIGRATIONS:
+        if version > target:
+            break
+        if version <= current_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            func(conn)
+            # PRAGMA no admite parámetros; `version` es un entero del registro
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
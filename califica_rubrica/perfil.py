@@ -0,0 +1,146 @@
+"""Perfilado por secciones de los reruns de `app.py`.
+
+Streamlit vuelve a ejecutar el script entero en cada interacción y no es
+evidente qué parte lo hace lento (rúbrica, roster, tablas, exportes...). Con el
+perfilado activo, `Cronometro` mide el tiempo de cada sección con nombre de un
+rerun: `crono.seccion("nombre")` cierra la sección anterior y abre la nueva, así
+que marcar el script no obliga a reindentar bloques. Las funciones (p.ej. los
+fragmentos) se miden con el decorador `medir`.
+
+Cada duración se acumula además en una ventana deslizante por sección,
+compartida por todas las sesiones del proceso, de la que salen percentiles e
+histograma (`resumen()`, `volcar_json()`). Desactivado, marcar una sección es
+una comprobación de un booleano.
+"""
+
+from collections import deque
+from datetime import datetime
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+
+
+VENTANA = 500
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_SERIES: Dict[str, Deque[float]] = {}
+_LOCK = threading.Lock()
+
+
+def forzado() -> bool:
+    """True si `CALIFICA_PROFILE=1`: perfilado activo en todas las sesiones."""
+    return os.environ.get("CALIFICA_PROFILE", "").lower() in ("1", "true", "yes", "on")
+
+
+def registrar(nombre: str, segundos: float) -> None:
+    """Añade una duración a la ventana deslizante de la sección `nombre`."""
+    with _LOCK:
+        serie = _SERIES.get(nombre)
+        if serie is None:
+            serie = _SERIES[nombre] = deque(maxlen=VENTANA)
+        serie.append(segundos * 1000.0)
+
+
+class Cronometro:
+    """Tiempos de las secciones de un rerun.
+
+    Args:
+        activo: si es False, `seccion` y `fin` no hacen nada.
+    """
+
+    def __init__(self, activo: bool) -> None:
+        self.activo = activo
+        self.tiempos: Dict[str, float] = {}
+        self._actual: Optional[str] = None
+        self._t0 = self._inicio = time.perf_counter()
+
+    def _cerrar(self, ahora: float) -> None:
+        if self._actual is not None:
+            dur = ahora - self._t0
+            self.tiempos[self._actual] = self.tiempos.get(self._actual, 0.0) + dur
+            registrar(self._actual, dur)
+
+    def seccion(self, nombre: str) -> None:
+        """Cierra la sección en curso y empieza `nombre`."""
+        if not self.activo:
+            return
+        ahora = time.perf_counter()
+        self._cerrar(ahora)
+        self._actual, self._t0 = nombre, ahora
+
+    def fin(self) -> Dict[str, float]:
+        """Cierra la última sección, registra el total del rerun y devuelve los tiempos (s)."""
+        if not self.activo:
+            return {}
+        ahora = time.perf_counter()
+        self._cerrar(ahora)
+        self._actual = None
+        total = ahora - self._inicio
+        self.tiempos["total"] = total
+        registrar("total", total)
+        return dict(self.tiempos)
+
+
+def medir(nombre: str, activo: Callable[[], bool]) -> Callable:
+    """Decorador: mide cada llamada como la sección `nombre` si `activo()` es True.
+
+    Sirve para los fragmentos, que en sus reruns parciales no pasan por las
+    marcas del script. En una ejecución completa su tiempo también cuenta en la
+    sección del script desde la que se llaman.
+    """
+    def deco(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not activo():
+                return func(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registrar(nombre, time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+
+def resumen() -> List[Dict[str, Any]]:
+    """Estadísticas de la ventana de cada sección: n, media, p50, p95, máx e histograma (ms)."""
+    with _LOCK:
+        series = {k: np.fromiter(v, dtype=float) for k, v in _SERIES.items()}
+    filas = []
+    for nombre, ms in series.items():
+        if ms.size == 0:
+            continue
+        bordes = np.array(BUCKETS_MS, dtype=float)
+        cuentas = np.bincount(np.searchsorted(bordes, ms, side="left"), minlength=len(bordes) + 1)
+        etiquetas = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        filas.append({
+            "seccion": nombre,
+            "n": int(ms.size),
+            "media_ms": round(float(ms.mean()), 2),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "max_ms": round(float(ms.max()), 2),
+            "histograma": dict(zip(etiquetas, (int(c) for c in cuentas))),
+        })
+    return sorted(filas, key=lambda f: f["p95_ms"], reverse=True)
+
+
+def volcar_json(ultimo: Optional[Dict[str, float]] = None) -> str:
+    """JSON con el resumen de todas las secciones y, opcionalmente, el último rerun."""
+    data = {
+        "generado": datetime.now().isoformat(timespec="seconds"),
+        "ventana": VENTANA,
+        "ultimo_rerun_ms": {k: round(v * 1000.0, 2) for k, v in (ultimo or {}).items()},
+        "secciones": resumen(),
+    }
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def limpiar() -> None:
+    with _LOCK:
+        _SERIES.clear()
@@ -0,0 +1,146 @@
+"""Pool de conexiones SQLite reutilizables.
+
+Streamlit ejecuta cada sesión (y cada rerun) en hilos distintos, por lo que
+no se puede fijar una conexión a un hilo concreto. El pool entrega conexiones
+ya configuradas (PRAGMAs aplicadas una sola vez) mediante préstamo/devolución:
+una conexión sólo la usa un hilo a la vez y al devolverla queda disponible
+para el siguiente rerun, sea cual sea su hilo.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+import atexit
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+ConnFactory = Callable[[str], sqlite3.Connection]
+
+
+class ConnectionPool:
+    """Pool de conexiones para un único fichero de base de datos.
+
+    Args:
+        path: ruta (ya resuelta) al fichero SQLite.
+        factory: función que abre y configura una conexión nueva para `path`.
+            Debe crearla con `check_same_thread=False`.
+        max_idle: máximo de conexiones ociosas que se conservan; las que
+            sobran al devolverlas se cierran.
+    """
+
+    def __init__(self, path: str, factory: ConnFactory, max_idle: int = 4) -> None:
+        self.path = path
+        self._factory = factory
+        self._max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle: List[sqlite3.Connection] = []
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._closed = False
+
+    def _current_file_id(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino)
+
+    def acquire(self) -> sqlite3.Connection:
+        """Presta una conexión ociosa o abre una nueva si no hay disponibles."""
+        file_id = self._current_file_id()
+        stale: List[sqlite3.Connection] = []
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"El pool de {self.path} está cerrado")
+            # Si el fichero se borró o se reemplazó, las conexiones ociosas apuntan
+            # al fichero antiguo y deben descartarse.
+            if file_id != self._file_id:
+                stale, self._idle = self._idle, []
+            conn = self._idle.pop() if self._idle else None
+        for c in stale:
+            _close_quietly(c)
+        if conn is None:
+            conn = self._factory(self.path)
+            with self._lock:
+                self._file_id = self._current_file_id()
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Devuelve una conexión al pool descartando transacciones abiertas."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            _close_quietly(conn)
+            return
+        with self._lock:
+            if not self._closed and len(self._idle) < self._max_idle:
+                self._idle.append(conn)
+                return
+        _close_quietly(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Context manager que presta una conexión y la devuelve al salir."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """Cierra todas las conexiones ociosas y rechaza nuevos préstamos."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for c in idle:
+            _close_quietly(c)
+
+    @property
+    def idle_count(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+
+_POOLS: Dict[str, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(path: str, factory: ConnFactory) -> ConnectionPool:
+    """Devuelve el pool asociado a `path`, creándolo la primera vez."""
+    key = str(Path(path).resolve())
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = ConnectionPool(key, factory)
+            _POOLS[key] = pool
+        return pool
+
+
+def close_pool(path: str) -> None:
+    """Cierra y olvida el pool de `path` (p.ej. antes de reemplazar el fichero)."""
+    key = str(Path(path).resolve())
+    with _POOLS_LOCK:
+        pool = _POOLS.pop(key, None)
+    if pool is not None:
+        pool.close()
+
+
+def close_all() -> None:
+    """Cierra todos los pools abiertos. Se registra con `atexit`."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
+def _close_quietly(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+atexit.register(close_all)
@@ -0,0 +1,202 @@
+"""Instrumentación de las funciones de `db.py`: tiempos, SQL y consultas lentas.
+
+Con la instrumentación activa, cada llamada a una función pública de lectura o
+escritura de `db.py` (`list_resumen`, `list_detalle`, `export_csv`, inserciones,
+...) genera un registro con su tiempo total, las filas devueltas y la "forma"
+de las sentencias SQL ejecutadas (el SQL con los literales sustituidos por `?`,
+capturado con `Connection.set_trace_callback`). Los registros recientes quedan
+en memoria (`recientes()`); las llamadas que superan el umbral se escriben
+además, con el `EXPLAIN QUERY PLAN` de sus consultas, como una línea JSON en un
+log rotativo (`data/slow_queries.log` por defecto).
+
+Desactivada (lo habitual) el coste es una comprobación de un booleano por
+llamada. Se activa con la variable de entorno `CALIFICA_QUERY_LOG=1`
+(`CALIFICA_SLOW_MS` fija el umbral) o desde código con `configurar()`.
+"""
+
+from collections import deque
+from pathlib import Path
+import json
+import logging
+import logging.handlers
+import os
+import re
+import threading
+from typing import Any, Deque, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+SLOW_LOG_DEFAULT = Path(__file__).resolve().parent / "data" / "slow_queries.log"
+UMBRAL_MS_DEFAULT = 100.0
+
+
+def _umbral_entorno() -> float:
+    """Umbral en segundos según `CALIFICA_SLOW_MS`; un valor no numérico usa el de por defecto."""
+    valor = os.environ.get("CALIFICA_SLOW_MS", "")
+    try:
+        return float(valor or UMBRAL_MS_DEFAULT) / 1000.0
+    except ValueError:
+        # Se evalúa al importar `db`: un valor mal escrito no debe impedir arrancar la app
+        logger.warning("CALIFICA_SLOW_MS=%r no es un número; se usan %g ms", valor, UMBRAL_MS_DEFAULT)
+        return UMBRAL_MS_DEFAULT / 1000.0
+
+
+_CONFIG: Dict[str, Any] = {
+    "activa": os.environ.get("CALIFICA_QUERY_LOG", "").lower() in ("1", "true", "yes", "on"),
+    "umbral": _umbral_entorno(),
+    "log_path": SLOW_LOG_DEFAULT,
+    "max_bytes": 1024 * 1024,
+    "backups": 5,
+}
+_RECIENTES: Deque[Dict[str, Any]] = deque(maxlen=200)
+_LOCK = threading.Lock()
+_local = threading.local()
+_slow_logger: Optional[logging.Logger] = None
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def activa() -> bool:
+    return _CONFIG["activa"]
+
+
+def configurar(
+    activa: Optional[bool] = None,
+    umbral_ms: Optional[float] = None,
+    log_path: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    backups: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Cambia la configuración de la instrumentación (sólo los argumentos dados).
+
+    Args:
+        activa: activar o desactivar la instrumentación.
+        umbral_ms: duración a partir de la cual una llamada se considera lenta.
+        log_path: fichero del log de consultas lentas.
+        max_bytes: tamaño a partir del cual se rota el log.
+        backups: número de ficheros rotados que se conservan.
+
+    Returns:
+        Copia de la configuración resultante.
+    """
+    global _slow_logger
+    with _LOCK:
+        if activa is not None:
+            _CONFIG["activa"] = bool(activa)
+        if umbral_ms is not None:
+            _CONFIG["umbral"] = float(umbral_ms) / 1000.0
+        if log_path is not None:
+            _CONFIG["log_path"] = Path(log_path)
+        if max_bytes is not None:
+            _CONFIG["max_bytes"] = int(max_bytes)
+        if backups is not None:
+            _CONFIG["backups"] = int(backups)
+        if any(v is not None for v in (log_path, max_bytes, backups)) and _slow_logger is not None:
+            # El handler se recrea con la nueva configuración en la próxima escritura
+            for h in list(_slow_logger.handlers):
+                _slow_logger.removeHandler(h)
+                h.close()
+            _slow_logger = None
+        return dict(_CONFIG)
+
+
+def umbral() -> float:
+    return _CONFIG["umbral"]
+
+
+def forma_sql(sql: str) -> str:
+    """SQL normalizado para agrupar: literales como `?`, listas IN colapsadas y espacios simples."""
+    shape = _STRING_RE.sub("?", sql)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("(?, ...)", shape)
+    return _SPACE_RE.sub(" ", shape).strip()
+
+
+# -- captura por hilo -----------------------------------------------------------
+
+MAX_SENTENCIAS = 1000
+
+
+class Captura:
+    """SQL ejecutado durante una llamada instrumentada.
+
+    Guarda como mucho `MAX_SENTENCIAS` sentencias (un `executemany` de miles de
+    filas genera una por fila) pero las cuenta todas. Las subsentencias de
+    triggers y tablas virtuales (que SQLite notifica con el prefijo `--`) se
+    ignoran: ya forman parte de la sentencia que las provoca.
+    """
+
+    __slots__ = ("sentencias", "total")
+
+    def __init__(self) -> None:
+        self.sentencias: List[str] = []
+        self.total = 0
+
+    def anadir(self, sql: str) -> None:
+        if sql.startswith("--"):
+            return
+        self.total += 1
+        if len(self.sentencias) < MAX_SENTENCIAS:
+            self.sentencias.append(sql)
+
+
+def iniciar_captura() -> Optional[Captura]:
+    """Empieza a capturar el SQL de este hilo; None si ya hay una captura en curso.
+
+    Las llamadas anidadas (p.ej. `export_csv` -> `stream_export_csv`) se
+    atribuyen a la más externa.
+    """
+    if getattr(_local, "captura", None) is not None:
+        return None
+    _local.captura = Captura()
+    return _local.captura
+
+
+def terminar_captura() -> None:
+    _local.captura = None
+
+
+def captura_en_curso() -> Optional[Captura]:
+    """Captura donde `get_conn` debe volcar el SQL de este hilo (None si no se captura)."""
+    return getattr(_local, "captura", None)
+
+
+# -- registros ------------------------------------------------------------------
+
+def _logger() -> logging.Logger:
+    global _slow_logger
+    if _slow_logger is None:
+        log_path = Path(_CONFIG["log_path"])
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        lg = logging.getLogger("califica.slow_queries")
+        lg.setLevel(logging.INFO)
+        lg.propagate = False
+        handler = logging.handlers.RotatingFileHandler(
+            log_path, maxBytes=_CONFIG["max_bytes"], backupCount=_CONFIG["backups"], encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        lg.addHandler(handler)
+        _slow_logger = lg
+    return _slow_logger
+
+
+def registrar(registro: Dict[str, Any]) -> None:
+    """Guarda `registro` entre los recientes y, si es lento, en el log rotativo."""
+    _RECIENTES.append(registro)
+    if registro.get("lenta"):
+        with _LOCK:
+            _logger().info(json.dumps(registro, ensure_ascii=False, default=str))
+
+
+def recientes(n: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Últimos registros (del más antiguo al más reciente)."""
+    items = list(_RECIENTES)
+    return items[-n:] if n else items
+
+
+def limpiar() -> None:
+    _RECIENTES.clear()
@@ -0,0 +1,128 @@
+"""Lectura cacheada de los rosters `data/roster_groups_*.csv`.
+
+La app, si el roster de la barra lateral está vacío, usa el fichero más
+reciente (por nombre) que tenga una columna `group`. Buscarlo en cada rerun
+implica listar el directorio y leer CSVs, lo que en un volumen de red domina la
+latencia de la página. `RosterProvider` guarda:
+
+- el listado de ficheros, que sólo se rehace si cambia el `mtime` del directorio
+  (crear, borrar o renombrar ficheros lo modifica). Un fichero creado en el
+  mismo "tick" de `mtime` que el listado no lo cambiaría, así que un listado
+  hecho cuando el `mtime` del directorio era reciente (`MARGEN_MTIME_NS`) no se
+  da por bueno y se repite en la siguiente llamada;
+- el roster ya parseado de cada fichero, validado con `(mtime_ns, tamaño)`.
+
+Así, un rerun sin cambios cuesta un `stat` del directorio y otro por fichero
+revisado (normalmente sólo el más reciente), sin abrir ningún CSV.
+"""
+
+from pathlib import Path
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+
+ROSTER_PATTERN = "roster_groups_*.csv"
+# Resolución de `mtime` de los sistemas de ficheros más gruesos (FAT: 2 s)
+MARGEN_MTIME_NS = 2_000_000_000
+
+Firma = Tuple[int, int]
+
+
+def _firma(path: Path) -> Optional[Firma]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def leer_roster(path: Path) -> Optional[List[str]]:
+    """Lee los grupos de la columna `group` de `path`, sin duplicados y en orden.
+
+    Returns:
+        Lista de grupos, o None si el fichero no se puede leer o no tiene la columna.
+    """
+    try:
+        df_r = pd.read_csv(path)
+    except Exception:
+        return None
+    if "group" not in df_r.columns:
+        return None
+    return list(dict.fromkeys([str(x).strip() for x in df_r["group"].tolist() if str(x).strip()]))
+
+
+class RosterProvider:
+    """Índice cacheado de los ficheros de roster de un directorio.
+
+    Args:
+        data_dir: directorio donde buscar los ficheros.
+        pattern: patrón glob de los ficheros de roster.
+    """
+
+    def __init__(self, data_dir: str, pattern: str = ROSTER_PATTERN) -> None:
+        self.data_dir = Path(data_dir)
+        self.pattern = pattern
+        self._lock = threading.Lock()
+        self._dir_firma: Optional[Firma] = None
+        self._listado_fiable = False
+        self._ficheros: List[Path] = []
+        self._parseados: Dict[Path, Tuple[Firma, Optional[List[str]]]] = {}
+        # Contadores para diagnóstico y pruebas
+        self.listados = 0
+        self.lecturas = 0
+
+    def _indice(self) -> List[Path]:
+        """Ficheros de roster, del más reciente al más antiguo por nombre."""
+        firma = _firma(self.data_dir)
+        if firma is None:
+            self._dir_firma, self._ficheros, self._parseados = None, [], {}
+            return []
+        if firma != self._dir_firma or not self._listado_fiable:
+            inicio = time.time_ns()
+            self._ficheros = sorted(self.data_dir.glob(self.pattern), reverse=True)
+            vigentes = set(self._ficheros)
+            self._parseados = {p: v for p, v in self._parseados.items() if p in vigentes}
+            self._dir_firma = firma
+            self._listado_fiable = firma[0] < inicio - MARGEN_MTIME_NS
+            self.listados += 1
+        return self._ficheros
+
+    def _roster_de(self, path: Path) -> Optional[List[str]]:
+        firma = _firma(path)
+        if firma is None:
+            return None
+        cacheado = self._parseados.get(path)
+        if cacheado is not None and cacheado[0] == firma:
+            return cacheado[1]
+        grupos = leer_roster(path)
+        self.lecturas += 1
+        self._parseados[path] = (firma, grupos)
+        return grupos
+
+    def roster(self) -> List[str]:
+        """Devuelve el roster del fichero más reciente válido (lista vacía si no hay)."""
+        with self._lock:
+            for path in self._indice():
+                grupos = self._roster_de(path)
+                if grupos:
+                    return list(grupos)
+            return []
+
+
+_PROVIDERS: Dict[Tuple[str, str], RosterProvider] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_roster_provider(data_dir: str, pattern: str = ROSTER_PATTERN) -> RosterProvider:
+    """Devuelve el `RosterProvider` compartido de `data_dir`, creándolo la primera vez."""
+    key = (str(Path(data_dir).resolve()), pattern)
+    with _PROVIDERS_LOCK:
+        provider = _PROVIDERS.get(key)
+        if provider is None:
+            provider = RosterProvider(key[0], pattern)
+            _PROVIDERS[key] = provider
+        return provider
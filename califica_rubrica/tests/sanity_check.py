@@ -9,14 +9,30 @@ non-zero on failure (exceptions will propagate).
 from pathlib import Path
 import sys
 import shutil
+import sqlite3
+import os
+import tempfile
+import time
+
+import pandas as pd
 
 # Ensure module imports find rubrica-streamlit sources
 HERE = Path(__file__).resolve().parent
 # Add the package root (parent of tests/) so imports like `from db import ...` work
 sys.path.insert(0, str(HERE.parent))
+# y el cargador de `tools/`
+sys.path.insert(0, str(HERE.parent.parent / "tools"))
 
-from db import init_db, insert_evaluacion, list_resumen, list_detalle, export_csv, seed_demo
-from utils import validate_notas, nota_final
+from db import init_db, insert_evaluacion, insert_evaluaciones_bulk, list_resumen, list_resumen_page, list_detalle, export_csv, seed_demo, stats_por_grupo, recalcular_notas, data_version, ensure_db, stream_export_csv, DBError
+from utils import TEMPLATES, validate_notas, nota_final
+from roster import RosterProvider
+from csv_buffer import CsvBuffer
+from migrations import migrate
+from journal import CsvJournal, JournalError, JOURNAL_COLUMNS
+import querylog
+import perfil
+import metricas
+from load_csv_to_sqlite import main_streaming
 
 
 def main() -> None:
@@ -25,10 +41,28 @@ def main() -> None:
     if tmp_db.exists():
         tmp_db.unlink()
 
-    print("[1/6] Inicializando DB...")
+    print("[1/7] Inicializando DB...")
     init_db(path=str(tmp_db))
+    # Inicialización única por proceso: la segunda llamada no vuelve a hacer nada
+    arranque = ensure_db(path=str(tmp_db))
+    assert arranque["migraciones"] == [] and ensure_db(path=str(tmp_db)) is arranque
+    # Una BD anterior a la clave única con una fila repetida: la migración la archiva y lo informa
+    with tempfile.TemporaryDirectory() as tmp:
+        antigua = Path(tmp) / "antigua.db"
+        raw = sqlite3.connect(str(antigua))
+        migrate(raw, target=4)
+        for nota in (3.0, 4.0):
+            raw.execute(
+                "INSERT INTO evaluaciones (curso, evaluacion, fecha, grupo_o_estudiante, nota_final) "
+                "VALUES ('C', 'E', '2025-10-01', 'G', ?)", (nota,),
+            )
+        raw.commit()
+        raw.close()
+        info = ensure_db(path=str(antigua))
+        assert info["duplicadas_archivadas"] == 1 and 5 in info["migraciones"]
+        assert [r["nota_final"] for r in list_resumen(path=str(antigua))] == [4.0]
 
-    print("[2/6] Insertando evaluación de prueba...")
+    print("[2/7] Insertando evaluación de prueba...")
     item = {
         "curso": "Sanity Curso",
         "evaluacion": "Sanity Eval",
@@ -43,30 +77,50 @@ def main() -> None:
         "nota_final": 4.2,
         "observaciones": "Prueba automática",
     }
+    version_antes = data_version(str(tmp_db))
     new_id = insert_evaluacion(item, path=str(tmp_db))
     assert new_id and new_id > 0
+    # Las escrituras cambian la versión de datos (invalida las cachés de la app)
+    version_despues = data_version(str(tmp_db))
+    assert version_despues[1] > version_antes[1]
     print(f"  -> Insertado id={new_id}")
 
-    print("[3/6] Listando resumen...")
+    print("[3/7] Listando resumen...")
     resumen = list_resumen(path=str(tmp_db))
     assert isinstance(resumen, list) and len(resumen) >= 1
+    # ... y las lecturas no
+    assert data_version(str(tmp_db)) == version_despues
     print(f"  -> {len(resumen)} filas en resumen")
 
-    print("[4/6] Listando detalle y comprobando fila insertada...")
+    print("[4/7] Listando detalle y comprobando fila insertada...")
     detalle = list_detalle(path=str(tmp_db), filtro_texto=None, fecha=None)
     ids = [r["id"] for r in detalle]
     assert new_id in ids
+    # Búsqueda FTS: por prefijo y sin distinguir tildes ("automatica" ~ "automática")
+    encontrados = list_detalle(path=str(tmp_db), filtro_texto="prueba automatica", busqueda="fts")
+    assert new_id in [r["id"] for r in encontrados]
     print("  -> detalle OK")
 
-    print("[5/6] Exportando CSV desde BD...")
+    print("[5/7] Exportando CSV desde BD...")
     out_csv = workspace / "sanity_export.csv"
     if out_csv.exists():
         out_csv.unlink()
     out_path = export_csv(path=str(tmp_db), out_path=str(out_csv))
     assert Path(out_path).exists()
+    # Un error a mitad de la exportación no deja un CSV truncado ni el temporal
+    with tempfile.TemporaryDirectory() as tmp:
+        roto = Path(tmp) / "roto.csv"
+        sql_roto = "SELECT 1 AS x UNION ALL SELECT abs(-9223372036854775807 - 1)"  # falla en la 2ª fila
+        try:
+            stream_export_csv(roto, path=str(tmp_db), sql=sql_roto, chunk_size=1)
+        except sqlite3.Error:
+            pass
+        else:
+            raise AssertionError("se esperaba un error de SQLite")
+        assert list(Path(tmp).iterdir()) == []
     print(f"  -> CSV exportado a {out_path}")
 
-    print("[6/6] Validando utilidades y seed_demo...")
+    print("[6/7] Validando utilidades y seed_demo...")
     notas = {"estructura": 4, "programacion": 5, "teoria": 3, "ia": 4, "reflexion": 4, "presentacion": 5}
     validate_notas(notas)
     nf = nota_final(notas)
@@ -75,6 +129,214 @@ def main() -> None:
     assert isinstance(demo_ids, list) and len(demo_ids) >= 1
     print("  -> utils y seed_demo OK")
 
+    # Los agregados mantenidos por triggers cuadran con las filas de su grupo
+    grupo = [g for g in stats_por_grupo(path=str(tmp_db), curso="Sanity Curso", evaluacion="Sanity Eval")]
+    assert len(grupo) == 1 and grupo[0]["n"] == 1 and grupo[0]["nota_final_mean"] == 4.2
+
+    print("[7/7] Insertando en bloque y paginando...")
+    lote = [
+        {"curso": "Sanity Curso", "evaluacion": "Bulk", "fecha": "2025-10-31", "grupo_o_estudiante": f"Grupo {i}",
+         "plantilla": "Civil", "estructura": 4.0, "programacion": 4.0, "teoria": 4.0, "ia": 4.0, "reflexion": 4.0,
+         "presentacion": 4.0, "nota_final": 0.0}
+        for i in range(1, 4)
+    ]
+    lote.insert(1, {"curso": "Sanity Curso", "nota_final": "no-numérica"})
+    res = insert_evaluaciones_bulk(lote, path=str(tmp_db))
+    assert len(res["ids"]) == 3 and len(set(res["ids"])) == 3
+    assert [e["indice"] for e in res["errores"]] == [1]
+    ids = {r["id"] for r in list_detalle(path=str(tmp_db), filtro_texto="Bulk")}
+    assert set(res["ids"]) <= ids
+    print(f"  -> ids={res['ids']}, errores={len(res['errores'])}")
+
+    # Clave natural única: repetir el lote no duplica y re-guardar una evaluación la sobrescribe
+    rep = insert_evaluaciones_bulk(lote, path=str(tmp_db), on_conflict="skip")
+    assert rep["insertadas"] == 0 and rep["omitidas"] == 3 and rep["ids"] == []
+    # Sin política, un duplicado es un error de su fila y el resto del lote se inserta
+    extra = dict(lote[0], evaluacion="Duplicados", plantilla=None)
+    dup = insert_evaluaciones_bulk([lote[0], extra, extra], path=str(tmp_db))
+    assert len(dup["ids"]) == 1 and [e["indice"] for e in dup["errores"]] == [0, 2]
+    corregido = dict(item, observaciones="Nota corregida")
+    assert insert_evaluacion(corregido, path=str(tmp_db), on_conflict="update") == new_id
+    assert [r["observaciones"] for r in list_detalle(path=str(tmp_db), filtro_texto="Test Student")] == ["Nota corregida"]
+
+    # Paginación keyset: recorrer todas las páginas devuelve lo mismo que el listado completo
+    paginados, token = [], None
+    while True:
+        pagina, token = list_resumen_page(path=str(tmp_db), page_size=2, after=token)
+        paginados.extend(r["id"] for r in pagina)
+        if token is None:
+            break
+    assert sorted(paginados) == sorted(r["id"] for r in list_resumen(path=str(tmp_db)))
+    assert len(paginados) == len(set(paginados))
+    print(f"  -> paginación OK ({len(paginados)} filas)")
+
+    # Recálculo: la simulación no escribe; el recálculo real deja las notas de los criterios
+    sim = recalcular_notas("Civil", path=str(tmp_db), dry_run=True)
+    assert sim["cambiadas"] == 3 and sim["delta"]["mean"] == 4.0
+    assert {r["nota_final"] for r in list_detalle(path=str(tmp_db), filtro_texto="Bulk")} == {0.0}
+    # Unos pesos propuestos sólo se simulan: escribirlos dejaría notas distintas de las de la app
+    propuestos = dict(TEMPLATES["Civil"]["pesos"], ia=10, presentacion=25)
+    assert recalcular_notas("Civil", pesos=propuestos, path=str(tmp_db), dry_run=True)["filas"] == sim["filas"]
+    try:
+        recalcular_notas("Civil", pesos=propuestos, path=str(tmp_db))
+    except DBError:
+        pass
+    else:
+        raise AssertionError("se esperaba DBError al escribir pesos que no son los de TEMPLATES")
+    recalcular_notas("Civil", path=str(tmp_db))
+    assert {r["nota_final"] for r in list_detalle(path=str(tmp_db), filtro_texto="Bulk")} == {4.0}
+    bulk = stats_por_grupo(path=str(tmp_db), evaluacion="Bulk")
+    assert bulk[0]["nota_final_min"] == bulk[0]["nota_final_max"] == 4.0
+    # Un cambio hecho fuera de db.py deja el mínimo/máximo pendiente: la lectura lo calcula sin escribir
+    raw = sqlite3.connect(str(tmp_db))
+    raw.execute("UPDATE evaluaciones SET nota_final = 5.0 WHERE evaluacion = 'Bulk' AND grupo_o_estudiante = 'Grupo 1'")
+    raw.commit()
+    bulk = stats_por_grupo(path=str(tmp_db), evaluacion="Bulk")
+    assert (bulk[0]["nota_final_min"], bulk[0]["nota_final_max"]) == (4.0, 5.0)
+    assert raw.execute("SELECT stale FROM resumen_stats WHERE evaluacion = 'Bulk'").fetchone()[0] == 1
+    raw.close()
+    print("  -> recálculo OK")
+
+    # Roster cacheado: el fichero más reciente con columna `group`; sólo se relee si cambia
+    with tempfile.TemporaryDirectory() as tmp:
+        (Path(tmp) / "roster_groups_1.csv").write_text("group\nA\nB\nA\n")
+        (Path(tmp) / "roster_groups_2.csv").write_text("otra\nX\n")
+        os.utime(tmp, ns=(0, 10**9))  # directorio sin cambios recientes
+        provider = RosterProvider(tmp)
+        assert provider.roster() == ["A", "B"] and provider.roster() == ["A", "B"]
+        assert provider.listados == 1 and provider.lecturas == 2
+        nuevo = Path(tmp) / "roster_groups_1.csv"
+        nuevo.write_text("group\nC\n")
+        os.utime(nuevo, ns=(0, 10**9))
+        assert provider.roster() == ["C"] and provider.lecturas == 3
+        # Un fichero creado sin que cambie el mtime del directorio (mismo "tick" que el
+        # último listado) aparece igualmente: un listado con mtime reciente se repite
+        ahora = time.time_ns()
+        os.utime(tmp, ns=(ahora, ahora))
+        assert provider.roster() == ["C"]
+        (Path(tmp) / "roster_groups_3.csv").write_text("group\nZ\n")
+        os.utime(tmp, ns=(ahora, ahora))
+        assert provider.roster() == ["Z"]
+    print("  -> roster OK")
+
+    # Buffer CSV incremental: mismo CSV (con BOM) que pandas sobre las mismas filas
+    buffer = CsvBuffer(["grupo_o_estudiante", "nota_final", "observaciones"])
+    filas = [
+        {"grupo_o_estudiante": "Núñez, Ana", "nota_final": 4.25, "observaciones": 'Línea 1\n"citada"'},
+        {"grupo_o_estudiante": "B", "nota_final": 3.0, "observaciones": None},
+    ]
+    for fila in filas:
+        buffer.append(fila)
+    esperado = pd.DataFrame(filas).to_csv(index=False).encode("utf-8-sig")
+    assert buffer.csv_bytes() == esperado and len(buffer.to_dataframe()) == 2
+    print("  -> buffer CSV OK")
+
+    # Diario CSV: un fichero heredado con otras columnas se compacta antes de anexar;
+    # la fila del roster antiguo (7 campos) se migra y la que no encaja va a `.descartadas.csv`
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = Path(tmp) / "evaluaciones_only_csv.csv"
+        ruta.write_text(
+            "\ufeffcurso,grupo_o_estudiante,nota_final\nMat,A,4.0\nCivil,Mat,B,0.0\n"
+            "Civil,Mat,Parcial,2025-01-01,R,0.0,\n",
+            encoding="utf-8",
+        )
+        journal = CsvJournal(str(ruta), fsync="never")
+        journal.append([{"curso": "Mat", "grupo_o_estudiante": "C", "observaciones": "dos\nlíneas"}])
+        journal.close()
+        raw = ruta.read_bytes()
+        assert raw.startswith(b"\xef\xbb\xbf") and raw.count(b"\xef\xbb\xbf") == 1
+        df_j = pd.read_csv(ruta, encoding="utf-8-sig")
+        assert list(df_j.columns) == JOURNAL_COLUMNS and df_j["grupo_o_estudiante"].tolist() == ["A", "R", "C"]
+        assert df_j.loc[1, "plantilla"] == "Civil" and df_j.loc[1, "evaluacion"] == "Parcial"
+        assert (Path(tmp) / "evaluaciones_only_csv.descartadas.csv").read_text() == "Civil,Mat,B,0.0\n"
+        # Un fichero que no es UTF-8 da JournalError (lo que captura la app), no una traza
+        ruta.write_bytes("curso,grupo_o_estudiante\nQuímica,A\n".encode("latin-1"))
+        try:
+            CsvJournal(str(ruta), fsync="never").append([{"curso": "Mat"}])
+        except JournalError:
+            pass
+        else:
+            raise AssertionError("se esperaba JournalError")
+    print("  -> diario CSV OK")
+
+    # Instrumentación: con umbral 0 toda llamada es lenta y va al log con su plan
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = Path(tmp) / "slow.log"
+        querylog.configurar(activa=True, umbral_ms=0, log_path=str(log_path))
+        try:
+            list_resumen(path=str(tmp_db))
+        finally:
+            querylog.configurar(activa=False, log_path=str(querylog.SLOW_LOG_DEFAULT))
+        registro = querylog.recientes(1)[0]
+        assert registro["funcion"] == "list_resumen" and registro["filas"] == len(list_resumen(path=str(tmp_db)))
+        assert registro["sql"] and all(registro["planes"].values())
+        assert '"funcion": "list_resumen"' in log_path.read_text(encoding="utf-8")
+    print("  -> instrumentación OK")
+
+    # Perfilado por secciones: desactivado no mide nada; activo acumula en la ventana
+    perfil.limpiar()
+    apagado = perfil.Cronometro(False)
+    apagado.seccion("a")
+    assert apagado.fin() == {} and perfil.resumen() == []
+    crono = perfil.Cronometro(True)
+    for nombre in ("a", "b", "a"):
+        crono.seccion(nombre)
+    tiempos = crono.fin()
+    assert list(tiempos) == ["a", "b", "total"]
+    por_seccion = {r["seccion"]: r for r in perfil.resumen()}
+    assert por_seccion["a"]["n"] == 2 and sum(por_seccion["a"]["histograma"].values()) == 2
+    print("  -> perfilado OK")
+
+    # Métricas: las llamadas a db.py alimentan latencia y filas; texto en formato Prometheus
+    metricas.activar()
+    try:
+        n_resumen = len(list_resumen(path=str(tmp_db)))
+        # El guardado individual también pasa por BEGIN IMMEDIATE y mide la espera por el bloqueo
+        assert insert_evaluacion(item, path=str(tmp_db), on_conflict="skip") == new_id
+    finally:
+        metricas.activar(False)
+    txt = metricas.texto()
+    assert 'califica_db_call_seconds_bucket{funcion="list_resumen",le="+Inf"} 1' in txt
+    assert f'califica_db_rows_total{{funcion="list_resumen"}} {n_resumen}' in txt
+    assert "# TYPE califica_db_call_seconds histogram" in txt
+    assert "califica_db_lock_wait_seconds_count 1" in txt
+    cont = metricas.contador("califica_prueba_eventos", "Prueba", ["tipo"])
+    cont.inc(tipo="a")
+    cont.inc(2, tipo="a")
+    metricas.medidor("califica_prueba_nivel", "Prueba").set(7)
+    txt = metricas.texto()
+    for linea in ("# TYPE califica_prueba_eventos_total counter", 'califica_prueba_eventos_total{tipo="a"} 3',
+                  "# TYPE califica_prueba_nivel gauge", "califica_prueba_nivel 7"):
+        assert linea in txt, linea
+    hist = metricas.histograma("califica_prueba_seconds", "Prueba", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 2.0):
+        hist.observe(v)
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = Path(tmp) / "califica.prom"
+        metricas.escribir(str(ruta))
+        escrito = ruta.read_text(encoding="utf-8")
+    for linea in ('califica_prueba_seconds_bucket{le="0.1"} 1', 'califica_prueba_seconds_bucket{le="1"} 2',
+                  'califica_prueba_seconds_bucket{le="+Inf"} 3', "califica_prueba_seconds_count 3"):
+        assert linea in escrito, linea
+    print("  -> métricas OK")
+
+    # Cargador: la fila sin plantilla se califica y se guarda con la primera, así que se puede recalcular
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "carga.csv"
+        pd.DataFrame([
+            {"plantilla": "", "curso": "Carga", "evaluacion": "P1", "fecha": "2025-10-30", "grupo_o_estudiante": "A",
+             "estructura": 4, "programacion": 4, "teoria": 4, "ia": 4, "reflexion": 4, "presentacion": 4,
+             "observaciones": ""},
+        ]).to_csv(csv_path, index=False)
+        carga_db = str(Path(tmp) / "carga.db")
+        resumen_carga = main_streaming(str(csv_path), carga_db)
+        assert resumen_carga["inserted_count"] == 1
+        primera = next(iter(TEMPLATES))
+        cargada = list_detalle(path=carga_db)[0]
+        assert cargada["plantilla"] == primera, cargada
+        assert recalcular_notas(primera, path=carga_db, dry_run=True)["filas"] == 1
+    print("  -> cargador OK")
+
     print("\nSANITY CHECK: OK ✅")
 
 
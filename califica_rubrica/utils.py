@@ -1,4 +1,6 @@
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Sequence, Tuple, Union
+
+import numpy as np
 
 # Plantillas disponibles y sus pesos/descripciones
 TEMPLATES: Dict[str, Dict[str, Dict[str, Any]]] = {
@@ -90,11 +92,103 @@ def validate_notas(notas: Dict[str, Any]) -> None:
             raise ValueError(f"La nota para '{k}' está fuera del rango 1-5: {val}")
 
 
+def _two_product(a: np.ndarray, b: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Producto exacto a*b = p + err (algoritmo de Dekker, sin FMA)."""
+    split = 134217729.0  # 2**27 + 1
+    p = a * b
+    c = split * a
+    a_hi = c - (c - a)
+    a_lo = a - a_hi
+    c = split * b
+    b_hi = c - (c - b)
+    b_lo = b - b_hi
+    err = ((a_hi * b_hi - p) + a_hi * b_lo + a_lo * b_hi) + a_lo * b_lo
+    return p, err
+
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    """Redondea a 2 decimales con el mismo resultado que `round(x, 2)` de Python.
+
+    `np.round` redondea x*100 ya redondeado en coma flotante y puede diferir de
+    `round()` (que usa el valor exacto, con empate al par) cuando x*100 cae
+    casi en .5. Aquí se calcula x*100 de forma exacta como p + err y se decide
+    el redondeo con ese valor exacto, sin bucles en Python.
+    """
+    p, err = _two_product(values, 100.0)
+    f = np.floor(p)
+    # (p - f) está en [0, 1) y su diferencia con 0.5 es exacta; el signo decide
+    s = (p - f - 0.5) + err
+    up = (s > 0) | ((s == 0) & (np.fmod(f, 2.0) != 0))
+    out = (f + up) / 100.0
+    return np.where(np.isfinite(values), out, values)
+
+
+def _as_float_matrix(scores_matrix: Any, ncols: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Convierte a matriz float (N, ncols); devuelve (matriz, máscara de filas no numéricas)."""
+    try:
+        m = np.asarray(scores_matrix, dtype=float)
+        bad = np.zeros(m.shape[0] if m.ndim else 0, dtype=bool)
+    except (TypeError, ValueError):
+        # Camino lento sólo si hay celdas no convertibles (p.ej. texto en un CSV)
+        raw = np.asarray(scores_matrix, dtype=object)
+        m = np.full(raw.shape, np.nan)
+        bad = np.zeros(raw.shape[0], dtype=bool)
+        for (i, j), v in np.ndenumerate(raw):
+            try:
+                m[i, j] = np.nan if v is None else float(v)
+            except (TypeError, ValueError):
+                bad[i] = True
+    if m.ndim != 2 or m.shape[1] != ncols:
+        raise ValueError(f"Se esperaba una matriz (N, {ncols}) de notas; forma recibida: {m.shape}")
+    return m, bad
+
+
+def nota_final_batch(
+    scores_matrix: Any,
+    template: Union[str, Dict[str, int], None] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Calcula la nota final ponderada de N filas a la vez.
+
+    Args:
+        scores_matrix: matriz (N, C) de notas (lista de listas, ndarray o DataFrame).
+            Las columnas siguen el orden de los pesos de la plantilla
+            (`list(pesos)`); NaN/None indica que ese criterio no se puntuó y no
+            cuenta, igual que una clave ausente en `nota_final`.
+        template: nombre de plantilla de `TEMPLATES`, dict de pesos o None
+            (primera plantilla).
+
+    Returns:
+        (notas, errores): `notas` es un array float (N,) redondeado a 2 decimales
+        con el mismo resultado que `nota_final` fila a fila (NaN en filas con
+        error); `errores` es una máscara bool (N,) de filas con alguna nota no
+        numérica o fuera del rango 1..5.
+    """
+    if template is None or isinstance(template, str):
+        pesos, _ = get_template(template) if template else get_template("")
+    else:
+        pesos = template
+
+    m, errores = _as_float_matrix(scores_matrix, len(pesos))
+    present = ~np.isnan(m)
+    errores = errores | np.any(present & ((m < 1.0) | (m > 5.0)), axis=1)
+
+    # Mismo orden de operaciones que `nota_final` para obtener bits idénticos
+    total = np.zeros(m.shape[0])
+    for j, w in enumerate(pesos.values()):
+        col = m[:, j]
+        total += np.where(present[:, j], col * (w / 100.0), 0.0)
+
+    notas = _round2(total)
+    notas[errores] = np.nan
+    return notas, errores
+
+
 def nota_final(notas: Dict[str, Any], pesos: Dict[str, int] = None) -> float:
     """Calcula la nota final ponderada usando `pesos`.
 
     Solo se consideran las claves presentes en `notas` y `pesos`.
-    El resultado se redondea a 2 decimales.
+    El resultado se redondea a 2 decimales. Es un envoltorio de una fila
+    sobre `nota_final_batch`.
     """
     if not notas:
         return 0.0
@@ -106,14 +200,9 @@ def nota_final(notas: Dict[str, Any], pesos: Dict[str, int] = None) -> float:
         first = next(iter(TEMPLATES.values()))
         pesos = first["pesos"]
 
-    total = 0.0
-    for k, w in pesos.items():
-        if k in notas:
-            val = float(notas[k])
-            total += val * (w / 100.0)
-
-    result = round(total, 2)
-    return result
+    fila = [float(notas[k]) if k in notas else np.nan for k in pesos]
+    valores, _ = nota_final_batch([fila], pesos)
+    return float(valores[0])
 
 
 def niveles_texto() -> str:
@@ -206,6 +295,25 @@ if __name__ == "__main__":
     got = nota_final(sample)
     assert got == expected, f"nota_final incorrecta: got={got} expected={expected}"
 
+    # nota_final_batch coincide con el cálculo escalar original, incluidos los redondeos en .xx5
+    def _nota_escalar(n, p):
+        total = 0.0
+        for k, w in p.items():
+            if k in n:
+                total += float(n[k]) * (w / 100.0)
+        return round(total, 2)
+
+    rng = np.random.default_rng(0)
+    for nombre, t in TEMPLATES.items():
+        mat = rng.choice(np.arange(1.0, 5.01, 0.5), size=(2000, len(t["pesos"])))
+        got_batch, err = nota_final_batch(mat, nombre)
+        assert not err.any()
+        for fila, g in zip(mat, got_batch):
+            esperado = _nota_escalar(dict(zip(t["pesos"], fila)), t["pesos"])
+            assert g == esperado, f"nota_final_batch({nombre}) = {g} != {esperado}"
+    _, err = nota_final_batch([[1, 2, 3, 4, 5, 6], [1, None, 3, 4, 5, 5], ["x", 2, 3, 4, 5, 5]])
+    assert err.tolist() == [True, False, True]
+
     # Niveles texto
     assert "1=Deficiente" in niveles_texto()
 
@@ -1,25 +1,71 @@
 """
-Carga masiva de CSV de evaluaciones a la tabla `evaluaciones` en `rubrica.db`.
+Carga masiva de CSV de evaluaciones a la tabla `evaluaciones` de la app.
+
+Usa el mismo código que la app (`califica_rubrica/db.py`): pool de
+conexiones, migraciones del esquema, upsert en bloque y motor de calificación
+(`utils.nota_final_batch` con las plantillas de `utils.TEMPLATES`).
 
 Requisitos:
-  pip install pandas
+  pip install -r califica_rubrica/requirements.txt
 
 Uso:
   python tools/load_csv_to_sqlite.py --csv data/demo_evaluaciones_15.csv
+  python tools/load_csv_to_sqlite.py --csv export_semestre.csv --chunksize 20000 --db otra.db
+  python tools/load_csv_to_sqlite.py --csv data/secciones/ --workers 8
+  python tools/load_csv_to_sqlite.py --csv "data/secciones/**/*.csv"
 
 Notas:
-  - No elimina la base si existe; inserta filas adicionales (id autoincremental).
-  - La tabla `evaluaciones` se crea si no existe.
+  - Por defecto escribe en la BD de la app (`califica_rubrica/rubrica.db`). No
+    elimina la base si existe; el esquema se crea o actualiza con las migraciones.
+  - El CSV se lee por bloques de `--chunksize` filas: cada bloque se valida y
+    califica de forma vectorial y se escribe en una única transacción,
+    informando del rendimiento (filas/s) por bloque.
+  - Columna opcional `plantilla`: cada fila se califica con los pesos de su
+    plantilla (vacía = la primera de `TEMPLATES`, cuyo nombre se guarda en la
+    fila; desconocida = fila inválida). Si el CSV trae `nota_final` se respeta
+    la dada.
+  - La clave natural (curso, evaluacion, fecha, grupo_o_estudiante) es única.
+    Las filas repetidas se resuelven con `INSERT ... ON CONFLICT` según
+    `--on-conflict`: `skip` (por defecto) conserva la existente y `update` la
+    sobrescribe.
+  - Si `--csv` es un directorio o un patrón glob se cargan todos los ficheros:
+    se parsean y validan en paralelo (`--workers` procesos) y un único proceso
+    escribe en la BD. Cada fichero tiene su informe en `informes/` junto al CSV.
+  - Las cargas por bloques son reanudables: la tabla `cargas_csv` guarda, por
+    hash (sha256) del fichero, cuántas filas se han confirmado. Si la carga se
+    interrumpe, al relanzarla continúa tras el último bloque confirmado, y un
+    fichero ya cargado por completo se omite. `--force` ignora los checkpoints.
+  - `--metrics-file ruta` escribe al terminar las métricas de la carga (filas
+    por resultado, duración de cada bloque, llamadas a la BD y esperas por el
+    bloqueo de escritura) en formato de texto de Prometheus (ver
+    `califica_rubrica/metricas.py`). También se respetan las variables
+    `CALIFICA_METRICS_PORT` / `CALIFICA_METRICS_FILE` de la app.
 """
 from __future__ import annotations
 
 import argparse
+from collections import deque
+import csv
+import glob
+import hashlib
+import itertools
+import multiprocessing
+import queue
 import sqlite3
 from datetime import datetime
 import sys
 import os
+import time
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+
+# Reutilizar db.py/utils.py de la app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "califica_rubrica"))
+
+from db import DB_DEFAULT, begin_immediate, get_conn, init_db, upsert_evaluaciones  # noqa: E402
+import metricas  # noqa: E402
+from migrations import CARGAS_TABLE  # noqa: E402
+from utils import TEMPLATES, get_template, nota_final_batch  # noqa: E402
 
 
 REQUIRED_COLUMNS = [
@@ -37,237 +83,602 @@ REQUIRED_COLUMNS = [
 ]
 
 
-def open_conn(path: str = "rubrica.db") -> sqlite3.Connection:
-    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
-    cur = conn.cursor()
-    # PRAGMAs según especificación
-    cur.execute("PRAGMA journal_mode=WAL;")
-    cur.execute("PRAGMA synchronous=NORMAL;")
-    cur.execute("PRAGMA foreign_keys=ON;")
-    conn.commit()
-    return conn
-
-
-def init_db(conn: sqlite3.Connection) -> None:
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS evaluaciones (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            curso TEXT,
-            evaluacion TEXT,
-            fecha TEXT,
-            grupo_o_estudiante TEXT,
-            estructura REAL,
-            programacion REAL,
-            teoria REAL,
-            ia REAL,
-            reflexion REAL,
-            presentacion REAL,
-            nota_final REAL,
-            observaciones TEXT,
-            created_at TEXT
-        )
-        """
-    )
-    conn.commit()
+CRITERIOS = ["estructura", "programacion", "teoria", "ia", "reflexion", "presentacion"]
+TEXT_COLUMNS = ["plantilla", "curso", "evaluacion", "fecha", "grupo_o_estudiante", "observaciones"]
+KEY_COLUMNS = ["curso", "evaluacion", "fecha", "grupo_o_estudiante"]
+INSERT_COLUMNS = ["plantilla"] + KEY_COLUMNS + CRITERIOS + ["nota_final", "observaciones", "created_at"]
+REPORT_COLUMNS = ["id", "curso", "evaluacion", "fecha", "grupo_o_estudiante", "nota_final", "created_at"]
 
+M_FILAS = metricas.contador("califica_loader_rows", "Filas procesadas por el cargador de CSV", ["resultado"])
+M_BLOQUE = metricas.histograma(
+    "califica_loader_block_seconds",
+    "Duración de cada bloque del cargador (validación y escritura)",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
 
-def validar_fila(row: Dict[str, Any]) -> None:
-    # validar notas
-    for col in ["estructura", "programacion", "teoria", "ia", "reflexion", "presentacion"]:
-        try:
-            val = float(row[col])
-        except Exception:
-            raise ValueError(f"Columna {col} debe ser numérica en la fila: {row}")
-        if not (1.0 <= val <= 5.0):
-            raise ValueError(f"Valor fuera de rango en columna {col}: {val} (debe estar entre 1.0 y 5.0)")
 
-    # validar fecha ISO YYYY-MM-DD
+def _fecha_valida(value: Any) -> bool:
     try:
-        datetime.strptime(str(row["fecha"]), "%Y-%m-%d")
+        datetime.strptime(str(value), "%Y-%m-%d")
+        return True
     except Exception:
-        raise ValueError(f"Fecha inválida (esperado YYYY-MM-DD): {row.get('fecha')}")
-
-
-WEIGHTS = {
-    "estructura": 15,
-    "programacion": 20,
-    "teoria": 15,
-    "ia": 10,
-    "reflexion": 15,
-    "presentacion": 25,
-}
-
-
-def calc_nota_final(row: Dict[str, Any]) -> float:
-    total_weight = sum(WEIGHTS.values())
-    s = 0.0
-    for k, w in WEIGHTS.items():
-        s += float(row[k]) * w
-    nota = s / total_weight
-    return round(nota, 2)
-
-
-def insert_row(conn: sqlite3.Connection, row: Dict[str, Any]) -> tuple[int, str]:
-    cur = conn.cursor()
-    now = datetime.now().isoformat()
-    params = (
-        row["curso"],
-        row["evaluacion"],
-        row["fecha"],
-        row["grupo_o_estudiante"],
-        float(row["estructura"]),
-        float(row["programacion"]),
-        float(row["teoria"]),
-        float(row["ia"]),
-        float(row["reflexion"]),
-        float(row["presentacion"]),
-        float(row["nota_final"]),
-        row.get("observaciones", ""),
-        now,
-    )
-    cur.execute(
-        """
-        INSERT INTO evaluaciones (
-            curso, evaluacion, fecha, grupo_o_estudiante,
-            estructura, programacion, teoria, ia, reflexion, presentacion,
-            nota_final, observaciones, created_at
-        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
-        """,
-        params,
-    )
-    conn.commit()
-    return cur.lastrowid, now
+        return False
+
+
+def preparar_chunk(chunk: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+    """Valida y califica un bloque del CSV de forma vectorial.
+
+    Criterios numéricos en 1..5, fecha YYYY-MM-DD y plantilla conocida (la vacía
+    se resuelve a la primera de `TEMPLATES`). La `nota_final` que falte se
+    calcula con `nota_final_batch`, una llamada por plantilla presente en el
+    bloque.
+
+    Returns:
+        (válidas, errores): DataFrame con las filas válidas (criterios como
+        float, `nota_final` calculada si faltaba y textos vacíos como None) y
+        un mensaje por cada fila descartada.
+    """
+    if "plantilla" not in chunk.columns:
+        chunk = chunk.assign(plantilla=None)
+    nums = chunk[CRITERIOS].apply(pd.to_numeric, errors="coerce")
+    invalid = pd.Series(False, index=chunk.index)
+    motivo = pd.Series("", index=chunk.index)
+
+    for col in CRITERIOS:
+        no_num = nums[col].isna() & ~invalid
+        motivo[no_num] = f"Columna {col} debe ser numérica"
+        invalid |= no_num
+        fuera = ~nums[col].between(1.0, 5.0) & ~invalid
+        motivo[fuera] = f"Valor fuera de rango en columna {col} (debe estar entre 1.0 y 5.0)"
+        invalid |= fuera
+
+    # Pocas fechas distintas por bloque: se validan una vez cada una
+    fechas = chunk["fecha"]
+    validas = {f: _fecha_valida(f) for f in fechas.dropna().unique()}
+    mala_fecha = ~fechas.map(validas).fillna(False).astype(bool) & ~invalid
+    motivo[mala_fecha] = "Fecha inválida (esperado YYYY-MM-DD)"
+    invalid |= mala_fecha
+
+    plantillas = chunk["plantilla"].fillna("")
+    desconocida = (plantillas != "") & ~plantillas.isin(list(TEMPLATES)) & ~invalid
+    motivo[desconocida] = "Plantilla desconocida: " + plantillas[desconocida]
+    invalid |= desconocida
+    # Vacía = la primera plantilla; se guarda su nombre para poder recalcular la nota después
+    plantillas = plantillas.mask(plantillas == "", next(iter(TEMPLATES)))
+
+    calculada = pd.Series(float("nan"), index=chunk.index)
+    for nombre in plantillas[~invalid].unique():
+        mask = (plantillas == nombre) & ~invalid
+        pesos, _ = get_template(nombre)
+        notas, _ = nota_final_batch(nums.loc[mask, list(pesos)].to_numpy(), pesos)
+        calculada[mask] = notas
+    if "nota_final" in chunk.columns:
+        dada = pd.to_numeric(chunk["nota_final"], errors="coerce")
+        mala_nota = chunk["nota_final"].notna() & dada.isna() & ~invalid
+        motivo[mala_nota] = "Columna nota_final debe ser numérica"
+        invalid |= mala_nota
+        usar_dada = dada.notna()
+    else:
+        dada = calculada
+        usar_dada = pd.Series(False, index=chunk.index)
+
+    ok = ~invalid
+    out = chunk.loc[ok, TEXT_COLUMNS].astype(object)
+    out = out.where(out.notna(), None)
+    out["plantilla"] = plantillas[ok]
+    for col in CRITERIOS:
+        out[col] = nums.loc[ok, col].astype(float)
+    out["nota_final"] = [float(d) if u else float(c) for d, c, u in zip(dada[ok], calculada[ok], usar_dada[ok])]
+
+    errores = [f"línea {i + 2}: {motivo[i]}" for i in chunk.index[invalid]]
+    return out, errores
+
+
+def hash_fichero(path: str) -> str:
+    """sha256 del contenido: identifica la carga aunque el fichero cambie de nombre."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for blk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(blk)
+    return h.hexdigest()
+
+
+def leer_checkpoint(conn: sqlite3.Connection, sha256: str) -> Tuple[int, bool]:
+    """Devuelve (filas confirmadas, completo) del checkpoint de un fichero."""
+    row = conn.execute(f"SELECT filas, completo FROM {CARGAS_TABLE} WHERE sha256 = ?", (sha256,)).fetchone()
+    return (int(row[0]), bool(row[1])) if row else (0, False)
+
+
+def iter_chunks(csv_path: str, chunksize: int, desde: int = 0) -> Iterator[pd.DataFrame]:
+    """Lee el CSV por bloques con los textos como str (sin inferir números en `curso`, etc.).
+
+    `desde` salta las primeras filas de datos (registros, no líneas: respeta
+    los campos entrecomillados con saltos de línea) para reanudar una carga.
+    """
+    dtype = {c: str for c in TEXT_COLUMNS}
+    skip = range(1, desde + 1) if desde else None
+    reader = pd.read_csv(csv_path, encoding="utf-8", chunksize=chunksize, dtype=dtype, skiprows=skip)
+    offset = desde
+    for chunk in reader:
+        # índice = posición de la fila de datos en el fichero (para los mensajes)
+        chunk.index = range(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
+
+
+Bloque = Tuple[int, pd.DataFrame, List[str]]
+
+
+def validar_cabecera(csv_path: str) -> None:
+    """Comprueba la cabecera del CSV (sólo lee la primera línea).
+
+    Raises:
+        ValueError si al CSV le faltan columnas requeridas.
+    """
+    columnas = pd.read_csv(csv_path, encoding="utf-8", nrows=0).columns
+    missing = [c for c in REQUIRED_COLUMNS if c not in columnas]
+    if missing:
+        raise ValueError(f"Faltan columnas requeridas en el CSV: {missing}")
 
 
-def find_existing(conn: sqlite3.Connection, row: Dict[str, Any]) -> tuple[int, float] | None:
-    """Busca una fila existente por clave natural y devuelve (id, nota_final) si existe."""
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, nota_final FROM evaluaciones WHERE curso=? AND evaluacion=? AND fecha=? AND grupo_o_estudiante=? LIMIT 1",
-        (row["curso"], row["evaluacion"], row["fecha"], row["grupo_o_estudiante"]),
-    )
-    r = cur.fetchone()
-    if r:
-        return int(r[0]), float(r[1]) if r[1] is not None else 0.0
-    return None
+def leer_bloques(csv_path: str, chunksize: int, desde: int = 0) -> Iterator[Bloque]:
+    """Lee, valida y califica el CSV por bloques: (filas leídas, válidas, errores).
+
+    Raises:
+        ValueError si al CSV le faltan columnas requeridas.
+    """
+    validar_cabecera(csv_path)
+    for chunk in iter_chunks(csv_path, chunksize, desde):
+        validas, errores = preparar_chunk(chunk)
+        yield len(chunk), validas, errores
+
+
+def preparar_fichero(csv_path: str, db_path: str | None = None, force: bool = False) -> Dict[str, Any]:
+    """Cabecera, hash y checkpoint de un CSV, sin leer sus filas ni escribir en la BD.
+
+    Abre su propia conexión de sólo lectura: se llama desde los procesos
+    productores y el pool de `db.py` pertenece al proceso principal (sus
+    conexiones no deben cruzar un `fork`).
+
+    Returns:
+        dict con `sha256`, `desde` (filas ya confirmadas), `completo` y
+        `error` (mensaje si el fichero no se pudo leer o le faltan columnas).
+    """
+    res: Dict[str, Any] = {"sha256": None, "desde": 0, "completo": False, "error": None}
+    try:
+        validar_cabecera(csv_path)
+        res["sha256"] = hash_fichero(csv_path)
+        if db_path and not force:
+            conn = sqlite3.connect(db_path, timeout=30)
+            try:
+                res["desde"], res["completo"] = leer_checkpoint(conn, res["sha256"])
+            finally:
+                conn.close()
+    except Exception as e:
+        res["error"] = str(e)
+    return res
+
+
+def cargar_bloques(
+    conn: sqlite3.Connection,
+    bloques: Iterable[Bloque],
+    report_path: str,
+    on_conflict: str = "skip",
+    etiqueta: str = "",
+    carga: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    """Escribe bloques ya validados: una transacción y un `INSERT ... ON CONFLICT` por bloque.
+
+    Los duplicados de la clave natural (en la BD o dentro del propio CSV) se
+    resuelven en SQLite con el índice único según `on_conflict` ('skip' o
+    'update'), y los recuentos se obtienen con una consulta por bloque. El
+    informe de inserción se escribe a medida que se confirman los bloques.
+
+    Con `carga` (`sha256`, `archivo`, `desde`) se actualiza el checkpoint del
+    fichero en la misma transacción que cada bloque y al final se marca como
+    completo. La cabecera del CSV debe estar ya validada (`validar_cabecera`):
+    el checkpoint se toca antes de leer el primer bloque. Al reanudar
+    (`desde > 0`) el informe se abre para anexar, sin truncarlo.
+
+    Returns:
+        Contadores acumulados (leidas, inserted, skipped, updated, invalid y
+        suma/mínimo/máximo de `nota_final` de las insertadas).
+    """
+    c: Dict[str, Any] = {
+        "leidas": 0, "inserted": 0, "skipped": 0, "updated": 0, "invalid": 0,
+        "nota_sum": 0.0, "nota_min": None, "nota_max": None,
+    }
+    if carga is not None:
+        begin_immediate(conn)
+        conn.execute(
+            f"INSERT INTO {CARGAS_TABLE} (sha256, archivo, filas) VALUES (?, ?, ?) "
+            "ON CONFLICT(sha256) DO UPDATE SET archivo = excluded.archivo, filas = excluded.filas, "
+            "completo = 0, actualizado = CURRENT_TIMESTAMP",
+            (carga["sha256"], carga["archivo"], carga["desde"]),
+        )
+        conn.commit()
+        hechas = carga["desde"]
+    reanudada = carga is not None and carga["desde"] > 0
+    with open(report_path, "a" if reanudada else "w", newline="", encoding="utf-8") as rep:
+        writer = csv.writer(rep, lineterminator=os.linesep)
+        if rep.tell() == 0:
+            writer.writerow(REPORT_COLUMNS)
+        tc = time.perf_counter()
+        for n, (leidas, validas, errores) in enumerate(bloques, start=1):
+            for e in errores:
+                print(f"Fila inválida: {etiqueta}{e}")
+            # Mismo formato y reloj que el DEFAULT CURRENT_TIMESTAMP de la app
+            now = conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+            cols = INSERT_COLUMNS[:-1]
+            rows = list(zip(*(validas[col] for col in cols), [now] * len(validas)))
+            begin_immediate(conn)
+            try:
+                res = upsert_evaluaciones(conn, INSERT_COLUMNS, rows, on_conflict)
+                if carga is not None:
+                    hechas += leidas
+                    conn.execute(
+                        f"UPDATE {CARGAS_TABLE} SET filas = MAX(filas, ?), actualizado = CURRENT_TIMESTAMP "
+                        "WHERE sha256 = ?",
+                        (hechas, carga["sha256"]),
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            nuevas = validas[res["nuevas"]]
+            ids = [i for i, nueva in zip(res["ids"], res["nuevas"]) if nueva]
+            writer.writerows(
+                zip(ids, *(nuevas[col] for col in KEY_COLUMNS), nuevas["nota_final"], [now] * len(ids))
+            )
+
+            c["leidas"] += leidas
+            c["invalid"] += len(errores)
+            c["inserted"] += res["insertadas"]
+            c["skipped"] += res["omitidas"]
+            c["updated"] += res["actualizadas"]
+            if len(ids):
+                c["nota_sum"] += float(nuevas["nota_final"].sum())
+                lo, hi = float(nuevas["nota_final"].min()), float(nuevas["nota_final"].max())
+                c["nota_min"] = lo if c["nota_min"] is None else min(c["nota_min"], lo)
+                c["nota_max"] = hi if c["nota_max"] is None else max(c["nota_max"], hi)
+            dt = time.perf_counter() - tc
+            if metricas.activas():
+                M_BLOQUE.observe(dt)
+                for resultado, valor in (
+                    ("insertadas", res["insertadas"]), ("omitidas", res["omitidas"]),
+                    ("actualizadas", res["actualizadas"]), ("invalidas", len(errores)),
+                ):
+                    M_FILAS.inc(valor, resultado=resultado)
+            print(
+                f"{etiqueta}Bloque {n}: {leidas} filas ({res['insertadas']} insertadas, {res['omitidas']} omitidas, "
+                f"{res['actualizadas']} actualizadas, {len(errores)} inválidas) en {dt:.2f}s "
+                f"-> {leidas / dt if dt else 0:.0f} filas/s"
+            )
+            tc = time.perf_counter()
+    if carga is not None:
+        begin_immediate(conn)
+        conn.execute(
+            f"UPDATE {CARGAS_TABLE} SET completo = 1, actualizado = CURRENT_TIMESTAMP WHERE sha256 = ?",
+            (carga["sha256"],),
+        )
+        conn.commit()
+    return c
+
+
+def escribir_resumen(c: Dict[str, Any], seconds: float, summary_path: str) -> Dict[str, Any]:
+    """Genera el resumen agregado de una carga (mismo formato que el modo fila a fila)."""
+    rate = c["leidas"] / seconds if seconds else 0.0
+    if c["inserted"]:
+        summary = {
+            "inserted_count": c["inserted"],
+            "skipped_count": c["skipped"],
+            "nota_avg": round(c["nota_sum"] / c["inserted"], 2),
+            "nota_min": c["nota_min"],
+            "nota_max": c["nota_max"],
+        }
+    else:
+        summary = {"inserted_count": 0, "skipped_count": c["skipped"], "nota_avg": "", "nota_min": "", "nota_max": ""}
+    summary.update({
+        "updated_count": c["updated"], "invalid_count": c["invalid"],
+        "seconds": round(seconds, 3), "rows_per_sec": round(rate, 1),
+    })
+    try:
+        pd.DataFrame(list(summary.items()), columns=["metric", "value"]).to_csv(summary_path, index=False, encoding="utf-8")
+        print(f"Resumen agregado creado: {summary_path}")
+    except Exception as e:
+        print(f"No se pudo escribir el resumen agregado: {e}")
+    return summary
 
 
-def main(csv_path: str) -> None:
+def main_streaming(
+    csv_path: str,
+    db_path: str | None = None,
+    chunksize: int = 10000,
+    on_conflict: str = "skip",
+    force: bool = False,
+) -> Dict[str, Any]:
+    """Carga un CSV por bloques (ver `cargar_bloques`), reanudando desde su checkpoint.
+
+    La memoria usada depende de `chunksize` y no del tamaño del CSV.
+
+    Returns:
+        Resumen con filas insertadas, omitidas, actualizadas, inválidas, segundos
+        y filas/s; o `{"ya_cargado": True}` si el fichero ya se había cargado.
+    """
     if not os.path.exists(csv_path):
         print(f"Archivo no encontrado: {csv_path}")
         sys.exit(1)
 
+    report_dir = os.path.dirname(csv_path) or "data"
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(report_dir, f"insert_report_{ts}.csv")
+    summary_path = os.path.join(report_dir, f"insert_report_{ts}_summary.csv")
+
+    os.makedirs(report_dir, exist_ok=True)
+    db_path = str(db_path or DB_DEFAULT)
+    init_db(db_path)
+
     try:
-        df = pd.read_csv(csv_path, encoding="utf-8")
+        validar_cabecera(csv_path)
     except Exception as e:
-        print(f"Error leyendo CSV: {e}")
+        print(f"Error cargando CSV: {e}")
         sys.exit(1)
 
-    # comprobar columnas
-    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
-    if missing:
-        print(f"Faltan columnas requeridas en el CSV: {missing}")
-        sys.exit(1)
-
-    # abrir DB y crear tabla si hace falta
-    conn = open_conn("rubrica.db")
-    init_db(conn)
-
-    inserted = 0
-    skipped = 0
-    inserted_rows: list[Dict[str, Any]] = []
-    skipped_rows: list[Dict[str, Any]] = []
-    for _, r in df.iterrows():
-        row = {c: r[c] for c in REQUIRED_COLUMNS}
-        # calcular nota_final si no existe
-        if "nota_final" not in r.index or pd.isna(r.get("nota_final", None)):
-            row["nota_final"] = calc_nota_final(row)
-        else:
-            row["nota_final"] = float(r["nota_final"])
-
-        try:
-            validar_fila(row)
-        except ValueError as e:
-            print(f"Fila inválida: {e}")
-            continue
+    with get_conn(db_path) as conn:
+        sha = hash_fichero(csv_path)
+        desde, completo = (0, False) if force else leer_checkpoint(conn, sha)
+        if completo:
+            print(f"{csv_path} ya se cargó completo (sha256 {sha[:12]}); se omite. Usa --force para recargarlo.")
+            return {"ya_cargado": True}
+        if desde:
+            print(f"Reanudando {csv_path} tras {desde} filas ya confirmadas")
 
+        t0 = time.perf_counter()
         try:
-            # deduplicación: evitar insertar si ya existe la misma combinación clave
-            exists = find_existing(conn, row)
-            if exists:
-                ex_id, ex_nota = exists
-                skipped += 1
-                skipped_rows.append(
-                    {
-                        "existing_id": ex_id,
-                        "curso": row["curso"],
-                        "evaluacion": row["evaluacion"],
-                        "fecha": row["fecha"],
-                        "grupo_o_estudiante": row["grupo_o_estudiante"],
-                        "existing_nota_final": ex_nota,
-                    }
-                )
-            else:
-                lastid, created_at = insert_row(conn, row)
-                inserted += 1
-                inserted_rows.append(
-                    {
-                        "id": lastid,
-                        "curso": row["curso"],
-                        "evaluacion": row["evaluacion"],
-                        "fecha": row["fecha"],
-                        "grupo_o_estudiante": row["grupo_o_estudiante"],
-                        "nota_final": row["nota_final"],
-                        "created_at": created_at,
-                    }
-                )
+            carga = {"sha256": sha, "archivo": os.path.abspath(csv_path), "desde": desde}
+            c = cargar_bloques(conn, leer_bloques(csv_path, chunksize, desde), report_path, on_conflict, carga=carga)
         except Exception as e:
-            print(f"Error insertando fila: {e}")
+            print(f"Error cargando CSV: {e}")
+            sys.exit(1)
+
+    seconds = time.perf_counter() - t0
+    rate = c["leidas"] / seconds if seconds else 0.0
+    print(f"Cargadas {c['inserted']} filas desde {csv_path} -> {db_path} en {seconds:.2f}s ({rate:.0f} filas/s)")
+    print(f"Informe de inserción creado: {report_path}")
+    return escribir_resumen(c, seconds, summary_path)
+
+
+def expandir_entradas(patron: str) -> List[str]:
+    """Lista los CSV a cargar: un fichero, todos los `*.csv` de un directorio o un patrón glob."""
+    if os.path.isdir(patron):
+        paths = glob.glob(os.path.join(patron, "*.csv"))
+    elif any(ch in patron for ch in "*?["):
+        paths = glob.glob(patron, recursive=True)
+    else:
+        paths = [patron]
+    # Los informes que genera este script no son entradas
+    return sorted(
+        p for p in paths
+        if os.path.isfile(p)
+        and not os.path.basename(p).startswith("insert_report_")
+        and os.path.basename(os.path.dirname(p)) != "informes"
+    )
 
-    conn.close()
-    print(f"Cargadas {inserted} filas desde {csv_path} -> rubrica.db")
 
-    # Generar informe CSV con los ids insertados y notas calculadas
-    report_dir = os.path.dirname(csv_path) or "data"
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    report_path = os.path.join(report_dir, f"insert_report_{ts}.csv")
+def es_multiple(patron: str) -> bool:
+    return os.path.isdir(patron) or any(ch in patron for ch in "*?[")
+
+
+BLOQUES_EN_COLA = 2
+
+
+def _producir(csv_path: str, chunksize: int, db_path: str, force: bool, cola: Any) -> None:
+    """Proceso productor de `main_multi`: valida un CSV y envía sus bloques uno a uno.
+
+    Mensajes por `cola`: `("info", preparar_fichero(...))`, después un
+    `("bloque", bloque)` por bloque y `("fin", None)` o `("error", mensaje)`.
+    La cola está acotada: si el escritor va por detrás, el productor espera en
+    `put` en lugar de acumular bloques en memoria.
+    """
+    prep = preparar_fichero(csv_path, db_path, force)
+    cola.put(("info", prep))
+    if prep["error"] or prep["completo"]:
+        return
     try:
-        if inserted_rows:
-            pd.DataFrame(inserted_rows).to_csv(report_path, index=False, encoding="utf-8")
-        else:
-            # crear archivo vacío con cabeceras si no hubo inserts
-            pd.DataFrame(columns=["id", "curso", "evaluacion", "fecha", "grupo_o_estudiante", "nota_final", "created_at"]).to_csv(report_path, index=False, encoding="utf-8")
-        print(f"Informe de inserción creado: {report_path}")
+        for bloque in leer_bloques(csv_path, chunksize, prep["desde"]):
+            cola.put(("bloque", bloque))
     except Exception as e:
-        print(f"No se pudo escribir el informe CSV: {e}")
+        cola.put(("error", str(e)))
+        return
+    cola.put(("fin", None))
 
-    # Generar resumen agregado (inserted count, skipped count, avg/min/max de nota_final sobre los insertados)
-    summary_path = os.path.join(report_dir, f"insert_report_{ts}_summary.csv")
+
+def _recibir(cola: Any, proc: multiprocessing.Process) -> Tuple[str, Any]:
+    """Siguiente mensaje del productor; falla si el proceso murió sin enviarlo."""
+    while True:
+        try:
+            return cola.get(timeout=1.0)
+        except queue.Empty:
+            if not proc.is_alive():
+                try:
+                    return cola.get(timeout=1.0)
+                except queue.Empty:
+                    raise RuntimeError(
+                        f"El proceso que validaba el fichero terminó inesperadamente (código {proc.exitcode})"
+                    ) from None
+
+
+def _bloques_recibidos(cola: Any, proc: multiprocessing.Process) -> Iterator[Bloque]:
+    while True:
+        tipo, dato = _recibir(cola, proc)
+        if tipo == "fin":
+            return
+        if tipo == "error":
+            raise ValueError(dato)
+        yield dato
+
+
+def _preparados(
+    paths: List[str], chunksize: int, workers: int, db_path: str, force: bool
+) -> Iterator[Tuple[str, Dict[str, Any], Iterator[Bloque]]]:
+    """Entrega en orden `(fichero, checkpoint, bloques)` con la validación en otros procesos.
+
+    Cada fichero en vuelo tiene su proceso productor (`_producir`) y una cola de
+    como mucho `BLOQUES_EN_COLA` bloques; hay `workers` ficheros en vuelo además
+    del que se está escribiendo. La memoria máxima es del orden de
+    `chunksize * workers * (BLOQUES_EN_COLA + 1)` filas, sea cual sea el tamaño
+    de los ficheros. Los bloques deben consumirse antes de pedir el siguiente
+    fichero; los que no se consumen se descartan.
+    """
+    if workers <= 1:
+        for p in paths:
+            prep = preparar_fichero(p, db_path, force)
+            bloques = iter(()) if prep["error"] or prep["completo"] else leer_bloques(p, chunksize, prep["desde"])
+            yield p, prep, bloques
+        return
+
+    en_vuelo: deque = deque()
+    it = iter(paths)
+
+    def lanzar(path: str) -> None:
+        cola = multiprocessing.Queue(maxsize=BLOQUES_EN_COLA)
+        proc = multiprocessing.Process(
+            target=_producir, args=(path, chunksize, db_path, force, cola), name=f"validar-{os.path.basename(path)}"
+        )
+        proc.daemon = True
+        proc.start()
+        en_vuelo.append((path, proc, cola))
+
+    for p in itertools.islice(it, workers):
+        lanzar(p)
     try:
-        if inserted_rows:
-            notas = [r["nota_final"] for r in inserted_rows]
-            summary = {
-                "inserted_count": inserted,
-                "skipped_count": skipped,
-                "nota_avg": round(float(sum(notas) / len(notas)), 2),
-                "nota_min": min(notas),
-                "nota_max": max(notas),
-            }
-        else:
-            summary = {"inserted_count": 0, "skipped_count": skipped, "nota_avg": "", "nota_min": "", "nota_max": ""}
+        while en_vuelo:
+            p, proc, cola = en_vuelo.popleft()
+            siguiente = next(it, None)
+            if siguiente is not None:
+                lanzar(siguiente)
+            try:
+                _, prep = _recibir(cola, proc)
+                yield p, prep, _bloques_recibidos(cola, proc)
+            finally:
+                # Libera al productor si el escritor no consumió todos sus bloques
+                if proc.is_alive():
+                    proc.terminate()
+                proc.join()
+                cola.close()
+    finally:
+        for _, proc, _ in en_vuelo:
+            proc.terminate()
+            proc.join()
+
+
+def main_multi(
+    patron: str,
+    db_path: str | None = None,
+    chunksize: int = 10000,
+    on_conflict: str = "skip",
+    workers: int | None = None,
+    force: bool = False,
+) -> List[Dict[str, Any]]:
+    """Carga muchos CSV (directorio o glob): procesos para parsear/validar, un único escritor.
+
+    SQLite admite un solo escritor, así que los procesos productores sólo leen
+    y validan; este proceso recibe los bloques validados de uno en uno y los
+    escribe (ver `_preparados` y `cargar_bloques`). Cada fichero genera su propio informe y resumen en la
+    carpeta `informes/` junto al CSV. Los ficheros ya cargados se omiten y los
+    interrumpidos se reanudan (ver `main_streaming`).
+
+    Returns:
+        Un resumen por fichero (con `file` y, si falló, `error`).
+    """
+    paths = expandir_entradas(patron)
+    if not paths:
+        print(f"No hay ficheros CSV en: {patron}")
+        sys.exit(1)
+    workers = workers or os.cpu_count() or 1
+    db_path = str(db_path or DB_DEFAULT)
+    print(f"Cargando {len(paths)} ficheros con {min(workers, len(paths))} procesos -> {db_path}")
 
-        pd.DataFrame(list(summary.items()), columns=["metric", "value"]).to_csv(summary_path, index=False, encoding="utf-8")
-        print(f"Resumen agregado creado: {summary_path}")
-    except Exception as e:
-        print(f"No se pudo escribir el resumen agregado: {e}")
+    init_db(db_path)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    resultados: List[Dict[str, Any]] = []
+    t0 = time.perf_counter()
+    leidas = insertadas = 0
+    with get_conn(db_path) as conn:
+        for path, prep, bloques in _preparados(paths, chunksize, min(workers, len(paths)), db_path, force):
+            if prep["error"]:
+                print(f"Error en {path}: {prep['error']}")
+                resultados.append({"file": path, "error": prep["error"]})
+                continue
+            # Se vuelve a mirar aquí: otro fichero idéntico puede haberse completado mientras tanto
+            if prep["completo"] or (not force and leer_checkpoint(conn, prep["sha256"])[1]):
+                print(f"{path} ya se cargó completo; se omite")
+                resultados.append({"file": path, "ya_cargado": True})
+                continue
+            if prep["desde"]:
+                print(f"Reanudando {path} tras {prep['desde']} filas ya confirmadas")
+            report_dir = os.path.join(os.path.dirname(path) or ".", "informes")
+            os.makedirs(report_dir, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            report_path = os.path.join(report_dir, f"insert_report_{stem}_{ts}.csv")
+            tf = time.perf_counter()
+            try:
+                carga = {"sha256": prep["sha256"], "archivo": os.path.abspath(path), "desde": prep["desde"]}
+                c = cargar_bloques(conn, bloques, report_path, on_conflict, etiqueta=f"{stem}: ", carga=carga)
+            except Exception as e:
+                print(f"Error cargando {path}: {e}")
+                resultados.append({"file": path, "error": str(e)})
+                continue
+            summary = escribir_resumen(c, time.perf_counter() - tf, report_path[:-4] + "_summary.csv")
+            resultados.append({"file": path, **summary})
+            leidas += c["leidas"]
+            insertadas += c["inserted"]
+
+    seconds = time.perf_counter() - t0
+    fallidos = sum(1 for r in resultados if "error" in r)
+    omitidos = sum(1 for r in resultados if r.get("ya_cargado"))
+    print(
+        f"Cargadas {insertadas} filas de {len(paths) - fallidos - omitidos}/{len(paths)} ficheros "
+        f"({omitidos} ya cargados) en {seconds:.2f}s ({leidas / seconds if seconds else 0:.0f} filas/s)"
+    )
+    return resultados
 
-    print("Verifica en la app Streamlit o usando: sqlite3 rubrica.db 'select count(*) from evaluaciones;'")
+
+def main(csv_path: str, db_path: str | None = None) -> None:
+    """Punto de entrada de un solo fichero (compatibilidad): ver `main_streaming`."""
+    main_streaming(csv_path, db_path)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Cargar CSV de evaluaciones a rubrica.db")
-    parser.add_argument("--csv", default="data/demo_evaluaciones_15.csv", help="Ruta al CSV de entrada")
+    parser.add_argument(
+        "--csv", default="data/demo_evaluaciones_15.csv",
+        help="Ruta al CSV de entrada, o un directorio / patrón glob para cargar varios",
+    )
+    parser.add_argument("--db", default=str(DB_DEFAULT), help="Ruta a la BD de destino (por defecto, la de la app)")
+    parser.add_argument("--stream", action="store_true", help="Sin efecto: la carga es siempre por bloques (compatibilidad)")
+    parser.add_argument("--chunksize", type=int, default=10000, help="Filas por bloque (una transacción por bloque)")
+    parser.add_argument(
+        "--on-conflict", choices=["skip", "update"], default="skip",
+        help="Conservar (skip) o sobrescribir (update) las evaluaciones ya existentes",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para validar varios CSV (por defecto, nº de CPUs)")
+    parser.add_argument("--force", action="store_true", help="Ignorar los checkpoints y volver a cargar desde el principio")
+    parser.add_argument(
+        "--metrics-file", default=None,
+        help="Fichero donde escribir al terminar las métricas de la carga (formato de texto de Prometheus)",
+    )
     args = parser.parse_args()
-    main(args.csv)
+    if args.metrics_file:
+        metricas.activar()
+    else:
+        metricas.iniciar_desde_entorno()
+    try:
+        if es_multiple(args.csv):
+            resultados = main_multi(args.csv, args.db, max(args.chunksize, 1), args.on_conflict, args.workers, args.force)
+            sys.exit(1 if any("error" in r for r in resultados) else 0)
+        main_streaming(args.csv, args.db, max(args.chunksize, 1), args.on_conflict, args.force)
+    finally:
+        if args.metrics_file:
+            metricas.escribir(args.metrics_file)
+            print(f"Métricas escritas en {args.metrics_file}")
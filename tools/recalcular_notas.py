@@ -0,0 +1,93 @@
+"""
+Recalcula `nota_final` de las evaluaciones guardadas de una plantilla.
+
+Úsalo cuando cambien los `pesos` de una plantilla en `califica_rubrica/utils.py`
+(TEMPLATES). Con `--dry-run` no escribe nada y muestra cómo cambiarían las
+notas; combinado con `--pesos` permite simular unos pesos propuestos.
+
+`--pesos` sin `--dry-run` se rechaza: la app califica con los pesos de
+TEMPLATES y las notas guardadas quedarían inconsistentes. Para escribirlos de
+todos modos (p.ej. una plantilla que ya no está en TEMPLATES) hay que añadir
+`--forzar-pesos`, y deben sumar 100.
+
+Uso:
+  python tools/recalcular_notas.py --plantilla Civil --dry-run
+  python tools/recalcular_notas.py --plantilla Civil --dry-run --pesos estructura=20,programacion=10,teoria=20,ia=5,reflexion=15,presentacion=30
+  python tools/recalcular_notas.py --plantilla Civil --db califica_rubrica/rubrica.db
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict
+
+# Reutilizar db.py/utils.py de la app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "califica_rubrica"))
+
+from db import DB_DEFAULT, DBError, init_db, recalcular_notas  # noqa: E402
+
+
+def parse_pesos(texto: str) -> Dict[str, int]:
+    """Convierte 'estructura=20,teoria=30,...' en un dict de pesos."""
+    pesos: Dict[str, int] = {}
+    for parte in texto.split(","):
+        if not parte.strip():
+            continue
+        clave, _, valor = parte.partition("=")
+        try:
+            pesos[clave.strip()] = int(valor)
+        except ValueError:
+            raise ValueError(f"Peso inválido: {parte!r} (esperado criterio=entero)")
+    return pesos
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Recalcular nota_final de una plantilla")
+    parser.add_argument("--plantilla", required=True, help="Plantilla a recalcular (columna `plantilla`)")
+    parser.add_argument("--pesos", default=None, help="Pesos alternativos: criterio=peso,... (por defecto los de TEMPLATES)")
+    parser.add_argument("--dry-run", action="store_true", help="No escribir; sólo mostrar la distribución de cambios")
+    parser.add_argument(
+        "--forzar-pesos", action="store_true",
+        help="Escribir con --pesos aunque no sean los de TEMPLATES (las notas quedarán distintas de las de la app)",
+    )
+    parser.add_argument("--db", default=str(DB_DEFAULT), help="Ruta a la BD")
+    parser.add_argument("--chunksize", type=int, default=5000, help="Filas por bloque/transacción")
+    args = parser.parse_args(argv)
+
+    try:
+        pesos = parse_pesos(args.pesos) if args.pesos else None
+    except ValueError as e:
+        print(e)
+        return 1
+    if pesos is not None and not args.dry_run and not args.forzar_pesos:
+        print("--pesos sólo simula: añade --dry-run (o --forzar-pesos para escribirlos)")
+        return 1
+    if pesos is not None and sum(pesos.values()) != 100:
+        if not args.dry_run:
+            print(f"Error: los pesos suman {sum(pesos.values())}, no 100")
+            return 1
+        print(f"Aviso: los pesos suman {sum(pesos.values())}, no 100")
+
+    try:
+        init_db(args.db)
+        t0 = time.perf_counter()
+        res = recalcular_notas(
+            args.plantilla, pesos=pesos, path=args.db, dry_run=args.dry_run, chunk_size=args.chunksize,
+            forzar_pesos=args.forzar_pesos,
+        )
+        secs = time.perf_counter() - t0
+    except DBError as e:
+        print(f"Error: {e}")
+        return 1
+
+    modo = "Simulación (sin cambios)" if args.dry_run else "Recalculadas"
+    print(f"{modo}: plantilla={res['plantilla']} filas={res['filas']} cambiadas={res['cambiadas']} errores={res['errores']} en {secs:.2f}s")
+    print(json.dumps(res["delta"], ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())